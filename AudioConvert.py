@@ -0,0 +1,173 @@
+import math
+import numpy as np
+
+RESAMPLE_HALF_TAPS = 16
+RESAMPLE_KAISER_BETA = 8.0
+
+def pcm_to_float(raw, sample_width):
+    """Convert little-endian PCM bytes of any common width to float32 in [-1, 1)."""
+    if sample_width == 1:
+        data = np.frombuffer(raw, dtype=np.uint8).astype(np.float32)
+        data -= 128.0
+        data *= 1.0 / 128.0
+        return data
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype='<i2').astype(np.float32) * (1.0 / 32768.0)
+    if sample_width == 3:
+        triplets = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        data = triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)
+        data = (data << 8) >> 8  # sign-extend from 24 bits
+        return data.astype(np.float32) * (1.0 / 8388608.0)
+    if sample_width == 4:
+        return np.frombuffer(raw, dtype='<i4').astype(np.float32) * (1.0 / 2147483648.0)
+    raise ValueError(f"Unsupported sample width: {sample_width} bytes")
+
+def int_to_float(samples):
+    """Convert an integer sample array (any shape) to float32 in [-1, 1)."""
+    info = np.iinfo(samples.dtype)
+    data = samples.astype(np.float32)
+    if info.min == 0:
+        data -= (info.max + 1) / 2
+        data *= 2.0 / (info.max + 1)
+    else:
+        data *= 1.0 / -info.min
+    return data
+
+def downmix(samples, channels):
+    """Average interleaved (or frames x channels) samples down to one channel."""
+    if channels == 1:
+        return samples.reshape(-1)
+    return samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+
+def design_lowpass(up, down, half_taps=RESAMPLE_HALF_TAPS, beta=RESAMPLE_KAISER_BETA):
+    """Kaiser-windowed sinc anti-alias filter for an up/down polyphase resampler."""
+    factor = max(up, down)
+    length = 2 * half_taps * factor + 1
+    n = np.arange(length, dtype=np.float64) - (length - 1) / 2
+    taps = np.sinc(n / factor) * np.kaiser(length, beta)
+    taps *= up / taps.sum()  # zero-stuffing by `up` loses that much gain
+    return taps
+
+class StreamResampler:
+    """Polyphase FIR resampler that can be fed a mono float signal block by block.
+
+    Keeps just enough input history between calls that the concatenated output
+    is identical to resampling the whole signal at once.
+    """
+
+    def __init__(self, src_rate, dst_rate):
+        g = math.gcd(int(src_rate), int(dst_rate))
+        self.up, self.down = int(dst_rate) // g, int(src_rate) // g
+        self.passthrough = self.up == self.down
+
+        taps = design_lowpass(self.up, self.down)
+        self.delay = (len(taps) - 1) // 2
+        self.taps_per_phase = -(-len(taps) // self.up)
+        # phases[p, k] is the filter tap applied to input sample (base - k) for phase p
+        phases = np.zeros(self.taps_per_phase * self.up, dtype=np.float32)
+        phases[:len(taps)] = taps
+        self.phases = phases.reshape(self.taps_per_phase, self.up).T
+
+        # buffer[0] holds absolute input sample buffer_start; leading zeros stand in for t < 0
+        self.buffer = np.zeros(self.taps_per_phase, dtype=np.float32)
+        self.buffer_start = -self.taps_per_phase
+        self.total_in = 0
+        self.next_out = 0
+
+    def process(self, block, final=False):
+        if self.passthrough:
+            return block.astype(np.float32, copy=False)
+
+        self.total_in += len(block)
+        parts = [self.buffer, block.astype(np.float32, copy=False)]
+        if final:
+            parts.append(np.zeros(self.taps_per_phase + self.delay // self.up + 1, dtype=np.float32))
+        self.buffer = np.concatenate(parts)
+        buffer_end = self.buffer_start + len(self.buffer)
+
+        # Output j needs input up to (j * down + delay) // up
+        out_end = -(-(buffer_end * self.up - self.delay) // self.down)
+        if final:
+            out_end = min(out_end, -(-self.total_in * self.up // self.down))
+        if out_end <= self.next_out:
+            return np.zeros(0, dtype=np.float32)
+
+        t = np.arange(self.next_out, out_end, dtype=np.int64) * self.down + self.delay
+        phase = t % self.up
+        index = t // self.up - self.buffer_start
+        out = np.zeros(len(t), dtype=np.float32)
+        for k in range(self.taps_per_phase):
+            out += self.phases[phase, k] * self.buffer[index - k]
+        self.next_out = out_end
+
+        keep_from = (self.next_out * self.down + self.delay) // self.up - self.taps_per_phase
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return out
+
+def resample(samples, src_rate, dst_rate):
+    """Polyphase FIR resample of a mono float signal from src_rate to dst_rate."""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    return StreamResampler(src_rate, dst_rate).process(samples, final=True)
+
+def float_to_int16(samples):
+    scaled = np.multiply(samples, 32768.0, dtype=np.float32)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype(np.int16)
+
+class FrameResampler:
+    """Resamples blocks of any channel layout into interleaved out_channels samples.
+
+    Sources with the output's channel count are resampled channel by channel;
+    anything else is averaged down to mono first and copied to every output
+    channel.
+    """
+
+    def __init__(self, src_rate, dst_rate, channels, out_channels=1):
+        self.channels = channels
+        self.out_channels = out_channels
+        self.per_channel = channels == out_channels and channels > 1
+        count = channels if self.per_channel else 1
+        self.resamplers = [StreamResampler(src_rate, dst_rate) for _ in range(count)]
+
+    def process(self, samples, final=False):
+        if not self.per_channel:
+            out = self.resamplers[0].process(downmix(samples, self.channels), final=final)
+            return np.repeat(out, self.out_channels) if self.out_channels > 1 else out
+        frames = samples.reshape(-1, self.channels)
+        parts = [resampler.process(frames[:, c], final=final) for c, resampler in enumerate(self.resamplers)]
+        return np.stack(parts, axis=1).reshape(-1)
+
+def normalize(samples, channels, src_rate, dst_rate, out_channels=1):
+    """Float samples in any layout -> interleaved int16 at dst_rate, ready for the mixer."""
+    return float_to_int16(FrameResampler(src_rate, dst_rate, channels, out_channels).process(samples, final=True))
+
+def remix_into(src, src_channels, dst, dst_channels, scale=1.0):
+    """Convert one interleaved block to another channel count and scale, without allocating.
+
+    src may be any numeric dtype; dst must be a float array. Extra source
+    channels are averaged down, and a mono source is copied to every output
+    channel.
+    """
+    # Cast first and scale in place: a mixed-type multiply would allocate cast buffers
+    if src_channels == dst_channels:
+        np.copyto(dst, src, casting='unsafe')
+        if scale != 1.0:
+            dst *= scale
+        return dst
+    first = dst[0::dst_channels]
+    if src_channels == 1:
+        np.copyto(first, src, casting='unsafe')
+        if scale != 1.0:
+            first *= scale
+    else:
+        frames = src.reshape(-1, src_channels)
+        np.copyto(first, frames[:, 0], casting='unsafe')
+        for c in range(1, src_channels):
+            np.add(first, frames[:, c], out=first, casting='unsafe')
+        first *= scale / src_channels
+    for c in range(1, dst_channels):
+        np.copyto(dst[c::dst_channels], first)
+    return dst
@@ -0,0 +1,182 @@
+import time
+import pyaudio
+import numpy as np
+from Mixer import Mixer
+from OutputRoute import OutputRoute
+from Telemetry import Telemetry
+from Recorder import RecordTap
+from AudioConvert import remix_into
+from EngineFormat import EngineFormat, negotiate, negotiate_device
+
+class AudioEngine:
+    """Mic capture, the mixer and the output routes, independent of any UI.
+
+    `audio` is a PyAudio instance, or anything with the same open(),
+    get_device_info_by_index() and is_format_supported() methods; `devices`
+    (a DeviceRegistry, by default `audio` itself) answers the format queries
+    so they don't go to PortAudio on every reopen. The mic
+    block is converted to the engine format (float32, fmt.channels) as it
+    arrives, and each route converts back to its device's format, so
+    everything in between works on one layout.
+    """
+
+    def __init__(self, audio, mixer=None, telemetry=None, fmt=None, devices=None):
+        self.audio = audio
+        self.devices = devices or audio
+        self.format = fmt or EngineFormat()
+        self.mixer = mixer or Mixer(frames=self.format.samples_per_buffer)
+        self.telemetry = telemetry or Telemetry(self.format.rate)
+        self.mixer.telemetry = self.telemetry
+        self.input_stream = None
+        self.input_format = None
+        self.input_device_index = None
+        self.routes = []
+        self.latency = None
+        self.record_tap = None
+        self._input = np.zeros(self.format.samples_per_buffer, dtype=np.float32)
+
+    def open(self, mic_device_index, outputs, fmt=None, latency=None):
+        """Open the mic and one OutputRoute per (name, device_index, latency_ms) in outputs.
+
+        The requested format (fmt, or the current one) is negotiated against
+        the devices first; self.format holds what was actually opened. With a
+        LatencyController as latency, each route's latency_ms is only where
+        it starts.
+        """
+        self.close()
+        self.latency = latency
+        self.format, self.input_format, output_formats = negotiate(
+            self.devices, fmt or self.format, mic_device_index, [device_index for _, device_index, _ in outputs])
+        fmt = self.format
+        self.mixer.set_block(fmt.samples_per_buffer, fmt.rate, fmt.channels)
+        self.telemetry.rate = fmt.rate
+        self._input = np.zeros(fmt.samples_per_buffer, dtype=np.float32)
+
+        for (name, device_index, latency_ms), device_format in zip(outputs, output_formats):
+            route = OutputRoute(name, device_index, latency_ms, fmt.rate, fmt.frames_per_buffer, fmt.channels,
+                                device_format, self.max_latency_ms)
+            route.open(self.audio)
+            self.routes.append(route)
+
+        # Before the mic stream starts, since its first callback may come before open() returns
+        if latency:
+            latency.start(fmt.rate, self.routes, self.telemetry, self.mixer.position)
+        self._open_input(mic_device_index, self.input_format)
+
+    @property
+    def max_latency_ms(self):
+        return self.latency.max_ms if self.latency else None
+
+    def _open_input(self, device_index, input_format):
+        self.input_stream = self.audio.open(
+            format=input_format.pa_format,
+            channels=input_format.channels,
+            rate=self.format.rate,
+            input=True,
+            input_device_index=device_index,
+            stream_callback=self.process_input,
+            frames_per_buffer=self.format.frames_per_buffer
+        )
+        self.input_format = input_format
+        self.input_device_index = device_index
+        self.input_stream.start_stream()
+
+    def _close_input(self):
+        if self.input_stream:
+            try:
+                self.input_stream.stop_stream()
+                self.input_stream.close()
+            except (IOError, OSError):
+                pass  # the device is already gone
+            self.input_stream = None
+
+    def close(self):
+        self._close_input()
+        for route in self.routes:
+            route.close()
+        self.routes = []
+
+    def route(self, name):
+        return next((route for route in self.routes if route.name == name), None)
+
+    def reopen_route(self, name, device_index):
+        """Move one output route to another device at the running format.
+
+        Only that route's stream is closed and reopened; the mic stream and
+        the other routes keep running. Raises ValueError if the device can't
+        take the engine rate, or whatever PortAudio raises if it won't open.
+        """
+        old = self.route(name)
+        device_format = negotiate_device(self.devices, device_index, self.format, False)
+        if device_format is None:
+            raise ValueError(f"Device {device_index} does not support {self.format}")
+        latency_ms = old.latency_ms if old else 0
+        route = OutputRoute(name, device_index, latency_ms, self.format.rate, self.format.frames_per_buffer,
+                            self.format.channels, device_format, self.max_latency_ms)
+        if old:
+            old.close()
+        route.open(self.audio)
+        # A single item assignment, so the mic callback sees either the old route or the new one
+        if old in self.routes:
+            self.routes[self.routes.index(old)] = route
+        else:
+            self.routes.append(route)
+        return route
+
+    def reopen_input(self, device_index):
+        """Move mic capture to another device at the running format.
+
+        The mic callback drives the mix, so the outputs play silence from
+        their rings until the new stream starts; their streams stay open.
+        """
+        input_format = negotiate_device(self.devices, device_index, self.format, True)
+        if input_format is None:
+            raise ValueError(f"Device {device_index} does not support {self.format}")
+        self._close_input()
+        self._open_input(device_index, input_format)
+
+    def attach_recorder(self, ring):
+        """Copy every mixed block into ring (float32, the engine layout) until detach_recorder()."""
+        self.record_tap = RecordTap(ring)
+
+    def detach_recorder(self):
+        self.record_tap = None
+
+    @property
+    def record_dropped(self):
+        """Samples the recording ring had no room for."""
+        return self.record_tap.dropped if self.record_tap else 0
+
+    @staticmethod
+    def block_time(started, time_info):
+        """perf_counter() time the mic block was captured, from PortAudio's stream times, or None.
+
+        The callback runs some time after the block was captured, and how long
+        varies from one callback to the next; going by the capture time keeps
+        the mixer's timeline from jittering with it.
+        """
+        adc_time = time_info.get('input_buffer_adc_time', 0) if time_info else 0
+        current_time = time_info.get('current_time', 0) if time_info else 0
+        if adc_time <= 0 or current_time < adc_time:
+            return None  # the host API doesn't report stream times
+        return started - (current_time - adc_time)
+
+    def process_input(self, in_data, frame_count, time_info, status):
+        """Mic stream callback: mix the active voices over the mic and fan out to every route."""
+        started = time.perf_counter()
+        samples = frame_count * self.format.channels
+        if samples > len(self._input):
+            self._input = np.zeros(samples, dtype=np.float32)
+        device = self.input_format
+        in_block = remix_into(np.frombuffer(in_data, dtype=device.dtype), device.channels,
+                              self._input[:samples], self.format.channels, 1.0 / device.full_scale)
+        mixed_audio = self.mixer.mix(in_block, self.block_time(started, time_info))
+        for route in self.routes:
+            route.push(mixed_audio)
+        tap = self.record_tap
+        if tap is not None:
+            tap.push(mixed_audio)
+        if self.latency:
+            self.latency.update(self.mixer.position, self.routes, self.telemetry)
+        self.telemetry.record_callback(started, frame_count, status, self.mixer.active_count)
+        return (None, pyaudio.paContinue)
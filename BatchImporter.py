@@ -0,0 +1,101 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from PcmCache import remove_file
+from SoundImport import prepare_sound
+from util import IMPORT_WORKERS
+
+class BatchImporter(QObject):
+    """Prepares a batch of sound files on a process pool, one worker per core.
+
+    Each worker decodes a file to the engine format, measures its loudness and
+    writes the samples into the PCM cache directory. Nothing is added to the
+    library here: finished(results, failed, cancelled) hands back a
+    (source, loudness, npy file) tuple per prepared sound so the caller can
+    commit the whole batch at once. After cancel(), the prepared files are
+    deleted and finished() reports cancelled with no results.
+    """
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(list, int, bool)
+
+    def __init__(self, max_workers=IMPORT_WORKERS, parent=None):
+        super().__init__(parent)
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.results = []
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+
+    @property
+    def running(self):
+        return self.executor is not None
+
+    def start(self, sources, fmt, cache_dir):
+        self.cancelled = False
+        self.results = []
+        self.total = len(sources)
+        self.done = 0
+        self.failed = 0
+        if not sources:
+            self.finished.emit([], 0, False)
+            return
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # spawn, so workers never inherit this process's Qt and PortAudio state
+        self.executor = ProcessPoolExecutor(max_workers=min(self.max_workers, len(sources)),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        for index, source in enumerate(sources):
+            npy_file = os.path.join(cache_dir, f"import.{os.getpid()}.{index}.npy")
+            future = self.executor.submit(prepare_sound, source, fmt.rate, fmt.channels, npy_file)
+            future.add_done_callback(lambda future, source=source, npy_file=npy_file:
+                                     self._on_done(future, source, npy_file))
+
+    def cancel(self):
+        with self.lock:
+            if not self.executor or self.cancelled:
+                return
+            self.cancelled = True
+            executor = self.executor
+        # Queued files are dropped; the ones being worked on finish and are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_done(self, future, source, npy_file):
+        """Runs on the pool's management thread as each file completes or is cancelled."""
+        result = None
+        if not future.cancelled():
+            try:
+                result = (source, future.result(), npy_file)
+            except Exception as e:
+                logging.warning(f"Failed to import {source}: {type(e).__name__}: {e}")
+        with self.lock:
+            self.done += 1
+            if result is None and not self.cancelled:
+                self.failed += 1
+            if result is not None:
+                if self.cancelled:
+                    remove_file(npy_file)
+                else:
+                    self.results.append(result)
+            done, total = self.done, self.total
+        self.progress.emit(done, total)
+        if done == total:
+            self._finish()
+
+    def _finish(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            results, self.results = self.results, []
+            cancelled = self.cancelled
+        if executor:
+            executor.shutdown(wait=False)
+        if cancelled:
+            for _, _, npy_file in results:
+                remove_file(npy_file)
+            results = []
+        self.finished.emit(results, self.failed, cancelled)
@@ -0,0 +1,275 @@
+import os
+import math
+import time
+import json
+import socket
+import logging
+import selectors
+import threading
+from util import CONTROL_ADDRESS
+
+MAX_LINE_BYTES = 64 * 1024
+MAX_GAIN = 4.0
+
+def parse_address(address):
+    """(family, address) for "host:port" (TCP) or "unix:/path/to/socket"."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+class ControlServer:
+    """Local control socket for triggering sounds from scripts and macro pads.
+
+    Speaks newline-delimited JSON. Each line is one command object, or a list
+    of them to run as a batch; the reply is one line holding the result
+    object, or the list of results in the same order. Commands:
+
+        {"cmd": "ping"}
+        {"cmd": "trigger", "sound": "airhorn.mp3", "gain": 1.0, "delay_ms": 0}
+        {"cmd": "sequence", "name": "intro", "delay_ms": 0}
+        {"cmd": "stop", "sound": "airhorn.mp3"}     no sound stops everything
+        {"cmd": "gain", "sound": "airhorn.mp3", "gain": 0.5}   no sound sets the master gain
+        {"cmd": "record", "on": true}     false stops; replies with the files written
+        {"cmd": "state"}
+        {"cmd": "sounds"}
+
+    A sound is named by its file name or its title. An "id" field is echoed
+    back. Gains run from 0 to 4. Results have "ok": true, or "ok": false
+    and an "error". One thread serves every connection, and commands run on
+    it directly: they only queue mixer commands, except that triggering a
+    sound that isn't cached decodes it first.
+    """
+
+    def __init__(self, board, address=CONTROL_ADDRESS):
+        self.board = board
+        self.address = address
+        self.listener = None
+        self.selector = None
+        self.thread = None
+        self._wake_r, self._wake_w = None, None
+        self.commands = {
+            'ping': self._ping,
+            'trigger': self._trigger,
+            'sequence': self._sequence,
+            'stop': self._stop,
+            'gain': self._gain,
+            'record': self._record,
+            'state': self._state,
+            'sounds': self._sounds,
+        }
+
+    def start(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)  # left behind by an earlier run
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        if family == socket.AF_INET:
+            self.address = f"{address[0]}:{self.listener.getsockname()[1]}"
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self.thread = threading.Thread(target=self._run, name='control', daemon=True)
+        self.thread.start()
+        logging.info(f"Control server listening on {self.address}")
+
+    def stop(self):
+        if not self.thread:
+            return
+        self._wake_w.send(b'\0')
+        self.thread.join(timeout=1)
+        self.thread = None
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+        self._wake_w.close()
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            try:
+                os.remove(address)
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            for key, _ in self.selector.select():
+                sock = key.fileobj
+                if sock is self._wake_r:
+                    return
+                if sock is self.listener:
+                    self._accept()
+                else:
+                    self._read(sock, key.data)
+
+    def _accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except OSError:
+            return
+        if conn.family == socket.AF_INET:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Replies are small, so a blocking send only waits if the client stops reading
+        conn.setblocking(True)
+        conn.settimeout(1.0)
+        self.selector.register(conn, selectors.EVENT_READ, bytearray())
+
+    def _close(self, sock):
+        self.selector.unregister(sock)
+        sock.close()
+
+    def _read(self, sock, buffer):
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self._close(sock)
+            return
+        buffer += data
+        replies = []
+        while True:
+            end = buffer.find(b'\n')
+            if end < 0:
+                break
+            line = bytes(buffer[:end])
+            del buffer[:end + 1]
+            if line.strip():
+                replies.append(self.handle_line(line))
+        if len(buffer) > MAX_LINE_BYTES:
+            replies.append(self._encode({'ok': False, 'error': 'line too long'}))
+            buffer.clear()
+        if replies:
+            try:
+                sock.sendall(b''.join(replies))
+            except OSError:
+                self._close(sock)
+
+    def handle_line(self, line):
+        """Reply (a JSON line, as bytes) to one request line."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return self._encode({'ok': False, 'error': f'invalid JSON: {e}'})
+        if isinstance(request, list):
+            return self._encode([self.handle(command) for command in request])
+        return self._encode(self.handle(request))
+
+    def handle(self, command):
+        """Run one command object and return its result object."""
+        if not isinstance(command, dict):
+            return {'ok': False, 'error': 'a command must be an object'}
+        handler = self.commands.get(command.get('cmd'))
+        try:
+            if handler is None:
+                raise ValueError(f"unknown command {command.get('cmd')!r}")
+            result = handler(command)
+            result['ok'] = True
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            result = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            logging.error(f"Control command {command} failed: {e}")
+            result = {'ok': False, 'error': str(e)}
+        if 'id' in command:
+            result['id'] = command['id']
+        return result
+
+    @staticmethod
+    def _encode(reply):
+        return json.dumps(reply, separators=(',', ':')).encode('utf-8') + b'\n'
+
+    def _sound(self, command, required=True):
+        name = command.get('sound')
+        if name is None and not required:
+            return None
+        if not isinstance(name, str):
+            raise ValueError("'sound' must be a sound name")
+        sound = self.board.find_sound(name)
+        if sound is None:
+            raise ValueError(f"no sound named {name!r}")
+        return sound
+
+    @staticmethod
+    def _gain_value(command, default=None):
+        """command's "gain" as a float from 0 to MAX_GAIN; a NaN gain would turn every output sample into NaN."""
+        gain = float(command['gain'] if default is None else command.get('gain', default))
+        if not 0.0 <= gain <= MAX_GAIN:
+            raise ValueError(f"'gain' must be between 0 and {MAX_GAIN:g}")
+        return gain
+
+    @staticmethod
+    def _delay_value(command):
+        """command's "delay_ms" in seconds; it must be a finite number, zero or more."""
+        delay_ms = float(command.get('delay_ms', 0))
+        if not (math.isfinite(delay_ms) and delay_ms >= 0):
+            raise ValueError("'delay_ms' must be a finite number of milliseconds, zero or more")
+        return delay_ms / 1000
+
+    def _ping(self, command):
+        return {}
+
+    def _trigger(self, command):
+        accepted_at = time.perf_counter()
+        sound = self._sound(command)
+        return {'sound': sound, 'played': self.board.trigger(sound, self._gain_value(command, 1.0),
+                                                             self._delay_value(command), accepted_at)}
+
+    def _sequence(self, command):
+        name = command.get('name')
+        if name not in self.board.sequences:
+            raise ValueError(f"no sequence named {name!r}")
+        self.board.play_sequence(name, self._delay_value(command))
+        return {'name': name}
+
+    def _stop(self, command):
+        sound = self._sound(command, required=False)
+        self.board.stop(sound)
+        return {'sound': sound}
+
+    def _gain(self, command):
+        sound = self._sound(command, required=False)
+        self.board.set_gain(sound, self._gain_value(command))
+        return {'sound': sound}
+
+    def _record(self, command):
+        if command.get('on', True):
+            return {'recording': True, 'path': self.board.start_recording()}
+        return {'recording': False, 'paths': self.board.stop_recording() or []}
+
+    def _state(self, command):
+        return self.board.state()
+
+    def _sounds(self, command):
+        return {'sounds': {sound: info.get('title', sound) for sound, info in list(self.board.sounds.items())},
+                'sequences': sorted(self.board.sequences)}
+
+class ControlClient:
+    """Blocking client for ControlServer, for scripts and the benchmark."""
+
+    def __init__(self, address=CONTROL_ADDRESS, timeout=5.0):
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def request(self, command):
+        """Send one command object (or a list of them) and return the reply."""
+        self.sock.sendall(json.dumps(command, separators=(',', ':')).encode('utf-8') + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("control server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
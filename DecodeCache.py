@@ -0,0 +1,103 @@
+import os
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+from util import DECODE_CACHE_MAX_BYTES
+
+class DecodeCache:
+    """LRU cache of decoded sound buffers, bounded by a byte budget.
+
+    Buffers hold interleaved int16 frames at the engine's rate, with as many
+    channels as the engine runs; the mixer scales them to float32 as it
+    reads them.
+
+    Entries are keyed by (absolute path, mtime, size) so an edited file is
+    decoded again instead of serving stale audio, plus a variant tag naming
+    the decoded format. Anything with an nbytes attribute can be cached; the
+    engine process mode caches SharedSounds.
+    """
+
+    def __init__(self, max_bytes=DECODE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path, decoder, variant=None):
+        key = self.make_key(path) + (variant,)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # Decode outside the lock so a slow file doesn't stall other lookups
+        data = decoder(path)
+        if isinstance(data, np.ndarray):
+            data.setflags(write=False)
+        self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        size = data.nbytes
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key).nbytes
+            if size > self.max_bytes:
+                logging.debug(f"Not caching {key[0]}: {size} bytes exceeds cache budget")
+                return
+            self._entries[key] = data
+            self.current_bytes += size
+            self._evict()
+
+    def contains(self, path, variant=None):
+        try:
+            key = self.make_key(path) + (variant,)
+        except OSError:
+            return False
+        with self._lock:
+            return key in self._entries
+
+    def invalidate(self, path):
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == abs_path]:
+                self.current_bytes -= self._entries.pop(key).nbytes
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, data = self._entries.popitem(last=False)
+            self.current_bytes -= data.nbytes
+            self.evictions += 1
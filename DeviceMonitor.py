@@ -0,0 +1,116 @@
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from DeviceRegistry import probe_device_names
+from util import DEVICE_POLL_MS, DEVICE_STALL_MS, DEVICE_RESCAN_MS
+
+class DeviceMonitor(QObject):
+    """Watches the engine's streams and the system's device list.
+
+    Every poll it checks that each open stream is still active and that its
+    callback count is still moving; a stream that stops for stall_ms has
+    lost its device, and stream_failed(name) is emitted once for it ('input'
+    for the mic). Every rescan it asks a helper process for the current
+    device names, since the app's own PortAudio only ever sees the devices
+    that existed when it started, and emits devices_changed(added, removed)
+    when they differ. Nothing here blocks the GUI thread.
+    """
+
+    stream_failed = pyqtSignal(str)
+    devices_changed = pyqtSignal(list, list)
+
+    def __init__(self, engine, device_names, poll_ms=DEVICE_POLL_MS, stall_ms=DEVICE_STALL_MS,
+                 rescan_ms=DEVICE_RESCAN_MS, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.device_names = set(device_names)
+        self.stall_s = stall_ms / 1000
+        self.rescan_s = rescan_ms / 1000
+        self._heartbeats = {}
+        self._failed = set()
+        self._pool = None
+        self._probe = None
+        self._next_rescan = time.monotonic() + self.rescan_s
+        self.timer = QTimer(self)
+        self.timer.setInterval(poll_ms)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def reset(self, device_names=None):
+        """Forget failures and heartbeats, e.g. after the streams were reopened."""
+        if device_names is not None:
+            self.device_names = set(device_names)
+        self._heartbeats = {}
+        self._failed = set()
+
+    def streams(self):
+        """(name, stream, callback count) for every open stream."""
+        engine = self.engine
+        if engine.input_stream:
+            yield 'input', engine.input_stream, engine.telemetry.callbacks
+        for route in engine.routes:
+            if route.stream:
+                yield route.name, route.stream, route.callbacks
+
+    def poll(self):
+        now = time.monotonic()
+        for name, stream, count in self.streams():
+            key = (name, id(stream))
+            if key in self._failed:
+                continue
+            last = self._heartbeats.get(name)
+            if last is None or last[0] != id(stream):
+                self._heartbeats[name] = (id(stream), count, now, False)
+                stalled = False
+            elif last[1] != count:
+                self._heartbeats[name] = (id(stream), count, now, True)
+                stalled = False
+            else:
+                # Only a stream that has already been running can stall; opening may take a while
+                stalled = last[3] and now - last[2] > self.stall_s
+            try:
+                active = stream.is_active()
+            except (IOError, OSError):
+                active = False
+            if not active or stalled:
+                logging.warning(f"Audio stream '{name}' {'stalled' if active else 'stopped'}")
+                self._failed.add(key)
+                self.stream_failed.emit(name)
+
+        if self._probe and self._probe.done():
+            self._finish_probe()
+        elif not self._probe and now >= self._next_rescan:
+            self._start_probe()
+
+    def _start_probe(self):
+        if self._pool is None:
+            # spawn, so the helper never inherits this process's PortAudio state
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        self._probe = self._pool.submit(probe_device_names)
+
+    def _finish_probe(self):
+        probe, self._probe = self._probe, None
+        self._next_rescan = time.monotonic() + self.rescan_s
+        try:
+            names = set(probe.result())
+        except Exception as e:
+            logging.error(f"Device probe failed: {e}")
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            return
+        added = sorted(names - self.device_names)
+        removed = sorted(self.device_names - names)
+        self.device_names = names
+        if added or removed:
+            logging.info(f"Audio devices changed: added {added}, removed {removed}")
+            self.devices_changed.emit(added, removed)
@@ -0,0 +1,104 @@
+import logging
+
+class DeviceRegistry:
+    """The PortAudio device list, enumerated once and kept until rescan().
+
+    Lookups and format checks are answered from the cache, so callers never
+    walk every device through PortAudio again. It offers the same
+    get_device_info_by_index() and is_format_supported() methods as PyAudio,
+    so it can stand in for it when negotiating stream formats.
+    """
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.devices = []
+        self.default_input = None
+        self.default_output = None
+        self._supported = {}
+        self.rescan()
+
+    def rescan(self, audio=None):
+        """Re-read the device list; PortAudio only sees new devices after it is re-initialised."""
+        if audio is not None:
+            self.audio = audio
+        self.devices = [self.audio.get_device_info_by_index(i) for i in range(self.audio.get_device_count())]
+        self._supported = {}
+        self.default_input = self._default(self.audio.get_default_input_device_info)
+        self.default_output = self._default(self.audio.get_default_output_device_info)
+        logging.info(f"Device registry: {len(self.devices)} devices")
+
+    @staticmethod
+    def _default(getter):
+        try:
+            return getter()['index']
+        except (IOError, OSError):
+            return None
+
+    def get_device_info_by_index(self, index):
+        return self.devices[index]
+
+    def is_format_supported(self, rate, **kwargs):
+        key = (rate,) + tuple(sorted(kwargs.items()))
+        supported = self._supported.get(key)
+        if supported is None:
+            try:
+                supported = bool(self.audio.is_format_supported(rate, **kwargs))
+            except ValueError:
+                supported = False
+            self._supported[key] = supported
+        if not supported:
+            raise ValueError("Invalid sample rate or format")
+        return True
+
+    def find(self, predicate):
+        """Index of the first device whose info dict satisfies predicate, or None."""
+        for info in self.devices:
+            if predicate(info):
+                return info['index']
+        return None
+
+    def find_output(self, name):
+        return self.find(lambda info: info['name'] == name and info['maxOutputChannels'] > 0)
+
+    def find_input(self, name):
+        return self.find(lambda info: info['name'] == name and info['maxInputChannels'] > 0)
+
+    def name_of(self, index):
+        if index is None or not 0 <= index < len(self.devices):
+            return None
+        return self.devices[index]['name']
+
+    def key_of(self, index):
+        """(name, host API index) of a device, or None.
+
+        Unlike the index, the key still names the same device in another
+        PortAudio instance, or after devices were added or removed.
+        """
+        if index is None or not 0 <= index < len(self.devices):
+            return None
+        info = self.devices[index]
+        return (info['name'], info['hostApi'])
+
+    def find_key(self, key, output):
+        """Index of the output (or input) device with a key from key_of(), or None."""
+        if key is None:
+            return None
+        name, host_api = key
+        channels = 'maxOutputChannels' if output else 'maxInputChannels'
+        return self.find(lambda info: info['name'] == name and info['hostApi'] == host_api and info[channels] > 0)
+
+    def names(self):
+        return {info['name'] for info in self.devices}
+
+def probe_device_names():
+    """Device names as a freshly initialised PortAudio sees them.
+
+    Runs in a helper process: re-initialising PortAudio in the app itself
+    would close every open stream.
+    """
+    import pyaudio
+    audio = pyaudio.PyAudio()
+    try:
+        return sorted({audio.get_device_info_by_index(i)['name'] for i in range(audio.get_device_count())})
+    finally:
+        audio.terminate()
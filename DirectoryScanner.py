@@ -0,0 +1,49 @@
+import os
+import logging
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from util import SCAN_DEBOUNCE_MS, SOUND_EXTENSIONS
+
+class DirectoryScanner(QObject):
+    """Turns bursts of directory-change events into one diff of the folder.
+
+    schedule() may be called for every watcher event; the scan runs once the
+    events have been quiet for debounce_ms. Each scan compares the folder
+    against the (size, mtime) snapshot from the previous scan and emits the
+    file names that were added, removed or modified.
+    """
+    changed = pyqtSignal(list, list, list)
+
+    def __init__(self, directory, debounce_ms=SCAN_DEBOUNCE_MS, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.snapshot = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self.scan)
+
+    def schedule(self):
+        self.timer.start()
+
+    def read_directory(self):
+        entries = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in SOUND_EXTENSIONS:
+                        continue
+                    stat = entry.stat()
+                    entries[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logging.error(f"Error scanning {self.directory}: {e}")
+        return entries
+
+    def scan(self):
+        current = self.read_directory()
+        previous = self.snapshot
+        added = [name for name in current if name not in previous]
+        removed = [name for name in previous if name not in current]
+        modified = [name for name in current if name in previous and current[name] != previous[name]]
+        self.snapshot = current
+        if added or removed or modified:
+            self.changed.emit(added, removed, modified)
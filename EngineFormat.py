@@ -0,0 +1,100 @@
+import logging
+import pyaudio
+import numpy as np
+from util import CHUNK, SAMPLE_RATE, ENGINE_CHANNELS, ENGINE_SAMPLE_FORMAT, ENGINE_FALLBACK_RATES
+
+# Device sample formats: name -> (PortAudio format, numpy dtype, full-scale value)
+SAMPLE_FORMATS = {
+    'int16': (pyaudio.paInt16, np.int16, 32767.0),
+    'float32': (pyaudio.paFloat32, np.float32, 1.0),
+}
+
+class EngineFormat:
+    """Rate, channel count, device sample format and block size the engine runs at.
+
+    Internally the engine always mixes float32 in [-1, 1] with `channels`
+    interleaved channels; sample_format is only what it asks the devices for.
+    Smaller frames_per_buffer means lower latency but more callbacks per second.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, channels=ENGINE_CHANNELS, sample_format=ENGINE_SAMPLE_FORMAT,
+                 frames_per_buffer=CHUNK):
+        self.rate = int(rate)
+        self.channels = int(channels)
+        self.sample_format = sample_format if sample_format in SAMPLE_FORMATS else ENGINE_SAMPLE_FORMAT
+        self.frames_per_buffer = int(frames_per_buffer)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(rate=settings.get('engine_rate', SAMPLE_RATE),
+                   channels=settings.get('engine_channels', ENGINE_CHANNELS),
+                   sample_format=settings.get('engine_sample_format', ENGINE_SAMPLE_FORMAT),
+                   frames_per_buffer=settings.get('frames_per_buffer', CHUNK))
+
+    def with_rate(self, rate):
+        return EngineFormat(rate, self.channels, self.sample_format, self.frames_per_buffer)
+
+    @property
+    def samples_per_buffer(self):
+        return self.frames_per_buffer * self.channels
+
+    @property
+    def decode_variant(self):
+        """Tag for decoded buffers, which depend only on rate and channel count."""
+        return f"{self.rate}x{self.channels}"
+
+    def __eq__(self, other):
+        return isinstance(other, EngineFormat) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return (f"EngineFormat({self.rate} Hz, {self.channels} ch, {self.sample_format}, "
+                f"{self.frames_per_buffer} frames)")
+
+class DeviceFormat:
+    """What one device stream actually opens with at the engine rate."""
+
+    def __init__(self, channels, sample_format):
+        self.channels = channels
+        self.sample_format = sample_format
+        self.pa_format, self.dtype, self.full_scale = SAMPLE_FORMATS[sample_format]
+
+def _supports(audio, rate, device_index, channels, pa_format, is_input):
+    if is_input:
+        kwargs = {'input_device': device_index, 'input_channels': channels, 'input_format': pa_format}
+    else:
+        kwargs = {'output_device': device_index, 'output_channels': channels, 'output_format': pa_format}
+    try:
+        return audio.is_format_supported(rate, **kwargs)
+    except ValueError:
+        return False
+
+def negotiate_device(audio, device_index, fmt, is_input):
+    """Pick the closest channel count and sample format the device accepts at fmt.rate.
+
+    Tries the engine's own channel count first, then stereo, then mono, and
+    the engine's sample format before int16. Returns None if nothing works.
+    """
+    info = audio.get_device_info_by_index(device_index)
+    max_channels = info['maxInputChannels' if is_input else 'maxOutputChannels']
+    channel_options = [c for c in dict.fromkeys((fmt.channels, 2, 1)) if c <= max_channels] or [1]
+    for channels in channel_options:
+        for sample_format in dict.fromkeys((fmt.sample_format, 'int16')):
+            if _supports(audio, fmt.rate, device_index, channels, SAMPLE_FORMATS[sample_format][0], is_input):
+                return DeviceFormat(channels, sample_format)
+    return None
+
+def negotiate(audio, fmt, input_device, output_devices):
+    """Find a rate every device supports and each device's format at that rate.
+
+    Returns (format, input DeviceFormat, [output DeviceFormat, ...]), where
+    format is fmt with its rate possibly replaced by a fallback rate.
+    """
+    for rate in dict.fromkeys((fmt.rate,) + ENGINE_FALLBACK_RATES):
+        candidate = fmt.with_rate(rate)
+        input_format = negotiate_device(audio, input_device, candidate, True)
+        output_formats = [negotiate_device(audio, index, candidate, False) for index in output_devices]
+        if input_format and all(output_formats):
+            if rate != fmt.rate:
+                logging.warning(f"{fmt.rate} Hz is not supported by every device; using {rate} Hz")
+            return candidate, input_format, output_formats
+    raise ValueError(f"No common sample rate among {(fmt.rate,) + ENGINE_FALLBACK_RATES} for the selected devices")
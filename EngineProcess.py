@@ -0,0 +1,648 @@
+import time
+import signal
+import logging
+import weakref
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import pyaudio
+import numpy as np
+from RingBuffer import RingBuffer
+from AudioEngine import AudioEngine
+from Mixer import check_schedule
+from EngineFormat import EngineFormat
+from DeviceRegistry import DeviceRegistry
+from Telemetry import Telemetry
+from util import ENGINE_STATUS_MS, ENGINE_REPLY_TIMEOUT_S, ENGINE_OPEN_TIMEOUT_S
+
+# SharedRingBuffer header slots, int64 each: write_pos, read_pos, closed, cancelled
+RING_HEADER = 4
+
+class SharedSound:
+    """A decoded sound buffer, copied once into shared memory.
+
+    Only its name, shape and dtype are sent to the engine process, which maps
+    the same pages. When the last reference here goes (the decode cache
+    evicted it, say) the engine process is told to let go of it, and unlinks
+    the block once no voice is playing from it.
+    """
+
+    def __init__(self, client, data):
+        shm = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+        self.name = shm.name
+        self.shape = data.shape
+        self.dtype = data.dtype.str
+        self.nbytes = data.nbytes
+        weakref.finalize(self, client.release_shared, shm)
+
+class SharedRingBuffer(RingBuffer):
+    """RingBuffer whose samples and positions live in shared memory.
+
+    The producer and the consumer may be in different processes; the same
+    single-producer/single-consumer rules apply. Pass name (and the same
+    capacity and dtype) to attach to a ring another process created. close()
+    and cancel() are flags the other side sees.
+    """
+
+    def __init__(self, capacity, dtype=np.int16, name=None):
+        self.dtype = np.dtype(dtype)
+        header = RING_HEADER * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=header + capacity * self.dtype.itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.capacity = capacity
+        self._state = np.ndarray(RING_HEADER, dtype=np.int64, buffer=self.shm.buf)
+        self.buffer = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf, offset=header)
+
+    @property
+    def write_pos(self):
+        return int(self._state[0])
+
+    @write_pos.setter
+    def write_pos(self, value):
+        self._state[0] = value
+
+    @property
+    def read_pos(self):
+        return int(self._state[1])
+
+    @read_pos.setter
+    def read_pos(self, value):
+        self._state[1] = value
+
+    @property
+    def closed(self):
+        return bool(self._state[2])
+
+    @closed.setter
+    def closed(self, value):
+        self._state[2] = value
+
+    @property
+    def cancelled(self):
+        return bool(self._state[3])
+
+    @cancelled.setter
+    def cancelled(self, value):
+        self._state[3] = value
+
+    def close(self):
+        """Producer side: mark the ring finished and drop this process's mapping of it."""
+        super().close()
+        self._state = self.buffer = None
+        self.shm.close()
+
+class SharedStreamSource:
+    """The engine process's end of a StreamingSource decoding in the UI process."""
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def cancel(self):
+        self.ring.cancel()
+
+class EngineHost:
+    """Runs in the engine process: owns PortAudio, the AudioEngine and its mixer.
+
+    Reads commands from the pipe, replies to the ones that carry a request
+    id, and every status_ms sends a status message with each stream's
+    callback count and the number of active voices. Shared buffers are
+    mapped on first use and unlinked once released and no longer playing.
+    """
+
+    def __init__(self, conn, status_ms=ENGINE_STATUS_MS):
+        self.conn = conn
+        self.status_s = status_ms / 1000
+        self.audio = None
+        self.engine = AudioEngine(None)
+        self.mixer = self.engine.mixer
+        self.running = True
+        # Shared block name -> read-only array, kept so a sound played again isn't mapped again
+        self.sounds = {}
+        # Shared block name -> (SharedMemory, weak reference to whatever views it), and the names this
+        # process should unlink once that is gone
+        self.mapped = {}
+        self.unused = set()
+        self.commands = {
+            'open': self._open,
+            'close': self._close,
+            'reopen_route': self._reopen_route,
+            'reopen_input': self._reopen_input,
+            'play': self._play,
+            'stream': self._stream,
+            'schedule': self._schedule,
+            'stop': self.mixer.stop,
+            'gain': self.mixer.set_gain,
+            'master_gain': self._master_gain,
+            'configure': self.mixer.configure,
+            'release': self._release,
+            'record': self._record,
+            'is_playing': self.mixer.is_playing,
+            'playing': self.mixer.playing,
+            'snapshot': self._snapshot,
+            'quit': self._quit,
+        }
+
+    def run(self):
+        next_status = time.monotonic()
+        try:
+            while self.running:
+                if self.conn.poll(max(0.0, next_status - time.monotonic())):
+                    self.handle(self.conn.recv())
+                now = time.monotonic()
+                if now >= next_status:
+                    next_status = now + self.status_s
+                    self.sweep()
+                    self.conn.send(('status', self.status()))
+        except (EOFError, OSError):
+            pass  # the UI process is gone
+        finally:
+            self.shutdown()
+
+    def handle(self, message):
+        command, request_id, *args = message
+        try:
+            reply = (True, self.commands[command](*args))
+        except Exception as e:
+            if request_id is None:
+                logging.error(f"Engine command {command!r} failed: {e}")
+            # Errors the caller handles are sent back as they are; anything else may not pickle
+            reply = (False, e if isinstance(e, (ValueError, LookupError, OSError)) else RuntimeError(str(e)))
+        if request_id is not None:
+            self.conn.send(('reply', request_id) + reply)
+
+    def layout(self):
+        """The open streams, for EngineClient to mirror, with devices given by DeviceRegistry key."""
+        engine = self.engine
+        return (engine.format, self._device_key(engine.input_device_index),
+                id(engine.input_stream) if engine.input_stream else None,
+                [(route.name, self._device_key(route.device_index), route.latency_ms, id(route.stream))
+                 for route in engine.routes])
+
+    def _device_key(self, index):
+        devices = self.engine.devices
+        return devices.key_of(index) if devices is not None else None
+
+    def _device_index(self, key, output):
+        """This process's index for a DeviceRegistry key from the UI process; raises ValueError if it has none."""
+        index = self.engine.devices.find_key(key, output) if key is not None else None
+        if index is None:
+            kind = 'Output' if output else 'Input'
+            raise ValueError(f"{kind} device {key[0] if key else None!r} is not in the engine process's device list")
+        return index
+
+    def status(self):
+        engine = self.engine
+        streams = {}
+        if engine.input_stream:
+            streams['input'] = (id(engine.input_stream), self._is_active(engine.input_stream),
+                                engine.telemetry.callbacks, None)
+        for route in list(engine.routes):
+            if route.stream:
+                streams[route.name] = (id(route.stream), self._is_active(route.stream), route.callbacks,
+                                       route.latency_ms)
+        return {'streams': streams, 'voices': self.mixer.active_count, 'record_dropped': engine.record_dropped}
+
+    @staticmethod
+    def _is_active(stream):
+        try:
+            return stream.is_active()
+        except (IOError, OSError):
+            return False
+
+    def sweep(self):
+        """Unlink the shared blocks nothing reads any more."""
+        for name in list(self.unused):
+            shm, viewer = self.mapped[name]
+            if viewer() is not None:
+                continue  # a voice is still playing from it
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+            del self.mapped[name]
+            self.unused.discard(name)
+
+    def shutdown(self):
+        self._close()
+        self.engine.detach_recorder()
+        self.mixer.commands.clear()
+        self.mixer.voices = []
+        self.sounds.clear()
+        self.unused.update(self.mapped)
+        self.sweep()
+
+    def _open(self, mic_key, outputs, fmt, latency=None):
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+            self.engine.audio = self.audio
+            self.engine.devices = DeviceRegistry(self.audio)
+        outputs = [(name, self._device_index(key, True), latency_ms) for name, key, latency_ms in outputs]
+        self.engine.open(self._device_index(mic_key, False), outputs, fmt, latency)
+        logging.info(f"Engine process running at {self.engine.format}")
+        return self.layout()
+
+    def _close(self):
+        # PortAudio is terminated too, so the next open sees the devices as they are then
+        self.engine.close()
+        if self.audio:
+            self.audio.terminate()
+            self.audio = None
+        return self.layout()
+
+    def _reopen_route(self, name, key):
+        self.engine.reopen_route(name, self._device_index(key, True))
+        return self.layout()
+
+    def _reopen_input(self, key):
+        self.engine.reopen_input(self._device_index(key, False))
+        return self.layout()
+
+    def _attach_sound(self, name, shape, dtype):
+        data = self.sounds.get(name)
+        if data is None:
+            shm = shared_memory.SharedMemory(name=name)
+            data = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            data.setflags(write=False)
+            self.sounds[name] = data
+            self.mapped[name] = (shm, weakref.ref(data))
+        return data
+
+    def _attach_stream(self, name, capacity, dtype):
+        ring = SharedRingBuffer(capacity, dtype, name)
+        self.mapped[name] = (ring.shm, weakref.ref(ring))
+        # Unlinked by the sweep as soon as the voice has finished with it
+        self.unused.add(name)
+        return SharedStreamSource(ring)
+
+    def _play(self, name, shape, dtype, gain, sound_id, triggered_at=None, retrigger=None):
+        self.mixer.play(self._attach_sound(name, shape, dtype), gain=gain, sound_id=sound_id,
+                        triggered_at=triggered_at, retrigger=retrigger)
+
+    def _stream(self, name, capacity, dtype, gain, sound_id, triggered_at=None, retrigger=None):
+        self.mixer.play_stream(self._attach_stream(name, capacity, dtype), gain=gain, sound_id=sound_id,
+                               triggered_at=triggered_at, retrigger=retrigger)
+
+    def _schedule(self, events, at, quantize, retrigger=None, triggered_at=None):
+        local = []
+        for offset, kind, *args in events:
+            if kind == 'play':
+                block, gain, sound_id = args
+                local.append((offset, kind, self._attach_sound(*block), gain, sound_id))
+            elif kind == 'stream':
+                block, gain, sound_id = args
+                local.append((offset, kind, self._attach_stream(*block), gain, sound_id))
+            else:
+                local.append((offset, kind) + tuple(args))
+        self.mixer.schedule(local, at, quantize, retrigger, triggered_at)
+
+    def _record(self, name=None, capacity=0, dtype=None):
+        """Start copying the mix into the shared ring name, or stop when name is None."""
+        if name is None:
+            self.engine.detach_recorder()
+            return
+        ring = SharedRingBuffer(capacity, dtype, name)
+        # The UI process unlinks it; this process unmaps it once the callback has let go of the ring
+        self.mapped[name] = (ring.shm, weakref.ref(ring))
+        self.unused.add(name)
+        self.engine.attach_recorder(ring)
+
+    def _master_gain(self, gain):
+        self.mixer.master_gain = gain
+
+    def _release(self, name):
+        self.sounds.pop(name, None)
+        if name not in self.mapped:
+            try:
+                self.mapped[name] = (shared_memory.SharedMemory(name=name), lambda: None)
+            except FileNotFoundError:
+                return
+        self.unused.add(name)
+
+    def _snapshot(self):
+        return self.engine.telemetry.snapshot(self.mixer, self.engine.routes)
+
+    def _quit(self):
+        self.running = False
+
+def run_engine_process(conn, status_ms=ENGINE_STATUS_MS):
+    """Entry point of the engine process."""
+    # Ctrl+C reaches the whole process group; the UI process decides when the engine stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - engine - %(message)s')
+    EngineHost(conn, status_ms).run()
+
+class RemoteStream:
+    """Stands in for a device stream in the engine process, answering from its latest status."""
+
+    def __init__(self, client, name, stream_id):
+        self.client = client
+        self.name = name
+        self.stream_id = stream_id
+
+    def _status(self):
+        status = self.client.status.get('streams', {}).get(self.name)
+        return status if status and status[0] == self.stream_id else None
+
+    def is_active(self):
+        if not self.client.alive:
+            return False
+        status = self._status()
+        # No status for this stream yet means it has only just been opened
+        return status[1] if status else True
+
+    @property
+    def callbacks(self):
+        status = self._status()
+        return status[2] if status else 0
+
+    @property
+    def latency_ms(self):
+        status = self._status()
+        return status[3] if status else None
+
+class RemoteRoute:
+    """Name, device, stream and current latency of an OutputRoute in the engine process."""
+
+    def __init__(self, client, name, device_index, latency_ms, stream_id):
+        self.name = name
+        self.device_index = device_index
+        self.stream = RemoteStream(client, name, stream_id)
+        self._latency_ms = latency_ms
+
+    @property
+    def callbacks(self):
+        return self.stream.callbacks
+
+    @property
+    def latency_ms(self):
+        latency_ms = self.stream.latency_ms
+        return self._latency_ms if latency_ms is None else latency_ms
+
+class RemoteMixer:
+    """Mixer commands for the engine process.
+
+    play() takes a SharedSound and play_stream() a started StreamingSource
+    whose ring is a SharedRingBuffer, as do schedule()'s events, so no
+    samples go through the pipe.
+    The queries wait for the engine process to answer.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._master_gain = 1.0
+
+    def play(self, sound, gain=1.0, sound_id=None, triggered_at=None, retrigger=None):
+        # Stamped here, as perf_counter() is system-wide, so the pipe's delay counts towards trigger latency
+        triggered_at = time.perf_counter() if triggered_at is None else triggered_at
+        self.client.send('play', sound.name, sound.shape, sound.dtype, gain, sound_id, triggered_at, retrigger)
+
+    def play_stream(self, source, gain=1.0, sound_id=None, triggered_at=None, retrigger=None):
+        ring = source.ring
+        triggered_at = time.perf_counter() if triggered_at is None else triggered_at
+        self.client.send('stream', ring.name, ring.capacity, ring.dtype.str, gain, sound_id, triggered_at,
+                         retrigger)
+
+    def schedule(self, events, at=None, quantize=0.0, retrigger=None, triggered_at=None):
+        # perf_counter() is system-wide, so `at` means the same moment in the engine process
+        at = time.perf_counter() if at is None else at
+        check_schedule(events, at, quantize)
+        wire = []
+        for offset, kind, *args in events:
+            if kind == 'play':
+                sound, gain, sound_id = args
+                wire.append((offset, kind, (sound.name, sound.shape, sound.dtype), gain, sound_id))
+            elif kind == 'stream':
+                source, gain, sound_id = args
+                ring = source.ring
+                wire.append((offset, kind, (ring.name, ring.capacity, ring.dtype.str), gain, sound_id))
+            else:
+                wire.append((offset, kind) + tuple(args))
+        self.client.send('schedule', wire, at, quantize, retrigger, triggered_at)
+
+    def stop(self, sound_id=None):
+        self.client.send('stop', sound_id)
+
+    def set_gain(self, sound_id, gain):
+        self.client.send('gain', sound_id, gain)
+
+    def configure(self, max_voices=None, steal_policy=None):
+        self.client.send('configure', max_voices, steal_policy)
+
+    @property
+    def master_gain(self):
+        return self._master_gain
+
+    @master_gain.setter
+    def master_gain(self, gain):
+        self._master_gain = gain
+        self.client.send('master_gain', gain)
+
+    @property
+    def active_count(self):
+        return self.client.status.get('voices', 0)
+
+    def is_playing(self, sound_id):
+        return self.client.call('is_playing', sound_id)
+
+    def playing(self):
+        return self.client.call('playing')
+
+class RemoteTelemetry:
+    """Telemetry for the engine process; snapshots are taken there."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def callbacks(self):
+        stream = self.client.input_stream
+        return stream.callbacks if stream else 0
+
+    def snapshot(self, mixer=None, routes=(), cache=None):
+        try:
+            snapshot = self.client.call('snapshot')
+        except OSError:
+            snapshot = Telemetry().snapshot()
+        if cache is not None:
+            snapshot['decode_cache'] = cache.stats()
+        return snapshot
+
+class EngineClient:
+    """Runs the device streams and the mixer in a child process.
+
+    Stands in for AudioEngine: open(), close(), reopen_route() and
+    reopen_input() wait for the engine process to do the work, while the
+    mixer's play, stop and gain commands are only sent down the pipe. Sound
+    data never goes through the pipe: decoded buffers are SharedSounds and
+    streamed sounds use SharedRingBuffers. The engine process has its own
+    PortAudio and GIL, so nothing this process does delays its callbacks.
+
+    Device indices are those of `devices`, this process's DeviceRegistry.
+    The engine process's PortAudio numbers the devices its own way, so they
+    cross the pipe as DeviceRegistry.key_of() keys.
+    """
+
+    def __init__(self, fmt=None, status_ms=ENGINE_STATUS_MS):
+        self.format = fmt or EngineFormat()
+        # Set by the board for device queries; the engine process opens the streams with its own PortAudio
+        self.audio = None
+        self.devices = None
+        self.mixer = RemoteMixer(self)
+        self.telemetry = RemoteTelemetry(self)
+        self.input_stream = None
+        self.input_device_index = None
+        self.routes = []
+        self.status = {}
+        self.alive = True
+        self.closing = False
+        self._send_lock = threading.Lock()
+        self._replies = {}
+        self._ids = itertools.count()
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_engine_process, args=(child_conn, status_ms),
+                                       name='engine', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._reader = threading.Thread(target=self._read, name='engine-replies', daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'status':
+                self.status = message[1]
+                continue
+            _, request_id, ok, value = message
+            waiter = self._replies.pop(request_id, None)
+            if waiter:
+                waiter[1] = (ok, value)
+                waiter[0].set()
+        self.alive = False
+        self.status = {}
+        if not self.closing:
+            logging.error("The engine process exited")
+        for waiter in list(self._replies.values()):
+            waiter[1] = (False, OSError("the engine process exited"))
+            waiter[0].set()
+
+    def send(self, command, *args):
+        """Queue a command for the engine process without waiting for it."""
+        self._post((command, None) + args)
+
+    def call(self, command, *args, timeout=ENGINE_REPLY_TIMEOUT_S):
+        """Run a command in the engine process and return its result, or raise its error."""
+        request_id = next(self._ids)
+        waiter = self._replies[request_id] = [threading.Event(), None]
+        try:
+            self._post((command, request_id) + args)
+        except OSError:
+            self._replies.pop(request_id, None)
+            raise
+        if not waiter[0].wait(timeout):
+            self._replies.pop(request_id, None)
+            raise TimeoutError(f"The engine process did not answer {command!r}")
+        ok, value = waiter[1]
+        if not ok:
+            raise value
+        return value
+
+    def _post(self, message):
+        if not self.alive:
+            raise OSError("the engine process is not running")
+        with self._send_lock:
+            try:
+                self._conn.send(message)
+            except OSError as e:
+                raise OSError(f"the engine process is not running: {e}") from e
+
+    def release_shared(self, shm):
+        """Finalizer of a SharedSound: unmap it here and let the engine process unlink it."""
+        shm.close()
+        try:
+            self.send('release', shm.name)
+        except OSError:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass  # the engine process unlinked it as it exited
+
+    def share(self, data):
+        return SharedSound(self, data)
+
+    def _apply_layout(self, layout):
+        self.format, input_key, input_id, routes = layout
+        self.input_device_index = self._device_index(input_key, False)
+        if input_id is None:
+            self.input_stream = None
+        elif not self.input_stream or self.input_stream.stream_id != input_id:
+            self.input_stream = RemoteStream(self, 'input', input_id)
+        # Routes whose stream didn't change keep their objects, so the device monitor's heartbeats carry on
+        old = {(route.name, route.stream.stream_id): route for route in self.routes}
+        self.routes = [old.get((name, stream_id))
+                       or RemoteRoute(self, name, self._device_index(key, True), latency_ms, stream_id)
+                       for name, key, latency_ms, stream_id in routes]
+
+    def _device_index(self, key, output):
+        return self.devices.find_key(key, output) if self.devices is not None else None
+
+    def open(self, mic_device_index, outputs, fmt=None, latency=None):
+        outputs = [(name, self.devices.key_of(device_index), latency_ms) for name, device_index, latency_ms in outputs]
+        self._apply_layout(self.call('open', self.devices.key_of(mic_device_index), outputs, fmt or self.format,
+                                     latency, timeout=ENGINE_OPEN_TIMEOUT_S))
+
+    def close(self):
+        """Close every stream; the engine process also terminates its PortAudio."""
+        try:
+            self._apply_layout(self.call('close', timeout=ENGINE_OPEN_TIMEOUT_S))
+        except OSError:
+            self.input_stream = None
+            self.input_device_index = None
+            self.routes = []
+
+    def route(self, name):
+        return next((route for route in self.routes if route.name == name), None)
+
+    def reopen_route(self, name, device_index):
+        self._apply_layout(self.call('reopen_route', name, self.devices.key_of(device_index),
+                                     timeout=ENGINE_OPEN_TIMEOUT_S))
+        return self.route(name)
+
+    def reopen_input(self, device_index):
+        self._apply_layout(self.call('reopen_input', self.devices.key_of(device_index), timeout=ENGINE_OPEN_TIMEOUT_S))
+
+    def attach_recorder(self, ring):
+        """Have the engine process copy the mix into a SharedRingBuffer of float32."""
+        try:
+            self.call('record', ring.name, ring.capacity, ring.dtype.str)
+        finally:
+            # Both processes have it mapped (or the engine process never will), so the name can go
+            ring.shm.unlink()
+
+    def detach_recorder(self):
+        self.call('record', None)
+
+    @property
+    def record_dropped(self):
+        return self.status.get('record_dropped', 0)
+
+    def shutdown(self):
+        """Stop the engine process; it closes its streams and unlinks its shared blocks first."""
+        self.closing = True
+        try:
+            self.send('quit')
+        except OSError:
+            pass
+        self.process.join(timeout=ENGINE_OPEN_TIMEOUT_S)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._conn.close()
@@ -0,0 +1,51 @@
+import time
+import signal
+import logging
+import threading
+from LibraryStore import LibraryStore
+from SoundBoard import SoundBoard
+from ControlServer import ControlServer
+from util import CONFIG_FILE, CONTROL_ADDRESS
+
+def run(address=None, config_file=CONFIG_FILE):
+    """Run the mic routing and mixer with no UI; sounds are triggered through the control server.
+
+    Uses the same library and settings as the GUI. Runs until interrupted
+    (Ctrl+C or SIGTERM) and returns the process exit code.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    library = LibraryStore(config_file)
+    library.load()
+    board = SoundBoard(library)
+    board.pcm_cache.validate()
+    board.apply_settings()
+    server = ControlServer(board, address or library.settings.get('control_address', CONTROL_ADDRESS))
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopping.set())
+
+    try:
+        started = time.perf_counter()
+        board.open_devices()
+        devices = board.devices
+        cable = board.find_cable_output()
+        if cable is None:
+            logging.warning("VB-Cable was not detected; the cable route plays on the default output")
+            cable = devices.default_output
+        if devices.default_input is None or devices.default_output is None:
+            logging.error("No default input or output device")
+            return 1
+        board.open_routing(devices.default_input, cable, devices.default_output)
+        server.start()
+        logging.info(f"Headless engine ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+        # A timed wait, so signals are handled promptly on every platform
+        while not stopping.wait(0.5):
+            pass
+        return 0
+    except Exception as e:
+        logging.error(f"Headless engine failed: {e}")
+        return 1
+    finally:
+        server.stop()
+        board.close()
+        library.close()
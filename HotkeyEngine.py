@@ -0,0 +1,92 @@
+import time
+import queue
+import logging
+import threading
+from util import HOTKEY_DEBOUNCE_MS
+
+VK_NAMES = {17: 'Ctrl', 16: 'Shift', 18: 'Alt'}
+VK_NAMES.update({vk: chr(vk) for vk in range(65, 91)})  # A-Z keys
+VK_NAMES.update({vk: f'Numpad{vk - 96}' for vk in range(96, 106)})  # Numpad keys
+
+SPECIAL_KEY_NAMES = {
+    'ctrl': 'Ctrl', 'ctrl_l': 'Ctrl', 'ctrl_r': 'Ctrl',
+    'alt': 'Alt', 'alt_l': 'Alt', 'alt_r': 'Alt',
+    'shift': 'Shift', 'shift_l': 'Shift', 'shift_r': 'Shift',
+    'space': 'Space',
+    'enter': 'Enter',
+}
+KEY_NAMES = {}
+_keyboard = None
+
+def load_keyboard():
+    """pynput's keyboard module, imported on first use since it loads a platform backend."""
+    global _keyboard
+    if _keyboard is None:
+        from pynput import keyboard as pynput_keyboard
+        KEY_NAMES.update({key: SPECIAL_KEY_NAMES.get(key.name, key.name.capitalize()) for key in pynput_keyboard.Key})
+        _keyboard = pynput_keyboard
+    return _keyboard
+
+def key_to_string(key):
+    """Convert a key press event to a string representation, including modifier keys."""
+    pynput_keyboard = load_keyboard()
+    if isinstance(key, pynput_keyboard.KeyCode):
+        if key.vk is not None:
+            return VK_NAMES.get(key.vk) or f'VK_{key.vk}'
+        elif key.char:
+            return key.char.upper()
+        return None
+    elif isinstance(key, pynput_keyboard.Key):
+        return KEY_NAMES.get(key)
+    return None
+
+class HotkeyEngine:
+    """Matches held keys against the bindings and plays matches on one worker thread.
+
+    Bindings are indexed by frozenset of key names, so a key press is a single
+    dict lookup however many hotkeys exist. The index must be rebuilt whenever
+    the bindings change.
+    """
+
+    def __init__(self, trigger, debounce_ms=HOTKEY_DEBOUNCE_MS):
+        self.trigger = trigger
+        self.debounce = debounce_ms / 1000
+        self.index = {}
+        self.last_fired = {}
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name='hotkey-dispatch', daemon=True)
+        self.worker.start()
+
+    def rebuild(self, hotkeys):
+        self.index = {frozenset(hotkey.split('+')): sound for sound, hotkey in hotkeys.items() if hotkey}
+
+    def match(self, keys):
+        """Queue the sound bound to exactly these keys, unless it fired within the debounce window."""
+        sound = self.index.get(frozenset(keys))
+        if sound is None:
+            return None
+        now = time.monotonic()
+        last = self.last_fired.get(sound)
+        if last is not None and now - last < self.debounce:
+            return None
+        self.last_fired[sound] = now
+        self.queue.put((sound, time.perf_counter()))
+        return sound
+
+    def dispatch(self, sound):
+        self.queue.put((sound, time.perf_counter()))
+
+    def stop(self):
+        self.queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # With the time it was queued, so trigger latency includes the wait for this worker
+            sound, accepted_at = item
+            try:
+                self.trigger(sound, accepted_at)
+            except Exception as e:
+                logging.error(f"Error triggering {sound}: {e}")
@@ -0,0 +1,74 @@
+from util import (LATENCY_MIN_MS, LATENCY_MAX_MS, LATENCY_STEP_UP_MS, LATENCY_STEP_DOWN_MS, LATENCY_CHECK_S,
+                  LATENCY_QUIET_S)
+
+class LatencyController:
+    """Adapts each output route's target latency to the dropouts it actually sees.
+
+    Every check_s of audio it looks at how many underruns and device
+    underflows each route had, plus the mic callback's overruns (which starve
+    every route). Any trouble steps that route's latency up by step_up_ms at
+    once; quiet_s without trouble steps it down by the smaller step_down_ms.
+    If trouble follows within quiet_s of a step down, the level it stepped
+    down from becomes the floor for the rest of the session, so it doesn't
+    keep probing a latency the machine can't hold.
+
+    update() is called from the mic callback, in whichever process runs the
+    engine: it only compares counters and sets integers on the routes.
+    Raising a route's latency takes effect as it refills after the underrun
+    that caused it, and lowering it only drops samples while the output is
+    quiet, so neither is heard as a gap.
+    """
+
+    def __init__(self, min_ms=LATENCY_MIN_MS, max_ms=LATENCY_MAX_MS, step_up_ms=LATENCY_STEP_UP_MS,
+                 step_down_ms=LATENCY_STEP_DOWN_MS, check_s=LATENCY_CHECK_S, quiet_s=LATENCY_QUIET_S):
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.step_up_ms = step_up_ms
+        self.step_down_ms = step_down_ms
+        self.check_s = check_s
+        self.quiet_s = quiet_s
+        self.rate = None
+        self.next_check = 0
+        self._overruns = 0
+        # Route name -> [route, trouble count, frame of the last trouble or change, floor_ms, frame of the last step down]
+        self._routes = {}
+
+    def start(self, rate, routes, telemetry, position=0):
+        """Begin watching routes from the timeline position position (in frames)."""
+        self.rate = rate
+        self.next_check = position + int(self.check_s * rate)
+        self._overruns = telemetry.overruns
+        self._routes = {}
+        for route in routes:
+            self._watch(route, position)
+
+    def _watch(self, route, position):
+        self._routes[route.name] = [route, route.underruns + route.device_underflows, position, self.min_ms, None]
+
+    def update(self, position, routes, telemetry):
+        if position < self.next_check:
+            return
+        self.next_check = position + int(self.check_s * self.rate)
+        overruns = telemetry.overruns - self._overruns
+        self._overruns = telemetry.overruns
+        quiet_frames = int(self.quiet_s * self.rate)
+        for route in routes:
+            state = self._routes.get(route.name)
+            if state is None or state[0] is not route:
+                # A reopened route starts over from the latency it was opened with
+                self._watch(route, position)
+                continue
+            trouble = route.underruns + route.device_underflows
+            new_trouble = trouble - state[1] + overruns
+            state[1] = trouble
+            if new_trouble > 0:
+                stepped_down_at = state[4]
+                if stepped_down_at is not None and position - stepped_down_at < quiet_frames:
+                    state[3] = max(state[3], route.latency_ms + self.step_down_ms)
+                state[4] = None
+                state[2] = position
+                if route.latency_ms < self.max_ms:
+                    route.set_latency(min(self.max_ms, max(state[3], route.latency_ms + self.step_up_ms)))
+            elif position - state[2] >= quiet_frames and route.latency_ms > state[3]:
+                route.set_latency(max(state[3], route.latency_ms - self.step_down_ms))
+                state[2] = state[4] = position
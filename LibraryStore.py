@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import threading
+from util import CONFIG_FILE, LIBRARY_VERSION, LIBRARY_FLUSH_DELAY_S, LIBRARY_MAX_FLUSH_DELAY_S
+
+class LibraryStore:
+    """The sound library (sounds, hotkeys, sequences, settings) with write-behind persistence.
+
+    Changes go through the mutation methods, which update the in-memory dicts
+    and mark them dirty. A background thread writes the file once changes have
+    been quiet for flush_delay seconds, or at most max_flush_delay seconds after
+    the first unsaved change. Writes go to a temporary file that is fsynced and
+    then atomically renamed over the old one, so a crash leaves either the old
+    or the new library on disk, never a half-written one.
+    """
+
+    def __init__(self, path=CONFIG_FILE, flush_delay=LIBRARY_FLUSH_DELAY_S, max_flush_delay=LIBRARY_MAX_FLUSH_DELAY_S):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        self.sounds = {}
+        self.hotkeys = {}
+        self.sequences = {}
+        self.settings = {}
+        self.dirty = set()
+        self.first_change = None
+        self.last_change = None
+        self.closed = False
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self.write_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, name='library-flush', daemon=True)
+        self.worker.start()
+
+    def load(self):
+        config = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    config = json.load(f)
+                if not isinstance(config, dict):
+                    raise ValueError(f"expected a JSON object, found {type(config).__name__}")
+            except ValueError as e:
+                backup = self.path + '.corrupt'
+                logging.error(f"Library file {self.path} is unreadable ({e}); moved it to {backup}")
+                os.replace(self.path, backup)
+                config = {}
+
+        with self.lock:
+            self.sounds = config.get('sounds', {})
+            self.hotkeys = config.get('hotkeys', {})
+            self.sequences = config.get('sequences', {})
+            self.settings = config.get('settings', {})
+            if config and config.get('version') != LIBRARY_VERSION:
+                self._migrate(config.get('version'))
+
+    def _migrate(self, version):
+        """Bring a library from an older layout up to LIBRARY_VERSION."""
+        logging.info(f"Migrating library from version {version} to {LIBRARY_VERSION}")
+        for sound, value in self.sounds.items():
+            # The oldest layout stored only the path for each sound
+            if isinstance(value, str):
+                value = {'path': value, 'title': sound}
+                self.sounds[sound] = value
+            value.setdefault('title', sound)
+            value.setdefault('favorite', False)
+            value.setdefault('play_count', 0)
+        self._mark_dirty('version')
+
+    def _mark_dirty(self, key):
+        now = time.monotonic()
+        if not self.dirty:
+            self.first_change = now
+        self.last_change = now
+        self.dirty.add(key)
+        self.condition.notify()
+
+    def add_sound(self, sound, info):
+        with self.lock:
+            self.sounds[sound] = info
+            self._mark_dirty(('sound', sound))
+
+    def add_sounds(self, sounds):
+        """Add several sounds as one change; they are always written together."""
+        with self.lock:
+            for sound, info in sounds.items():
+                self.sounds[sound] = info
+                self._mark_dirty(('sound', sound))
+
+    def update_sound(self, sound, **fields):
+        """Update a sound's fields; returns False, changing nothing, if it has been removed."""
+        with self.lock:
+            info = self.sounds.get(sound)
+            if info is None:
+                return False
+            info.update(fields)
+            self._mark_dirty(('sound', sound))
+            return True
+
+    def increment_play_count(self, sound):
+        with self.lock:
+            info = self.sounds[sound]
+            info['play_count'] = info.get('play_count', 0) + 1
+            self._mark_dirty(('sound', sound))
+
+    def remove_sound(self, sound):
+        with self.lock:
+            self.sounds.pop(sound, None)
+            self._mark_dirty(('sound', sound))
+            if sound in self.hotkeys:
+                del self.hotkeys[sound]
+                self._mark_dirty(('hotkey', sound))
+
+    def set_hotkey(self, sound, hotkey):
+        with self.lock:
+            self.hotkeys[sound] = hotkey
+            self._mark_dirty(('hotkey', sound))
+
+    def remove_hotkey(self, sound):
+        with self.lock:
+            if sound in self.hotkeys:
+                del self.hotkeys[sound]
+                self._mark_dirty(('hotkey', sound))
+
+    def set_sequence(self, name, sequence):
+        with self.lock:
+            self.sequences[name] = sequence
+            self._mark_dirty(('sequence', name))
+
+    def remove_sequence(self, name):
+        with self.lock:
+            if self.sequences.pop(name, None) is not None:
+                self._mark_dirty(('sequence', name))
+
+    def set_setting(self, key, value):
+        with self.lock:
+            self.settings[key] = value
+            self._mark_dirty(('setting', key))
+
+    def _serialize(self):
+        return json.dumps({
+            'version': LIBRARY_VERSION,
+            'sounds': self.sounds,
+            'hotkeys': self.hotkeys,
+            'sequences': self.sequences,
+            'settings': self.settings,
+        })
+
+    def flush(self):
+        """Write any pending changes now, on the calling thread."""
+        # Holding write_lock across serialize and write keeps writes in order
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = self._serialize()
+                changes = self.dirty
+                self.dirty = set()
+            self._write(data, changes)
+
+    def _write(self, data, changes):
+        temp_file = self.path + '.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logging.error(f"Error saving library: {e}")
+            with self.lock:
+                for key in changes:
+                    self._mark_dirty(key)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if not self.dirty:
+                        self.condition.wait()
+                        continue
+                    now = time.monotonic()
+                    deadline = min(self.last_change + self.flush_delay, self.first_change + self.max_flush_delay)
+                    if now >= deadline:
+                        break
+                    self.condition.wait(deadline - now)
+                if self.closed:
+                    return
+            self.flush()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.worker.join(timeout=1)
+        self.flush()
@@ -0,0 +1,84 @@
+import math
+import numpy as np
+from util import CHUNK, SAMPLE_RATE, LIMITER_CEILING_DB, LIMITER_KNEE_DB, LIMITER_RELEASE_MS
+
+class Limiter:
+    """Keeps the mix bus under a ceiling without hard clipping.
+
+    Works a block at a time in preallocated buffers. A gain rider pulls each
+    block's peak down to the ceiling, ramping from the previous block's gain
+    so there are no steps, and recovers at the release rate. Whatever the
+    ramp lets through above the knee is bent smoothly towards the ceiling
+    by a tanh curve, so the output never exceeds it. Blocks that stay below
+    the knee pass through untouched.
+    """
+
+    def __init__(self, ceiling_db=LIMITER_CEILING_DB, knee_db=LIMITER_KNEE_DB, release_ms=LIMITER_RELEASE_MS,
+                 rate=SAMPLE_RATE, frames=CHUNK, channels=1):
+        self.ceiling = 10 ** (ceiling_db / 20)
+        self.threshold = self.ceiling * 10 ** (-knee_db / 20)
+        self.release_ms = release_ms
+        self.rate = rate
+        self.channels = channels
+        self.gain = 1.0
+        self.min_gain = 1.0
+        self._allocate(frames)
+
+    def configure(self, rate, channels, frames):
+        """Call while no audio is running; frames counts interleaved samples."""
+        self.rate = rate
+        self.channels = channels
+        self._allocate(frames)
+
+    def _allocate(self, frames):
+        self.frames = frames
+        self.release = math.exp(-frames / self.channels / (self.rate * self.release_ms / 1000))
+        self._ramp = np.linspace(1.0 / frames, 1.0, frames, dtype=np.float32)
+        self._gains = np.zeros(frames, dtype=np.float32)
+        self._abs = np.zeros(frames, dtype=np.float32)
+        self._curve = np.zeros(frames, dtype=np.float32)
+
+    def process(self, block):
+        """Limit a float32 block (full scale 1.0) in place; returns the block."""
+        n = len(block)
+        if n != self.frames:
+            self._allocate(n)
+        peak = max(float(block.max()), -float(block.min()))
+
+        target = self.ceiling / peak if peak > self.ceiling else 1.0
+        if target < self.gain:
+            new_gain = target
+        else:
+            new_gain = min(target, 1.0 - (1.0 - self.gain) * self.release)
+        old_gain = self.gain
+        self.gain = new_gain
+        if new_gain < self.min_gain:
+            self.min_gain = new_gain
+
+        if old_gain < 1.0 or new_gain < 1.0:
+            gains = self._gains
+            np.multiply(self._ramp, new_gain - old_gain, out=gains)
+            gains += old_gain
+            block *= gains
+        if peak * max(old_gain, new_gain) <= self.threshold:
+            return block
+
+        # Soft knee: |x| above the threshold approaches the ceiling along a tanh curve
+        span = self.ceiling - self.threshold
+        level = self._abs
+        curve = self._curve
+        np.abs(block, out=level)
+        np.subtract(level, self.threshold, out=curve)
+        np.maximum(curve, 0, out=curve)
+        curve *= 1.0 / span
+        np.tanh(curve, out=curve)
+        curve *= span
+        curve += self.threshold
+        np.minimum(curve, level, out=curve)
+        np.copysign(curve, block, out=block)
+        return block
+
+    def reset_stats(self):
+        """Deepest gain reduction since the last call, in dB (0 when idle)."""
+        min_gain, self.min_gain = self.min_gain, self.gain
+        return 20 * math.log10(min_gain) if min_gain > 0 else 0.0
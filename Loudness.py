@@ -0,0 +1,123 @@
+import math
+import numpy as np
+from AudioConvert import int_to_float
+from util import SAMPLE_RATE, LOUDNESS_TARGET_LUFS, LOUDNESS_PEAK_CEILING_DB, LOUDNESS_MAX_GAIN_DB
+
+GATE_BLOCK_S = 0.4
+GATE_STEP_S = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+SILENCE_DB = -120.0
+K_WEIGHTING_TAPS = 8192
+FILTER_FFT_SIZE = 1 << 17
+
+def _biquad(b, a, z_inv):
+    return (b[0] + b[1] * z_inv + b[2] * z_inv ** 2) / (1 + a[0] * z_inv + a[1] * z_inv ** 2)
+
+def k_weighting_filter(rate=SAMPLE_RATE, taps=K_WEIGHTING_TAPS):
+    """FIR approximation of the ITU-R BS.1770 K-weighting curve at any rate.
+
+    The two biquads (high shelf, then high-pass) are designed for the given
+    rate, evaluated on an FFT grid and transformed back to an impulse response
+    long enough that the truncated tail is negligible.
+    """
+    # High shelf: +4 dB above ~1.7 kHz
+    k = math.tan(math.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    # High-pass around 38 Hz
+    k = math.tan(math.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass_b = (1.0, -2.0, 1.0)
+    highpass_a = (2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    z_inv = np.exp(-2j * np.pi * np.arange(taps // 2 + 1) / taps)
+    response = _biquad(shelf_b, shelf_a, z_inv) * _biquad(highpass_b, highpass_a, z_inv)
+    return np.fft.irfft(response, taps)
+
+def segment_energies(samples, rate=SAMPLE_RATE):
+    """Sum of squared K-weighted samples over each complete GATE_STEP_S segment.
+
+    Filters by overlap-add FFT convolution in fixed-size chunks, so memory
+    use stays bounded however long the sound is.
+    """
+    step = int(rate * GATE_STEP_S)
+    segments = len(samples) // step
+    h = k_weighting_filter(rate)
+    chunk = (FILTER_FFT_SIZE - len(h) + 1) // step * step
+    spectrum = np.fft.rfft(h, FILTER_FFT_SIZE)
+    energies = np.zeros(segments)
+    carry = np.zeros(len(h) - 1)
+    for start in range(0, segments * step, chunk):
+        block = samples[start:min(start + chunk, segments * step)]
+        filtered = np.fft.irfft(np.fft.rfft(block, FILTER_FFT_SIZE) * spectrum, FILTER_FFT_SIZE)
+        filtered[:len(carry)] += carry
+        carry = filtered[len(block):len(block) + len(h) - 1].copy()
+        energy = np.square(filtered[:len(block)]).reshape(-1, step).sum(axis=1)
+        energies[start // step:start // step + len(energy)] = energy
+    return energies, step
+
+def channel_energies(frames, rate=SAMPLE_RATE):
+    """segment_energies() summed over the channels of a frames x channels array."""
+    total = None
+    for c in range(frames.shape[1]):
+        energies, step = segment_energies(frames[:, c], rate)
+        total = energies if total is None else total + energies
+    return total, step
+
+def integrated_loudness(samples, rate=SAMPLE_RATE, channels=1):
+    """Gated loudness of an interleaved float signal in LUFS, per ITU-R BS.1770."""
+    frames = samples.reshape(-1, channels)
+    if len(frames) < int(rate * GATE_BLOCK_S):
+        # Too short for a full gating block: measure the whole sound as one block
+        padded = np.zeros((int(rate * GATE_BLOCK_S), channels), dtype=np.float32)
+        padded[:len(frames)] = frames
+        energies, step = channel_energies(padded, rate)
+        power = energies.sum() / max(len(frames), 1)
+        return -0.691 + 10 * math.log10(power) if power > 0 else SILENCE_DB
+
+    energies, step = channel_energies(frames, rate)
+    per_block = int(round(GATE_BLOCK_S / GATE_STEP_S))
+    window = np.convolve(energies, np.ones(per_block), mode='valid')
+    powers = window / (per_block * step)
+    with np.errstate(divide='ignore'):
+        loudness = -0.691 + 10 * np.log10(powers)
+    gated = powers[loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return SILENCE_DB
+    relative_gate = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = powers[(loudness > ABSOLUTE_GATE_LUFS) & (loudness > relative_gate)]
+    return -0.691 + 10 * math.log10(gated.mean())
+
+def to_db(value):
+    return 20 * math.log10(value) if value > 0 else SILENCE_DB
+
+def analyze(samples, rate=SAMPLE_RATE, channels=1, target_lufs=LOUDNESS_TARGET_LUFS,
+            ceiling_db=LOUDNESS_PEAK_CEILING_DB, max_gain_db=LOUDNESS_MAX_GAIN_DB):
+    """Peak, RMS and integrated loudness of a decoded sound, plus the gain that normalizes it.
+
+    samples are interleaved with the given channel count. The gain brings the
+    sound to target_lufs, but never boosts by more than max_gain_db or pushes
+    the sample peak above ceiling_db. All levels are in dB relative to full
+    scale.
+    """
+    data = int_to_float(samples) if samples.dtype.kind in 'iu' else samples.astype(np.float32)
+    if not len(data):
+        return {'peak_db': SILENCE_DB, 'rms_db': SILENCE_DB, 'lufs': SILENCE_DB, 'gain_db': 0.0}
+    peak_db = to_db(float(np.abs(data).max()))
+    rms_db = to_db(math.sqrt(float(np.dot(data, data)) / len(data)))
+    lufs = integrated_loudness(data, rate, channels)
+    gain_db = 0.0
+    if lufs > ABSOLUTE_GATE_LUFS:
+        gain_db = min(target_lufs - lufs, max_gain_db, ceiling_db - peak_db)
+    return {
+        'peak_db': round(peak_db, 2),
+        'rms_db': round(rms_db, 2),
+        'lufs': round(lufs, 2),
+        'gain_db': round(gain_db, 2),
+    }
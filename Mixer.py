@@ -0,0 +1,387 @@
+import math
+import time
+import heapq
+import itertools
+from collections import deque
+import numpy as np
+from Limiter import Limiter
+from util import CHUNK, SAMPLE_RATE, MAX_VOICES, VOICE_STEAL_POLICY, SCHEDULE_MAX_S
+
+STEAL_POLICIES = ('oldest', 'quietest')
+RETRIGGER_POLICIES = ('restart', 'overlap', 'ignore')
+# Sound buffers are int16; this folds the conversion to [-1, 1] into each voice's gain
+SAMPLE_SCALE = 1.0 / 32768
+
+def check_schedule(events, at, quantize):
+    """Raise ValueError unless schedule()'s times are finite and within SCHEDULE_MAX_S of now.
+
+    The audio thread turns them into frame numbers, where a NaN or an
+    overflow would raise and stop the stream.
+    """
+    now = time.perf_counter()
+    if not (math.isfinite(at) and abs(at - now) <= SCHEDULE_MAX_S):
+        raise ValueError(f"Schedule time {at} is not within {SCHEDULE_MAX_S} s of now")
+    if not (math.isfinite(quantize) and 0 <= quantize <= SCHEDULE_MAX_S):
+        raise ValueError(f"Quantize step {quantize} must be between 0 and {SCHEDULE_MAX_S} s")
+    for event in events:
+        if not (math.isfinite(event[0]) and abs(event[0]) <= SCHEDULE_MAX_S):
+            raise ValueError(f"Event offset {event[0]} must be within {SCHEDULE_MAX_S} s")
+
+class Voice:
+    """A fully decoded sound played by advancing a cursor through its buffer."""
+    __slots__ = ('data', 'cursor', 'gain', 'order', 'level', 'sound_id', 'done', 'triggered_at', 'delay', 'stop_in',
+                 'retrigger')
+
+    def __init__(self, data, gain, order, sound_id, triggered_at=None):
+        self.data = data
+        self.cursor = 0
+        self.gain = gain
+        self.order = order
+        self.level = float('inf')  # unknown until the voice has been mixed once
+        self.sound_id = sound_id
+        self.done = False
+        # perf_counter() time the trigger was accepted; cleared once the first block is mixed
+        self.triggered_at = triggered_at
+        # Samples of silence before a scheduled start, and samples left before a scheduled stop
+        self.delay = 0
+        self.stop_in = None
+        # What to do if sound_id is already playing when this voice starts; None overlaps
+        self.retrigger = None
+
+    def read(self, dest):
+        """Copy the next len(dest) samples into dest, zero-padding past the end."""
+        start = self.cursor
+        n = len(dest)
+        remaining = len(self.data) - start
+        if remaining > n:
+            np.copyto(dest, self.data[start:start + n], casting='unsafe')
+            self.cursor = start + n
+        else:
+            np.copyto(dest[:remaining], self.data[start:], casting='unsafe')
+            dest[remaining:] = 0
+            self.cursor = len(self.data)
+            self.done = True
+
+    def close(self):
+        pass
+
+class StreamVoice(Voice):
+    """A sound read from a StreamingSource's ring buffer while it is still decoding."""
+    __slots__ = ('source',)
+
+    def __init__(self, source, gain, order, sound_id, triggered_at=None):
+        super().__init__(source.ring, gain, order, sound_id, triggered_at)
+        self.source = source
+
+    def read(self, dest):
+        # An empty ring that is not yet closed is a decode underrun: play silence
+        n = self.data.read_into(dest)
+        if n < len(dest):
+            dest[n:] = 0
+        self.done = self.data.exhausted
+
+    def close(self):
+        self.source.cancel()
+
+class Mixer:
+    """Sums any number of playing sounds over the mic input, one block at a time.
+
+    play(), stop() and set_gain() may be called from any thread; they only queue a command,
+    which the audio thread applies at the start of the next mix() call.
+    Blocks are interleaved float32 in [-1, 1]; `frames` is the block length
+    in samples (frames per buffer times channels).
+
+    `position` counts the frames mixed so far and is the timeline schedule()
+    works on: timed events wait in a heap and are resolved in mix(), at the
+    exact sample they fall on, however many there are.
+    """
+
+    def __init__(self, max_voices=MAX_VOICES, steal_policy=VOICE_STEAL_POLICY, frames=CHUNK):
+        self.max_voices = max_voices
+        self.steal_policy = steal_policy if steal_policy in STEAL_POLICIES else VOICE_STEAL_POLICY
+        self.voices = []
+        self.commands = deque()
+        self.telemetry = None
+        # Scales every voice; a plain float, so it can be set from any thread
+        self.master_gain = 1.0
+        self.limiter = Limiter(frames=frames)
+        self.rate = SAMPLE_RATE
+        self.channels = 1
+        self.position = 0
+        # (position, perf_counter() time of that frame), replaced as a whole once per block
+        self.clock = None
+        self._schedule = []
+        self._order = itertools.count()
+        self._allocate(frames)
+
+    def _allocate(self, frames):
+        self.frames = frames
+        self._block = np.zeros((self.max_voices, frames), dtype=np.float32)
+        self._squares = np.zeros((self.max_voices, frames), dtype=np.float32)
+        self._gains = np.zeros(self.max_voices, dtype=np.float32)
+        self._levels = np.zeros(self.max_voices, dtype=np.float32)
+        self._acc = np.zeros(frames, dtype=np.float32)
+
+    def set_block(self, samples, rate=SAMPLE_RATE, channels=1):
+        """Size the scratch buffers for the engine's block; call while no audio is running."""
+        self._allocate(samples)
+        self.rate = rate
+        self.channels = channels
+        self.limiter.configure(rate, channels, samples)
+
+    def configure(self, max_voices=None, steal_policy=None):
+        if steal_policy in STEAL_POLICIES:
+            self.steal_policy = steal_policy
+        if max_voices is not None and max_voices != self.max_voices:
+            self.commands.append(('resize', max(1, int(max_voices))))
+
+    def play(self, data, gain=1.0, sound_id=None, triggered_at=None, retrigger=None):
+        """Start a voice at the next block.
+
+        triggered_at is the perf_counter() time the hotkey or control command
+        was accepted (default now); the trigger latency telemetry measures
+        from there to the voice's first mixed block. retrigger is one of
+        RETRIGGER_POLICIES, applied against the voices playing sound_id when
+        this one starts: 'restart' stops them, 'ignore' drops this voice
+        instead. It is decided on the audio thread, so back-to-back triggers
+        see each other even while their commands are still queued.
+        """
+        if data.flags.writeable:
+            data = data.view()
+            data.setflags(write=False)
+        triggered_at = time.perf_counter() if triggered_at is None else triggered_at
+        voice = Voice(data, gain, next(self._order), sound_id, triggered_at)
+        voice.retrigger = retrigger
+        self.commands.append(('play', voice))
+
+    def play_stream(self, source, gain=1.0, sound_id=None, triggered_at=None, retrigger=None):
+        """Play a started StreamingSource; its producer is cancelled when the voice ends."""
+        triggered_at = time.perf_counter() if triggered_at is None else triggered_at
+        voice = StreamVoice(source, gain, next(self._order), sound_id, triggered_at)
+        voice.retrigger = retrigger
+        self.commands.append(('play', voice))
+
+    def schedule(self, events, at=None, quantize=0.0, retrigger=None, triggered_at=None):
+        """Queue timed events, placed sample-accurately relative to each other.
+
+        Each event is (offset_s, 'play', data, gain, sound_id),
+        (offset_s, 'stream', source, gain, sound_id) or (offset_s, 'stop',
+        sound_id). Offsets count from `at`, a perf_counter() time (default
+        now), which is moved to the next multiple of quantize seconds on the
+        engine's timeline when quantize is set. Events already due start at
+        the next block. retrigger applies to every start, as in play(). With
+        triggered_at, the time a hotkey or command asked for these starts,
+        each start records its trigger latency when it is first mixed, wait
+        for the quantize grid included. Raises ValueError for times
+        check_schedule() rejects.
+        """
+        at = time.perf_counter() if at is None else at
+        check_schedule(events, at, quantize)
+        timed = []
+        for offset, kind, *args in events:
+            frames = round(offset * self.rate)
+            if kind == 'play':
+                data, gain, sound_id = args
+                if data.flags.writeable:
+                    data = data.view()
+                    data.setflags(write=False)
+                voice = Voice(data, gain, next(self._order), sound_id)
+            elif kind == 'stream':
+                source, gain, sound_id = args
+                voice = StreamVoice(source, gain, next(self._order), sound_id)
+            else:
+                timed.append((frames, kind, args[0]))
+                continue
+            voice.retrigger = retrigger
+            if triggered_at is not None:
+                voice.triggered_at = triggered_at + offset
+            timed.append((frames, kind, voice))
+        self.commands.append(('schedule', (at, round(quantize * self.rate), timed)))
+
+    def frame_at(self, when):
+        """Timeline position of a perf_counter() time, never earlier than the next block."""
+        clock = self.clock
+        if clock is None:
+            return self.position
+        return max(self.position, clock[0] + round((when - clock[1]) * self.rate))
+
+    def stop(self, sound_id=None):
+        """Stop every voice playing sound_id, or all voices when it is None; scheduled starts are dropped too."""
+        self.commands.append(('stop', sound_id))
+
+    def set_gain(self, sound_id, gain):
+        """Change the gain of every voice playing sound_id."""
+        self.commands.append(('gain', (sound_id, gain)))
+
+    @property
+    def active_count(self):
+        return len(self.voices)
+
+    def is_playing(self, sound_id):
+        return any(voice.sound_id == sound_id for voice in self.voices)
+
+    def playing(self):
+        """sound_id of every active voice."""
+        return [voice.sound_id for voice in self.voices]
+
+    def _apply_commands(self):
+        while self.commands:
+            command, arg = self.commands.popleft()
+            if command == 'play':
+                self._trigger(arg, 0)
+            elif command == 'schedule':
+                at, quantize, timed = arg
+                base = self.frame_at(at)
+                if quantize > 0:
+                    base = -(-base // quantize) * quantize
+                for frames, kind, event in timed:
+                    heapq.heappush(self._schedule, (base + frames, next(self._order), kind, event))
+            elif command == 'stop':
+                self._remove(lambda v: arg is None or v.sound_id == arg)
+                self._unschedule(arg)
+            elif command == 'gain':
+                sound_id, gain = arg
+                for voice in self.voices:
+                    if voice.sound_id == sound_id:
+                        voice.gain = gain
+            elif command == 'resize':
+                self.max_voices = arg
+                if len(self.voices) > arg:
+                    for voice in self.voices[:-arg]:
+                        voice.close()
+                    self.voices = self.voices[-arg:]
+                self._allocate(self.frames)
+
+    def _start(self, voice):
+        if len(self.voices) >= self.max_voices:
+            victim = self._pick_victim()
+            self.voices.remove(victim)
+            victim.close()
+        self.voices.append(voice)
+
+    def _trigger(self, voice, offset):
+        """Start voice `offset` samples into this block, applying its retrigger policy."""
+        if voice.retrigger in ('restart', 'ignore'):
+            playing = [v for v in self.voices
+                       if v.sound_id == voice.sound_id and (v.stop_in is None or v.stop_in > offset)]
+            if playing and voice.retrigger == 'ignore':
+                voice.close()
+                return
+            if playing and offset:
+                for v in playing:
+                    v.stop_in = offset
+            elif playing:
+                self._remove(lambda v: v in playing)
+        self._start(voice)
+
+    def _unschedule(self, sound_id):
+        kept = []
+        for event in self._schedule:
+            if event[2] != 'stop' and (sound_id is None or event[3].sound_id == sound_id):
+                event[3].close()
+            else:
+                kept.append(event)
+        if len(kept) != len(self._schedule):
+            heapq.heapify(kept)
+            self._schedule = kept
+
+    def _run_schedule(self, end):
+        """Start and stop the voices whose events fall before frame `end`, at their offset in this block."""
+        schedule = self._schedule
+        while schedule and schedule[0][0] < end:
+            frame, _, kind, event = heapq.heappop(schedule)
+            offset = max(0, frame - self.position) * self.channels
+            if kind == 'stop':
+                for voice in self.voices:
+                    if (event is None or voice.sound_id == event) and (voice.stop_in is None or voice.stop_in > offset):
+                        voice.stop_in = offset
+            else:
+                event.delay = offset
+                self._trigger(event, offset)
+
+    def _remove(self, predicate):
+        kept = []
+        for voice in self.voices:
+            if predicate(voice):
+                voice.close()
+            else:
+                kept.append(voice)
+        self.voices = kept
+
+    def _pick_victim(self):
+        if self.steal_policy == 'quietest':
+            return min(self.voices, key=lambda v: v.level)
+        return min(self.voices, key=lambda v: v.order)
+
+    def mix(self, in_array, block_time=None):
+        """Return the mic block with all active voices added and limited.
+
+        Works entirely in preallocated scratch buffers: sound buffers are never
+        sliced off or rebound, only each voice's read position moves. When no
+        voice is active the input array itself is returned. block_time is the
+        perf_counter() time the block's first frame was captured, if known; it
+        anchors the timeline that schedule() maps times onto.
+        """
+        self._apply_commands()
+        n = len(in_array)
+        self.clock = (self.position, time.perf_counter() if block_time is None else block_time)
+        end = self.position + n // self.channels
+        if self._schedule and self._schedule[0][0] < end:
+            self._run_schedule(end)
+        self.position = end
+        voices = self.voices
+        if not voices:
+            return in_array
+
+        if n > self.frames:
+            self._allocate(n)
+        k = len(voices)
+        block = self._block[:k, :n]
+        gains = self._gains[:k]
+
+        finished = 0
+        scale = SAMPLE_SCALE * self.master_gain
+        for row, voice in enumerate(voices):
+            dest = block[row]
+            if voice.delay:
+                # Starts part-way into this block
+                silent = min(voice.delay, n)
+                dest[:silent] = 0
+                voice.delay -= silent
+                voice.read(dest[silent:])
+            else:
+                voice.read(dest)
+            if voice.stop_in is not None:
+                if voice.stop_in < n:
+                    dest[voice.stop_in:] = 0
+                    voice.done = True
+                else:
+                    voice.stop_in -= n
+            if voice.triggered_at is not None:
+                if self.telemetry:
+                    self.telemetry.record_trigger_latency(time.perf_counter() - voice.triggered_at)
+                voice.triggered_at = None
+            if voice.done:
+                finished += 1
+            gains[row] = voice.gain * scale
+
+        # One accumulate across all voices
+        acc = self._acc[:n]
+        np.dot(gains, block, out=acc)
+
+        if self.steal_policy == 'quietest':
+            levels = self._levels[:k]
+            squares = self._squares[:k, :n]
+            np.square(block, out=squares)
+            np.add.reduce(squares, axis=1, out=levels)
+            np.multiply(levels, gains, out=levels)
+            np.multiply(levels, gains, out=levels)
+            for row, voice in enumerate(voices):
+                voice.level = levels[row]
+
+        np.add(acc, in_array, out=acc)
+        self.limiter.process(acc)
+
+        if finished:
+            self._remove(lambda v: v.done)
+        return acc
@@ -0,0 +1,154 @@
+import pyaudio
+import numpy as np
+from RingBuffer import RingBuffer
+from AudioConvert import remix_into
+from EngineFormat import DeviceFormat
+from util import CHUNK, SAMPLE_RATE
+
+# Output below this (about -50 dBFS) is quiet enough to skip when catching up to a lowered latency
+QUIET_LEVEL = 0.003
+
+class OutputRoute:
+    """One output device fed from the mixer through its own ring buffer.
+
+    The mic callback only push()es mixed blocks; the device's own PortAudio
+    callback pulls them at its own pace. A stalled device therefore only ever
+    fills its own ring (the extra blocks are dropped and counted) and can't
+    hold up the capture stream or any other output.
+
+    The ring holds the engine's interleaved float32 samples; conversion to the
+    device's own channel count and sample format happens once, in the device
+    callback.
+
+    The target latency can be changed while the stream runs with
+    set_latency(), up to max_latency_ms, which sizes the ring.
+    """
+
+    def __init__(self, name, device_index, latency_ms, rate=SAMPLE_RATE, frames_per_buffer=CHUNK, channels=1,
+                 device_format=None, max_latency_ms=None):
+        self.name = name
+        self.device_index = device_index
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.channels = channels
+        self.device_format = device_format or DeviceFormat(channels, 'int16')
+        self.set_latency(latency_ms)
+        # Room for the largest target plus the slack above it before blocks are dropped
+        ring_frames = max(self.latency_frames, int(rate * (max_latency_ms or 0) / 1000)) + 4 * frames_per_buffer
+        self.ring = RingBuffer(ring_frames * channels, dtype=np.float32)
+        self.stream = None
+        self.priming = True
+        self.underruns = 0
+        self.overflows = 0
+        self.dropped_frames = 0
+        self.device_underflows = 0
+        # Heartbeat for the device monitor: a stream whose callbacks stop has lost its device
+        self.callbacks = 0
+        self.fill = 0
+        self.low_water = self.ring.capacity + 1
+        self._allocate(frames_per_buffer)
+
+    def set_latency(self, latency_ms):
+        """Change the target latency; safe while the stream runs, as it only sets integers."""
+        self.latency_ms = latency_ms
+        self.latency_frames = max(self.frames_per_buffer, int(self.rate * latency_ms / 1000))
+        # Past this fill level the device clock is running slow; drop back to the target
+        self.max_fill = self.latency_frames + 2 * self.frames_per_buffer
+
+    def _allocate(self, frames):
+        device_samples = frames * self.device_format.channels
+        self._block = np.zeros(frames * self.channels, dtype=np.float32)
+        self._scaled = np.zeros(device_samples, dtype=np.float32)
+        self._out = np.zeros(device_samples, dtype=self.device_format.dtype)
+
+    def open(self, audio):
+        self.stream = audio.open(
+            format=self.device_format.pa_format,
+            channels=self.device_format.channels,
+            rate=self.rate,
+            output=True,
+            output_device_index=self.device_index,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._callback
+        )
+        self.stream.start_stream()
+
+    def close(self):
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except (IOError, OSError):
+                pass  # the device is already gone
+            self.stream = None
+
+    def push(self, block):
+        """Producer side, called from the mic callback."""
+        written = self.ring.write(block)
+        if written < len(block):
+            self.overflows += 1
+            self.dropped_frames += len(block) - written
+
+    def stats(self):
+        """Counters for telemetry; the low-water mark restarts on each call."""
+        low_water = self.low_water if self.low_water <= self.ring.capacity else self.fill
+        self.low_water = self.ring.capacity + 1
+        return {
+            'latency_ms': self.latency_ms,
+            'latency_frames': self.latency_frames,
+            'fill': self.fill,
+            'low_water': low_water,
+            'underruns': self.underruns,
+            'device_underflows': self.device_underflows,
+            'overflows': self.overflows,
+            'dropped_frames': self.dropped_frames,
+        }
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.callbacks += 1
+        if status & pyaudio.paOutputUnderflow:
+            self.device_underflows += 1
+        channels = self.channels
+        if frame_count * channels > len(self._block):
+            self._allocate(frame_count)
+        block = self._block[:frame_count * channels]
+        ring = self.ring
+        self.fill = ring.available // channels
+
+        # After start-up or an underrun, wait until the target latency is buffered
+        if self.priming:
+            if self.fill < self.latency_frames:
+                block[:] = 0
+                return (self._to_device(block, frame_count), pyaudio.paContinue)
+            self.priming = False
+
+        if self.fill < self.low_water:
+            self.low_water = self.fill
+        if self.fill > self.max_fill:
+            self.dropped_frames += ring.skip((self.fill - self.latency_frames) * channels) // channels
+
+        n = ring.read_into(block)
+        if n < len(block):
+            block[n:] = 0
+            self.underruns += 1
+            self.priming = True
+        elif ring.available // channels - self.latency_frames >= self.frames_per_buffer:
+            # Still above a lowered target: catch up while it can't be heard
+            if block.max() < QUIET_LEVEL and block.min() > -QUIET_LEVEL:
+                excess = ring.available // channels - self.latency_frames
+                self.dropped_frames += ring.skip(min(excess, frame_count) * channels) // channels
+        return (self._to_device(block, frame_count), pyaudio.paContinue)
+
+    def _to_device(self, block, frame_count):
+        """The one conversion from the engine's float32 layout to the device's format."""
+        device = self.device_format
+        out = self._out[:frame_count * device.channels]
+        if device.dtype == np.float32:
+            remix_into(block, self.channels, out, device.channels)
+        else:
+            scaled = self._scaled[:len(out)]
+            remix_into(block, self.channels, scaled, device.channels, device.full_scale)
+            np.rint(scaled, out=scaled)
+            np.clip(scaled, -device.full_scale - 1, device.full_scale, out=scaled)
+            np.copyto(out, scaled, casting='unsafe')
+        return out.tobytes()
@@ -0,0 +1,297 @@
+import os
+import json
+import mmap
+import hashlib
+import logging
+import threading
+import numpy as np
+from util import PCM_CACHE_DIR, PCM_CACHE_MAX_BYTES
+
+MANIFEST_FILE = 'index.json'
+
+class PcmCache:
+    """Decoded sounds kept on disk as .npy files and memory-mapped back in.
+
+    Each entry is named by a hash of the source's (absolute path, size, mtime)
+    and a variant tag for the decoded format, so an edited file never matches
+    its old entry. A manifest records which source each entry came from;
+    validate() uses it at startup to drop stale, orphaned or truncated
+    entries. The directory is bounded by max_bytes, evicting the least
+    recently used entries first.
+    """
+
+    def __init__(self, directory=PCM_CACHE_DIR, max_bytes=PCM_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def entry_name(self, path, variant=''):
+        stat = os.stat(path)
+        source = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return hashlib.sha1(source.encode('utf-8')).hexdigest() + '.npy'
+
+    def _file(self, name):
+        return os.path.join(self.directory, name)
+
+    def contains(self, path, variant=''):
+        try:
+            name = self.entry_name(path, variant)
+        except OSError:
+            return False
+        with self._lock:
+            return name in self.entries
+
+    def get(self, path, decoder, variant=''):
+        """Map the cached samples for path, or decode them and cache the result."""
+        data = self.load(path, variant)
+        if data is not None:
+            return data
+        data = decoder(path)
+        self.store(path, data, variant)
+        return data
+
+    def load(self, path, variant=''):
+        name = self.entry_name(path, variant)
+        with self._lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+        try:
+            data = map_npy(self._file(name))
+            # The file's mtime doubles as its last-used time for eviction
+            os.utime(self._file(name))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Dropping unreadable cached audio for {path}: {e}")
+            self._drop(name)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def store(self, path, data, variant=''):
+        if data.nbytes > self.max_bytes:
+            return
+        stat = os.stat(path)
+        name = self.entry_name(path, variant)
+        try:
+            write_npy(self._file(name), data, f"{threading.get_ident()}")
+        except OSError as e:
+            logging.error(f"Error caching decoded audio for {path}: {e}")
+            return
+        self._add_entry(name, path, stat)
+
+    def adopt(self, files, variant=''):
+        """Take over .npy files other processes wrote inside the cache directory.
+
+        files maps each source path to the .npy file holding its decoded
+        samples. The manifest is written once for the whole batch.
+        """
+        for path, npy_file in files.items():
+            try:
+                stat = os.stat(path)
+                name = self.entry_name(path, variant)
+                if os.path.getsize(npy_file) > self.max_bytes:
+                    remove_file(npy_file)
+                    continue
+                os.replace(npy_file, self._file(name))
+            except OSError as e:
+                logging.error(f"Error caching decoded audio for {path}: {e}")
+                remove_file(npy_file)
+                continue
+            self._add_entry(name, path, stat, save=False)
+        with self._lock:
+            self._save_manifest()
+
+    def _add_entry(self, name, path, stat, save=True):
+        with self._lock:
+            old = self.entries.get(name)
+            if old is not None:
+                self.current_bytes -= old['bytes']
+            self.entries[name] = {
+                'path': os.path.abspath(path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'bytes': os.path.getsize(self._file(name)),
+            }
+            self.current_bytes += self.entries[name]['bytes']
+            self._evict(keep=name)
+            if save:
+                self._save_manifest()
+
+    def invalidate(self, path):
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            names = [name for name, entry in self.entries.items() if entry['path'] == abs_path]
+        for name in names:
+            self._drop(name)
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            evictions = self.evictions
+            self._evict()
+            if self.evictions != evictions:
+                self._save_manifest()
+
+    def validate(self):
+        """Reconcile the directory with its manifest; run once at startup.
+
+        Removes leftover temporary files, entries the manifest doesn't know,
+        entries whose source file changed or disappeared, and entries whose
+        file is truncated or unreadable. Returns the number of entries kept.
+        """
+        try:
+            with open(self._file(MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Audio cache manifest unreadable ({e}); starting over")
+            manifest = {}
+
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            files = []
+
+        entries = {}
+        removed = 0
+        for name in files:
+            if name == MANIFEST_FILE:
+                continue
+            entry = manifest.get(name)
+            if entry is None or not self._is_valid(name, entry):
+                remove_file(self._file(name))
+                removed += 1
+                continue
+            entry['bytes'] = os.path.getsize(self._file(name))
+            entries[name] = entry
+
+        with self._lock:
+            self.entries = entries
+            self.current_bytes = sum(entry['bytes'] for entry in entries.values())
+            self._evict()
+            self._save_manifest()
+            kept = len(self.entries)
+        logging.info(f"Audio cache: {kept} entries kept, {removed} removed")
+        return kept
+
+    def _is_valid(self, name, entry):
+        if not name.endswith('.npy'):
+            return False
+        try:
+            stat = os.stat(entry['path'])
+            if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+                return False
+            read_npy_header(self._file(name))
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            names = list(self.entries)
+        for name in names:
+            self._drop(name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _drop(self, name):
+        with self._lock:
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                self.current_bytes -= entry['bytes']
+                self._save_manifest()
+        remove_file(self._file(name))
+
+    def _evict(self, keep=None):
+        if self.current_bytes <= self.max_bytes:
+            return
+        def last_used(name):
+            try:
+                return os.stat(self._file(name)).st_mtime_ns
+            except OSError:
+                return 0
+        for name in sorted(self.entries, key=last_used):
+            if self.current_bytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            # A file still mapped for playback can't be deleted on Windows; try again later
+            if remove_file(self._file(name)):
+                self.current_bytes -= self.entries.pop(name)['bytes']
+                self.evictions += 1
+
+    def _save_manifest(self):
+        manifest = {name: {key: entry[key] for key in ('path', 'size', 'mtime_ns')}
+                    for name, entry in self.entries.items()}
+        temp_file = self._file(MANIFEST_FILE + '.tmp')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_file, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_file, self._file(MANIFEST_FILE))
+        except OSError as e:
+            logging.error(f"Error saving audio cache manifest: {e}")
+
+def remove_file(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        logging.debug(f"Could not remove {path}: {e}")
+        return False
+
+def write_npy(file_name, data, tag=''):
+    """Save a 1-D array as .npy through a temporary file, so readers never see a partial one."""
+    temp_file = f"{file_name}.{tag or os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    with open(temp_file, 'wb') as f:
+        np.save(f, np.ascontiguousarray(data))
+    os.replace(temp_file, file_name)
+
+def read_npy_header(file_name):
+    """Return (shape, dtype, data offset) of a 1-D .npy file, checking it isn't truncated."""
+    with open(file_name, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        size = os.fstat(f.fileno()).st_size
+    if len(shape) != 1 or dtype.hasobject:
+        raise ValueError(f"unexpected array layout {shape} {dtype}")
+    if size != offset + shape[0] * dtype.itemsize:
+        raise ValueError(f"truncated: {size} bytes on disk")
+    return shape, dtype, offset
+
+def map_npy(file_name):
+    """Memory-map a 1-D .npy file read-only; the pages are shared with the OS cache."""
+    shape, dtype, offset = read_npy_header(file_name)
+    if shape[0] == 0:
+        return np.zeros(0, dtype=dtype)
+    with open(file_name, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+        # Start paging the samples in now rather than inside the audio callback
+        mapping.madvise(mmap.MADV_WILLNEED)
+    return np.frombuffer(mapping, dtype=dtype, count=shape[0], offset=offset)
@@ -0,0 +1,68 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from util import PREWARM_WORKERS
+
+class Prewarmer(QObject):
+    """Decodes a prioritised list of sounds on a small thread pool.
+
+    Paths are queued in the order given, so callers put the most important
+    sounds first. Progress is reported through Qt signals, which are safe to
+    emit from the worker threads.
+    """
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, int)
+
+    def __init__(self, load_func, max_workers=PREWARM_WORKERS, parent=None):
+        super().__init__(parent)
+        self.load_func = load_func
+        self.max_workers = max_workers
+        self.executor = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+
+    def start(self, paths):
+        self.cancel()
+        self.cancel_event = threading.Event()
+        self.total = len(paths)
+        self.done = 0
+        self.failed = 0
+        if not paths:
+            self.finished.emit(0, 0)
+            return
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='prewarm')
+        for path in paths:
+            self.executor.submit(self._load, path, self.cancel_event)
+        self.executor.shutdown(wait=False)
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _load(self, path, cancel_event):
+        if cancel_event.is_set():
+            return
+        failed = False
+        try:
+            self.load_func(path)
+        except Exception as e:
+            failed = True
+            logging.warning(f"Failed to pre-load {path}: {e}")
+
+        with self.lock:
+            if cancel_event.is_set():
+                return
+            self.done += 1
+            if failed:
+                self.failed += 1
+            done, total, loaded = self.done, self.total, self.done - self.failed
+        self.progress.emit(done, total)
+        if done == total:
+            self.finished.emit(loaded, self.failed)
@@ -0,0 +1,184 @@
+import os
+import time
+import wave
+import logging
+import threading
+import numpy as np
+from util import RECORDINGS_DIR, RECORD_FORMAT, RECORD_ROTATE_S, RECORD_FLUSH_S
+
+RECORD_FORMATS = ('wav', 'flac')
+
+def load_soundfile():
+    """The soundfile module for FLAC output, or None if it (or libsndfile) isn't installed."""
+    try:
+        import soundfile
+    except (ImportError, OSError):
+        return None
+    return soundfile
+
+class RecordTap:
+    """The audio thread's end of a recording.
+
+    push() copies the mixed block into the recorder's ring and nothing else:
+    no allocation, no locks, no I/O. A block that doesn't fit whole is
+    dropped and counted in `dropped` (samples), so a stalled writer never
+    holds up the callback or grows memory.
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.dropped = 0
+
+    def push(self, block):
+        if self.ring.free < len(block):
+            self.dropped += len(block)
+            return
+        self.ring.write(block)
+
+class WavWriter:
+    def __init__(self, path, rate, channels):
+        self.file = wave.open(path, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(rate)
+
+    def write(self, pcm):
+        # wave patches the header on every write, so a crash still leaves a playable file
+        self.file.writeframes(pcm)
+
+    def close(self):
+        self.file.close()
+
+class FlacWriter:
+    def __init__(self, path, rate, channels, soundfile):
+        self.channels = channels
+        self.file = soundfile.SoundFile(path, 'w', rate, channels, subtype='PCM_16', format='FLAC')
+
+    def write(self, pcm):
+        self.file.write(pcm.reshape(-1, self.channels))
+
+    def close(self):
+        self.file.close()
+
+class Recorder:
+    """Writes the mix bus to 16-bit WAV (or FLAC, with soundfile) files from a background thread.
+
+    The engine's RecordTap fills `ring` (float32, the engine layout) and the
+    writer thread drains it every flush_s, converting and writing up to a
+    second of audio per write through preallocated buffers. Memory use is
+    the ring plus those buffers however long the recording runs. A new file
+    is started every rotate_s of audio; files are named
+    mix-<start time>-<part>.<format> in directory.
+    """
+
+    def __init__(self, ring, rate, channels, directory=RECORDINGS_DIR, file_format=RECORD_FORMAT,
+                 rotate_s=RECORD_ROTATE_S, flush_s=RECORD_FLUSH_S):
+        self.ring = ring
+        self.rate = rate
+        self.channels = channels
+        self.directory = directory
+        self.soundfile = None
+        if file_format == 'flac':
+            self.soundfile = load_soundfile()
+            if self.soundfile is None:
+                logging.warning("FLAC recording needs the soundfile package; recording to WAV instead")
+                file_format = 'wav'
+        self.format = file_format if file_format in RECORD_FORMATS else RECORD_FORMAT
+        self.rotate_frames = max(1, int(rotate_s * rate))
+        self.flush_s = flush_s
+        self.paths = []
+        self.frames_written = 0
+        self.file_frames = 0
+        self.error = None
+        self._writer = None
+        self._stamp = None
+        # About a second of samples per write, in whole frames
+        samples = min(ring.capacity, rate * channels) // channels * channels
+        self._scratch = np.zeros(samples, dtype=np.float32)
+        self._pcm = np.zeros(samples, dtype=np.int16)
+        self._stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+
+    @property
+    def path(self):
+        return self.paths[-1] if self.paths else None
+
+    def start(self):
+        """Open the first file (raising OSError if it can't be created) and start the writer thread."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._open_file()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Write out what is left in the ring, close the file and release the ring."""
+        self._stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self._close_file()
+        self.ring.close()
+
+    def _open_file(self):
+        path = os.path.join(self.directory, f"mix-{self._stamp}-{len(self.paths) + 1:03d}.{self.format}")
+        if self.format == 'flac':
+            self._writer = FlacWriter(path, self.rate, self.channels, self.soundfile)
+        else:
+            self._writer = WavWriter(path, self.rate, self.channels)
+        self.paths.append(path)
+        self.file_frames = 0
+        logging.info(f"Recording to {path}")
+
+    def _close_file(self):
+        if self._writer:
+            try:
+                self._writer.close()
+            except OSError as e:
+                logging.error(f"Error closing recording {self.path}: {e}")
+            self._writer = None
+
+    def _run(self):
+        try:
+            while True:
+                stopping = self._stopping.wait(self.flush_s)
+                self._drain()
+                if stopping:
+                    return
+        except Exception as e:
+            # The ring stops draining, so the tap counts everything from here on as dropped
+            self.error = str(e)
+            logging.error(f"Recording to {self.path} failed: {e}")
+            self._close_file()
+
+    def _drain(self):
+        channels = self.channels
+        while True:
+            n = self.ring.read_into(self._scratch)
+            if not n:
+                return
+            samples = self._scratch[:n]
+            np.multiply(samples, 32768.0, out=samples)
+            np.rint(samples, out=samples)
+            np.clip(samples, -32768, 32767, out=samples)
+            pcm = self._pcm[:n]
+            np.copyto(pcm, samples, casting='unsafe')
+            frames = n // channels
+            offset = 0
+            while offset < frames:
+                if self.file_frames >= self.rotate_frames:
+                    self._close_file()
+                    self._open_file()
+                count = min(frames - offset, self.rotate_frames - self.file_frames)
+                self._writer.write(pcm[offset * channels:(offset + count) * channels])
+                offset += count
+                self.file_frames += count
+                self.frames_written += count
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'files': len(self.paths),
+            'seconds': self.frames_written / self.rate,
+            'buffered_s': self.ring.available / (self.rate * self.channels) if self.ring.buffer is not None else 0.0,
+            'error': self.error,
+        }
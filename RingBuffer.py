@@ -0,0 +1,69 @@
+import numpy as np
+
+class RingBuffer:
+    """Single-producer/single-consumer ring of samples.
+
+    The producer only ever advances write_pos and the consumer only read_pos,
+    so neither side takes a lock. Both positions count total samples and are
+    reduced modulo the capacity when indexing.
+    """
+
+    def __init__(self, capacity, dtype=np.int16):
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.write_pos = 0
+        self.read_pos = 0
+        self.closed = False
+        self.cancelled = False
+
+    @property
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    @property
+    def free(self):
+        return self.capacity - (self.write_pos - self.read_pos)
+
+    @property
+    def exhausted(self):
+        """True once the producer has closed the ring and everything has been read."""
+        return self.closed and self.write_pos == self.read_pos
+
+    def write(self, data):
+        """Copy as much of data as fits; returns the number of samples written."""
+        n = min(len(data), self.free)
+        if n <= 0:
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if n > first:
+            self.buffer[:n - first] = data[first:n]
+        self.write_pos += n
+        return n
+
+    def read_into(self, out):
+        """Fill out from the ring; returns the number of samples read."""
+        n = min(len(out), self.write_pos - self.read_pos)
+        if n <= 0:
+            return 0
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        np.copyto(out[:first], self.buffer[start:start + first], casting='unsafe')
+        if n > first:
+            np.copyto(out[first:n], self.buffer[:n - first], casting='unsafe')
+        self.read_pos += n
+        return n
+
+    def skip(self, n):
+        """Consumer side: discard up to n of the oldest samples."""
+        n = min(n, self.write_pos - self.read_pos)
+        self.read_pos += n
+        return n
+
+    def close(self):
+        self.closed = True
+
+    def cancel(self):
+        """Consumer side: tell the producer to stop writing."""
+        self.cancelled = True
@@ -0,0 +1,110 @@
+import re
+from collections import Counter
+from util import SEARCH_MIN_SCORE
+
+# Any run of non-word characters or underscores, in any script
+_separators = re.compile(r'[\W_]+')
+
+def normalize(text):
+    """Lowercase and turn punctuation, underscores and dashes into single spaces."""
+    return _separators.sub(' ', text.lower()).strip()
+
+def word_grams(text, closed=True):
+    """Trigrams of each word padded as '  word ', so short prefixes are grams too.
+
+    With closed=False the last word is left open at the end; a query's last
+    word is usually still being typed and should match as a prefix.
+    """
+    words = text.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = '  ' + word + (' ' if closed or i < len(words) - 1 else '')
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+class SearchIndex:
+    """A trigram index over sound titles and file names, updated one sound at a time.
+
+    search() ranks every sound sharing a trigram with the query: the share of
+    the query's trigrams it contains, plus 1 when the query is a substring
+    and 1 more when it is a prefix. Fuzzy matches without the substring need
+    at least two shared trigrams and min_score. Queries shorter than three
+    characters match word prefixes.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.texts = {}
+        self.grams = {}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, key, *fields):
+        """Index key under the given text fields, replacing any earlier entry."""
+        self.remove(key)
+        text = normalize(' '.join(fields))
+        grams = word_grams(text)
+        self.texts[key] = text
+        self.grams[key] = grams
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                self.postings[gram] = {key}
+            else:
+                posting.add(key)
+
+    def remove(self, key):
+        grams = self.grams.pop(key, None)
+        if grams is None:
+            return
+        del self.texts[key]
+        for gram in grams:
+            posting = self.postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self.postings[gram]
+
+    def clear(self):
+        self.postings = {}
+        self.texts = {}
+        self.grams = {}
+
+    def search(self, query, min_score=SEARCH_MIN_SCORE):
+        """Return {key: score} for every sound matching query; higher is better."""
+        query = normalize(query)
+        if not query:
+            return {}
+        query_grams = word_grams(query, closed=False)
+        counts = Counter()
+        for gram in query_grams:
+            posting = self.postings.get(gram)
+            if posting:
+                counts.update(posting)
+
+        total = len(query_grams)
+        results = {}
+        for key, hits in counts.items():
+            score = self._score(key, query, hits, total, min_score)
+            if score is not None:
+                results[key] = score
+        return results
+
+    def score(self, key, query, min_score=SEARCH_MIN_SCORE):
+        """search()'s score for one key, or None if it wouldn't be in the results."""
+        query = normalize(query)
+        grams = self.grams.get(key)
+        if not query or grams is None:
+            return None
+        query_grams = word_grams(query, closed=False)
+        hits = len(query_grams & grams)
+        return self._score(key, query, hits, len(query_grams), min_score) if hits else None
+
+    def _score(self, key, query, hits, total, min_score):
+        score = hits / total
+        text = self.texts[key]
+        if query in text:
+            score += 2 if text.startswith(query) else 1
+        elif hits < 2 or score < min_score:
+            return None
+        return score
@@ -0,0 +1,386 @@
+import os
+import time
+import logging
+import pyaudio
+import numpy as np
+from DecodeCache import DecodeCache
+from PcmCache import PcmCache
+from Mixer import Mixer, RETRIGGER_POLICIES
+from Telemetry import Telemetry
+from AudioEngine import AudioEngine
+from EngineFormat import EngineFormat
+from DeviceRegistry import DeviceRegistry
+from SoundDecoder import decode_sound, should_stream
+from StreamingSource import StreamingSource
+from EngineProcess import EngineClient, SharedRingBuffer
+from LatencyController import LatencyController
+from RingBuffer import RingBuffer
+from Recorder import Recorder
+from util import (DECODE_CACHE_MAX_BYTES, PCM_CACHE_MAX_BYTES, STREAM_MIN_SECONDS, STREAM_MIN_BYTES, STREAM_RING_FRAMES,
+                  CABLE_LATENCY_MS, SPEAKER_LATENCY_MS, MAX_VOICES, VOICE_STEAL_POLICY, RETRIGGER_POLICY,
+                  QUANTIZE_MS, ENGINE_PROCESS, ADAPTIVE_LATENCY, LATENCY_MIN_MS, LATENCY_MAX_MS, RECORDINGS_DIR,
+                  RECORD_FORMAT, RECORD_RING_S, RECORD_ROTATE_S)
+
+class SoundBoard:
+    """Plays sounds from a library through the audio engine, with no UI.
+
+    Owns the decode caches, the mixer and the engine. The GUI drives one
+    from SoundPlayer; headless mode runs one on its own behind the control
+    server. trigger(), stop() and set_gain() only queue mixer commands (after
+    decoding, if the sound isn't cached), so any thread may call them.
+    Delayed, quantized and sequenced starts are scheduled on the mixer's
+    timeline rather than waited for here.
+
+    With the engine_process setting the engine runs in a child process
+    behind an EngineClient: decoded sounds are cached as SharedSounds and
+    streamed sounds decode here into shared rings, so the child only mixes.
+    Recording works the same way in both modes: the engine copies the mix
+    into a ring and a Recorder thread in this process writes it to disk.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.audio = None
+        self.devices = None
+        self.decode_cache = DecodeCache()
+        self.pcm_cache = PcmCache()
+        self.stream_decisions = {}
+        self.mixer = Mixer()
+        self.telemetry = Telemetry()
+        self.engine = AudioEngine(None, self.mixer, self.telemetry)
+        self.recorder = None
+
+    @property
+    def sounds(self):
+        return self.library.sounds
+
+    @property
+    def sequences(self):
+        return self.library.sequences
+
+    @property
+    def settings(self):
+        return self.library.settings
+
+    @property
+    def engine_process(self):
+        return isinstance(self.engine, EngineClient)
+
+    def set_engine_process(self, enabled):
+        """Run the engine in a child process or in this one; only switches while no streams are open."""
+        if bool(enabled) == self.engine_process:
+            return
+        if self.engine.input_stream or self.engine.routes:
+            logging.warning("The engine_process setting takes effect the next time the app starts")
+            return
+        old = self.engine
+        # Cached buffers are arrays in one mode and SharedSounds in the other
+        self.decode_cache.clear()
+        if enabled:
+            self.engine = EngineClient(old.format)
+        else:
+            old.shutdown()
+            self.engine = AudioEngine(None, Mixer(), Telemetry(), old.format)
+        self.engine.audio = self.audio
+        self.engine.devices = self.devices
+        self.mixer = self.engine.mixer
+        self.telemetry = self.engine.telemetry
+
+    def apply_settings(self):
+        self.set_engine_process(self.settings.get('engine_process', ENGINE_PROCESS))
+        cache_mb = self.settings.get('decode_cache_mb')
+        self.decode_cache.set_max_bytes(int(cache_mb * 1024 * 1024) if cache_mb is not None else DECODE_CACHE_MAX_BYTES)
+        pcm_cache_mb = self.settings.get('pcm_cache_mb')
+        self.pcm_cache.set_max_bytes(int(pcm_cache_mb * 1024 * 1024) if pcm_cache_mb is not None else PCM_CACHE_MAX_BYTES)
+        self.mixer.configure(max_voices=self.settings.get('max_voices', MAX_VOICES),
+                             steal_policy=self.settings.get('voice_steal_policy', VOICE_STEAL_POLICY))
+
+    def open_devices(self, audio=None, devices=None):
+        """Use (or start) a PortAudio instance and its device registry; opens no streams."""
+        self.audio = audio or pyaudio.PyAudio()
+        if devices is None:
+            devices = DeviceRegistry(self.audio)
+        elif devices.audio is not self.audio:
+            devices.rescan(self.audio)
+        self.devices = devices
+        self.engine.audio = self.audio
+        self.engine.devices = devices
+
+    def restart_devices(self):
+        """Terminate and restart PortAudio so it enumerates devices again; every stream is closed."""
+        self.close_routing()
+        if self.audio:
+            self.audio.terminate()
+        self.open_devices(pyaudio.PyAudio(), self.devices)
+
+    def find_cable_output(self):
+        return self.devices.find(lambda info: "CABLE Input" in info['name'])
+
+    def open_routing(self, mic_device_index, cable_device_index, speaker_device_index):
+        """Open the mic plus the cable and speaker routes at the configured engine format.
+
+        With adaptive_latency each route starts at the latency saved for its
+        device, or the lowest one, and a LatencyController adjusts it from
+        there; otherwise the configured route latencies are used as they are.
+        """
+        self.close_routing()
+        latency = None
+        if self.settings.get('adaptive_latency', ADAPTIVE_LATENCY):
+            latency = LatencyController(min_ms=self.settings.get('latency_min_ms', LATENCY_MIN_MS),
+                                        max_ms=self.settings.get('latency_max_ms', LATENCY_MAX_MS))
+        outputs = [
+            ('cable', cable_device_index,
+             self.route_latency(cable_device_index, self.settings.get('cable_latency_ms', CABLE_LATENCY_MS), latency)),
+            ('speaker', speaker_device_index,
+             self.route_latency(speaker_device_index, self.settings.get('speaker_latency_ms', SPEAKER_LATENCY_MS),
+                                latency)),
+        ]
+        previous_variant = self.engine.format.decode_variant
+        # The format may change, so a recording carries on in a new file
+        recording = self.stop_recording() is not None
+        self.engine.open(mic_device_index, outputs, EngineFormat.from_settings(self.settings), latency)
+        logging.info(f"Audio engine running at {self.engine.format}")
+        if self.engine.format.decode_variant != previous_variant:
+            # Voices and cached buffers decoded for the old rate or channel count no longer fit
+            self.mixer.stop()
+            self.decode_cache.clear()
+        if recording:
+            try:
+                self.start_recording()
+            except OSError as e:
+                logging.error(f"Error restarting the recording: {e}")
+
+    def route_latency(self, device_index, configured_ms, latency=None):
+        """Latency a route on device_index starts at: the configured one, or with a controller the saved one."""
+        if latency is None:
+            return configured_ms
+        saved = self.settings.get('device_latency_ms', {}).get(self.devices.name_of(device_index))
+        return min(max(saved, latency.min_ms), latency.max_ms) if saved is not None else latency.min_ms
+
+    def save_latencies(self):
+        """Remember the latency each open route has adapted to, keyed by device name."""
+        if not self.settings.get('adaptive_latency', ADAPTIVE_LATENCY) or self.devices is None:
+            return
+        saved = dict(self.settings.get('device_latency_ms', {}))
+        for route in self.engine.routes:
+            name = self.devices.name_of(route.device_index)
+            if name is not None and route.latency_ms is not None:
+                saved[name] = route.latency_ms
+        if saved != self.settings.get('device_latency_ms', {}):
+            self.library.set_setting('device_latency_ms', saved)
+
+    def close_routing(self):
+        """Close every stream, saving the routes' adapted latencies first."""
+        self.save_latencies()
+        self.engine.close()
+
+    def start_recording(self):
+        """Start recording the mix bus to the recordings directory; returns the file being written.
+
+        Raises OSError if the first file can't be created. Recording carries
+        on until stop_recording(), in a new file each time the routing is
+        reopened.
+        """
+        if self.recorder:
+            return self.recorder.path
+        fmt = self.engine.format
+        capacity = int(self.settings.get('record_ring_s', RECORD_RING_S) * fmt.rate) * fmt.channels
+        ring = SharedRingBuffer(capacity, np.float32) if self.engine_process else RingBuffer(capacity, np.float32)
+        recorder = Recorder(ring, fmt.rate, fmt.channels,
+                            directory=self.settings.get('recordings_dir', RECORDINGS_DIR),
+                            file_format=self.settings.get('record_format', RECORD_FORMAT),
+                            rotate_s=self.settings.get('record_rotate_s', RECORD_ROTATE_S))
+        self.engine.attach_recorder(ring)
+        try:
+            recorder.start()
+        except Exception:
+            self.engine.detach_recorder()
+            ring.close()
+            raise
+        self.recorder = recorder
+        return recorder.path
+
+    def stop_recording(self):
+        """Stop recording and finish the file; returns the paths written, or None if not recording."""
+        recorder = self.recorder
+        if recorder is None:
+            return None
+        self.recorder = None
+        dropped = self.engine.record_dropped
+        try:
+            self.engine.detach_recorder()
+        except OSError:
+            pass  # the engine process is gone, and the ring with it
+        recorder.stop()
+        logging.info(f"Recorded {recorder.frames_written / recorder.rate:.1f} s to {len(recorder.paths)} file(s), "
+                     f"{dropped // recorder.channels} frames dropped")
+        return recorder.paths
+
+    def recording_stats(self):
+        """The recorder's stats plus the frames the engine dropped, or None if not recording."""
+        recorder = self.recorder
+        if recorder is None:
+            return None
+        stats = recorder.stats()
+        stats['dropped_frames'] = self.engine.record_dropped // recorder.channels
+        return stats
+
+    def find_sound(self, name):
+        """Library key for name, which may also be a sound's title (case-insensitive)."""
+        if name in self.sounds:
+            return name
+        folded = name.casefold()
+        return next((sound for sound, info in list(self.sounds.items())
+                     if info.get('title', '').casefold() == folded), None)
+
+    def trigger(self, sound, gain=1.0, delay=0.0, triggered_at=None):
+        """Play a sound under the retrigger policy; returns False if there is no such sound or sequence.
+
+        The mixer applies the policy as the voice starts, so this never waits
+        on it. sound may also name a sequence, which is played instead. The start is
+        delay seconds from now, moved onto the quantize_ms grid if one is set.
+        triggered_at is the perf_counter() time the hotkey or command was
+        accepted, which the trigger latency telemetry measures from.
+        """
+        info = self.sounds.get(sound)
+        if info is None:
+            if sound in self.sequences:
+                self.play_sequence(sound, delay)
+                return True
+            return False
+        sound_file = info['path']
+        policy = self.settings.get('retrigger_policy', RETRIGGER_POLICY)
+        events = [(0.0,) + self.sound_event(sound_file, self.sound_gain(sound) * gain)]
+        self.play_events(events, delay, self.settings.get('quantize_ms', QUANTIZE_MS) / 1000, triggered_at,
+                         policy if policy in RETRIGGER_POLICIES else RETRIGGER_POLICY)
+        return True
+
+    def play_sequence(self, name, delay=0.0):
+        """Schedule a sequence from the library; its steps keep their relative timing to the sample.
+
+        A sequence is {"steps": [...], "quantize_ms": 20}, quantize_ms being
+        optional. A step is {"sound": name, "at_ms": 250, "gain": 1.0} to start
+        a sound or {"stop": name, "at_ms": 500} to stop one ("stop": null stops
+        everything). A macro is just a sequence whose steps share one at_ms.
+        Every sound is decoded before anything is scheduled.
+        """
+        sequence = self.sequences[name]
+        steps = []
+        for step in sequence.get('steps', []):
+            target = step['stop'] if 'stop' in step else step['sound']
+            sound = self.find_sound(target) if target is not None else None
+            if target is not None and sound is None:
+                raise ValueError(f"Sequence {name!r} has a step for unknown sound {target!r}")
+            steps.append((step.get('at_ms', 0) / 1000, 'stop' in step, sound, step.get('gain', 1.0)))
+        events = []
+        for offset, stop, sound, gain in steps:
+            sound_file = self.sounds[sound]['path'] if sound is not None else None
+            if stop:
+                events.append((offset, 'stop', sound_file))
+            else:
+                events.append((offset,) + self.sound_event(sound_file, self.sound_gain(sound) * gain))
+        quantize = sequence.get('quantize_ms', self.settings.get('quantize_ms', QUANTIZE_MS)) / 1000
+        self.mixer.schedule(events, time.perf_counter() + delay, quantize)
+
+    def play_events(self, events, delay=0.0, quantize=0.0, triggered_at=None, retrigger=None):
+        """Run (offset_s, kind, ...) mixer events now, or schedule them if they need timing."""
+        if delay or quantize or any(event[0] for event in events):
+            # A requested delay isn't latency, so it is measured from when the sound was asked to start
+            self.mixer.schedule(events, time.perf_counter() + delay, quantize, retrigger,
+                                triggered_at + delay if triggered_at is not None else None)
+            return
+        for _, kind, *args in events:
+            if kind == 'stop':
+                self.mixer.stop(args[0])
+            elif kind == 'stream':
+                self.mixer.play_stream(*args, triggered_at=triggered_at, retrigger=retrigger)
+            else:
+                self.mixer.play(*args, triggered_at=triggered_at, retrigger=retrigger)
+
+    def stop(self, sound=None):
+        self.mixer.stop(self.sounds[sound]['path'] if sound is not None else None)
+
+    def set_gain(self, sound=None, gain=1.0):
+        """Set a playing sound's gain relative to its normalized level, or the master gain when sound is None."""
+        if sound is None:
+            self.mixer.master_gain = float(gain)
+        else:
+            self.mixer.set_gain(self.sounds[sound]['path'], self.sound_gain(sound) * gain)
+
+    def sound_gain(self, sound):
+        """Linear playback gain that brings a sound to the normalization target."""
+        loudness = self.sounds[sound].get('loudness')
+        if not loudness or not self.settings.get('normalize_loudness', True):
+            return 1.0
+        return 10 ** (loudness['gain_db'] / 20)
+
+    def load_sound_data(self, sound_file):
+        fmt = self.engine.format
+        engine = self.engine
+
+        def decode(path):
+            data = self.decode_sound_file(path, fmt)
+            return engine.share(data) if isinstance(engine, EngineClient) else data
+        return self.decode_cache.get(sound_file, decode, fmt.decode_variant)
+
+    def decode_sound_file(self, sound_file, fmt):
+        # Sounds decoded in an earlier session are mapped from disk instead
+        return self.pcm_cache.get(sound_file, lambda path: decode_sound(path, fmt.rate, fmt.channels),
+                                  fmt.decode_variant)
+
+    def is_streamed(self, sound_file):
+        """Whether a sound is long enough to be streamed instead of decoded up front."""
+        key = DecodeCache.make_key(sound_file)
+        decision = self.stream_decisions.get(key)
+        if decision is None:
+            decision = should_stream(sound_file,
+                                     min_seconds=self.settings.get('stream_min_seconds', STREAM_MIN_SECONDS),
+                                     min_bytes=self.settings.get('stream_min_bytes', STREAM_MIN_BYTES))
+            self.stream_decisions[key] = decision
+        return decision
+
+    def sound_event(self, sound_file, gain=1.0):
+        """The mixer event that plays a sound file: ('play', data, ...) or, for a long one, ('stream', source, ...)."""
+        fmt = self.engine.format
+        if (not self.decode_cache.contains(sound_file, fmt.decode_variant)
+                and not self.pcm_cache.contains(sound_file, fmt.decode_variant)
+                and self.is_streamed(sound_file)):
+            ring = SharedRingBuffer(STREAM_RING_FRAMES * fmt.channels) if self.engine_process else None
+            source = StreamingSource(sound_file, fmt.rate, channels=fmt.channels, ring=ring)
+            return ('stream', source.start(), gain, sound_file)
+        return ('play', self.load_sound_data(sound_file), gain, sound_file)
+
+    def forget_decoded(self, path):
+        """Drop everything derived from a sound file's old contents."""
+        self.decode_cache.invalidate(path)
+        self.pcm_cache.invalidate(path)
+        for key in [key for key in list(self.stream_decisions) if key[0] == os.path.abspath(path)]:
+            self.stream_decisions.pop(key, None)
+
+    def state(self):
+        """What is playing and how the engine is running, for status queries."""
+        paths = {info['path']: sound for sound, info in list(self.sounds.items())}
+        playing = [paths.get(sound_id, sound_id) for sound_id in self.mixer.playing()]
+        fmt = self.engine.format
+        return {
+            'playing': sorted(set(filter(None, playing))),
+            'voices': len(playing),
+            'master_gain': self.mixer.master_gain,
+            'format': {'rate': fmt.rate, 'channels': fmt.channels, 'sample_format': fmt.sample_format,
+                       'frames_per_buffer': fmt.frames_per_buffer},
+            'routes': [route.name for route in self.engine.routes],
+            'running': self.engine.input_stream is not None,
+            'sounds': len(self.sounds),
+            'recording': self.recording_stats(),
+        }
+
+    def close(self):
+        self.stop_recording()
+        self.close_routing()
+        if self.engine_process:
+            # Releases every shared buffer before the engine process is told to quit
+            self.decode_cache.clear()
+            self.engine.shutdown()
+        if self.audio:
+            self.audio.terminate()
+            self.audio = None
@@ -0,0 +1,108 @@
+import os
+import wave
+import threading
+from AudioConvert import pcm_to_float, int_to_float, float_to_int16, normalize, FrameResampler
+from util import SAMPLE_RATE, STREAM_BLOCK_FRAMES, STREAM_MIN_SECONDS, STREAM_MIN_BYTES, silence_pygame
+
+# pygame's mixer is not safe to drive from several decode threads at once
+pygame_lock = threading.Lock()
+_mixer_format = None
+
+def decode_wav(path, rate=SAMPLE_RATE, out_channels=1):
+    with wave.open(path, 'rb') as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        src_rate = wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    return normalize(pcm_to_float(raw, sample_width), channels, src_rate, rate, out_channels)
+
+def init_pygame_mixer(rate=SAMPLE_RATE):
+    """Import pygame and initialise only its mixer, once; returns the actual (frequency, size, channels).
+
+    Call with pygame_lock held. pygame is slow to import, so nothing loads it
+    until the first MP3 is decoded.
+    """
+    global _mixer_format
+    if _mixer_format is None:
+        import pygame.mixer
+        import pygame.sndarray
+        pygame.mixer.init(frequency=rate)
+        _mixer_format = pygame.mixer.get_init()
+    return _mixer_format
+
+def load_mp3_samples(path, rate=SAMPLE_RATE):
+    """Decode an MP3 with pygame, returning (samples, channels, source rate)."""
+    import mutagen
+    audio = mutagen.File(path)
+    if audio is None:
+        raise ValueError("Could not read audio file metadata")
+
+    with pygame_lock, silence_pygame():
+        import pygame
+        src_rate, _, channels = init_pygame_mixer(rate)
+        samples = pygame.sndarray.samples(pygame.mixer.Sound(path))
+    return samples, channels, src_rate
+
+def decode_mp3(path, rate=SAMPLE_RATE, out_channels=1):
+    samples, channels, src_rate = load_mp3_samples(path, rate)
+    samples = samples if samples.dtype.kind == 'f' else int_to_float(samples)
+    return normalize(samples, channels, src_rate, rate, out_channels)
+
+DECODERS = {
+    '.wav': decode_wav,
+    '.mp3': decode_mp3,
+}
+
+def decode_sound(path, rate=SAMPLE_RATE, out_channels=1):
+    """Decode any supported file to interleaved int16 in the engine's rate and channel count."""
+    file_extension = os.path.splitext(path)[1].lower()
+    decoder = DECODERS.get(file_extension)
+    if decoder is None:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+    return decoder(path, rate, out_channels)
+
+def iter_wav_blocks(path, rate=SAMPLE_RATE, block_frames=STREAM_BLOCK_FRAMES, out_channels=1):
+    with wave.open(path, 'rb') as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        resampler = FrameResampler(wf.getframerate(), rate, channels, out_channels)
+        while True:
+            raw = wf.readframes(block_frames)
+            final = len(raw) < block_frames * channels * sample_width
+            out = resampler.process(pcm_to_float(raw, sample_width), final=final)
+            if len(out):
+                yield float_to_int16(out)
+            if final:
+                return
+
+# pygame can only decode a whole MP3 at once, so MP3s are decoded up front and cached instead of streamed
+BLOCK_ITERATORS = {
+    '.wav': iter_wav_blocks,
+}
+
+def iter_sound_blocks(path, rate=SAMPLE_RATE, block_frames=STREAM_BLOCK_FRAMES, out_channels=1):
+    """Yield interleaved int16 blocks in the engine format without decoding the whole file first."""
+    file_extension = os.path.splitext(path)[1].lower()
+    iterator = BLOCK_ITERATORS.get(file_extension)
+    if iterator is None:
+        raise ValueError(f"Unsupported file format: {file_extension}")
+    return iterator(path, rate, block_frames, out_channels)
+
+def probe_duration(path):
+    """Duration in seconds from the file's metadata, or None if mutagen can't tell."""
+    import mutagen
+    try:
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    if audio is None or audio.info is None:
+        return None
+    return getattr(audio.info, 'length', None)
+
+def should_stream(path, min_seconds=STREAM_MIN_SECONDS, min_bytes=STREAM_MIN_BYTES):
+    if os.path.splitext(path)[1].lower() not in BLOCK_ITERATORS:
+        return False
+    duration = probe_duration(path)
+    if duration is not None and duration >= min_seconds:
+        return True
+    return os.path.getsize(path) >= min_bytes
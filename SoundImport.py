@@ -0,0 +1,28 @@
+import os
+from SoundDecoder import decode_sound
+from Loudness import analyze
+from PcmCache import write_npy
+from util import SOUND_EXTENSIONS
+
+def collect_sound_files(paths):
+    """Absolute paths of the sound files among paths, walking into folders, in order and without repeats."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found += [os.path.join(root, name) for name in sorted(files)
+                          if name.lower().endswith(SOUND_EXTENSIONS)]
+        elif path.lower().endswith(SOUND_EXTENSIONS):
+            found.append(path)
+    return list(dict.fromkeys(os.path.abspath(path) for path in found))
+
+def prepare_sound(source, rate, channels, npy_file):
+    """Decode, convert and analyze one sound, saving the samples to npy_file; returns the loudness.
+
+    Runs in an import worker process, so it only touches its own files.
+    """
+    samples = decode_sound(source, rate, channels)
+    loudness = analyze(samples, rate, channels)
+    write_npy(npy_file, samples)
+    return loudness
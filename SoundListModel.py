@@ -0,0 +1,341 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractProxyModel, QModelIndex
+from PyQt5.QtGui import QIcon
+import os
+from SearchIndex import SearchIndex, normalize
+
+FilenameRole = Qt.UserRole + 1
+FavoriteRole = Qt.UserRole + 2
+PlayCountRole = Qt.UserRole + 3
+
+SORT_MODES = ["Name (A-Z)", "Name (Z-A)", "Favorites First", "Most Played"]
+
+_favorite_icon = None
+_no_icon = None
+
+def favorite_icon(is_favorite):
+    """Icons are only created the first time a favorite row is actually painted."""
+    global _favorite_icon, _no_icon
+    if is_favorite:
+        if _favorite_icon is None:
+            _favorite_icon = QIcon('star.png')
+        return _favorite_icon
+    if _no_icon is None:
+        _no_icon = QIcon()
+    return _no_icon
+
+class SoundListModel(QAbstractListModel):
+    """One row per library sound, backed directly by the library's sounds dict.
+
+    Rows are added, removed and changed individually so a single library change
+    only notifies the views about that one row. Each row keeps a cached sort
+    key tuple, refreshed only when the row changes, and the search index is
+    kept in step with the rows.
+    """
+
+    def __init__(self, sounds, parent=None):
+        super().__init__(parent)
+        self.sounds = sounds
+        self.rows = []
+        self.row_of = {}
+        self.keys = {}
+        self.search_index = SearchIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        sound = self.rows[index.row()]
+        info = self.sounds.get(sound)
+        if info is None:
+            return None
+        if role == Qt.DisplayRole:
+            return info['title']
+        if role == Qt.DecorationRole:
+            return favorite_icon(info.get('favorite', False))
+        if role == FilenameRole:
+            return sound
+        if role == FavoriteRole:
+            return info.get('favorite', False)
+        if role == PlayCountRole:
+            return info.get('play_count', 0)
+        return None
+
+    def sound_at(self, row):
+        return self.rows[row]
+
+    def _cache_key(self, sound):
+        """Refresh the (lowercase title, is favorite, play count) key; returns the roles that changed."""
+        info = self.sounds[sound]
+        old_key = self.keys.get(sound)
+        key = (info['title'].lower(), info.get('favorite', False), info.get('play_count', 0))
+        self.keys[sound] = key
+        if old_key is None:
+            self.search_index.add(sound, info['title'], os.path.splitext(sound)[0])
+            return []
+        roles = []
+        if old_key[0] != key[0]:
+            self.search_index.add(sound, info['title'], os.path.splitext(sound)[0])
+            roles.append(Qt.DisplayRole)
+        if old_key[1] != key[1]:
+            roles += [Qt.DecorationRole, FavoriteRole]
+        if old_key[2] != key[2]:
+            roles.append(PlayCountRole)
+        return roles
+
+    def set_sounds(self, sounds):
+        self.beginResetModel()
+        self.sounds = sounds
+        self.rows = list(sounds)
+        self.row_of = {sound: row for row, sound in enumerate(self.rows)}
+        self.keys = {}
+        self.search_index.clear()
+        for sound in self.rows:
+            self._cache_key(sound)
+        self.endResetModel()
+
+    def add_sound(self, sound):
+        if sound in self.row_of:
+            self.update_sound(sound)
+            return
+        row = len(self.rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.append(sound)
+        self.row_of[sound] = row
+        self._cache_key(sound)
+        self.endInsertRows()
+
+    def add_sounds(self, sounds):
+        """Append several new sounds with a single row insertion."""
+        sounds = [sound for sound in dict.fromkeys(sounds) if sound not in self.row_of]
+        if not sounds:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(sounds) - 1)
+        for row, sound in enumerate(sounds, first):
+            self.rows.append(sound)
+            self.row_of[sound] = row
+            self._cache_key(sound)
+        self.endInsertRows()
+
+    def remove_sound(self, sound):
+        row = self.row_of.get(sound)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        del self.row_of[sound]
+        self.keys.pop(sound, None)
+        self.search_index.remove(sound)
+        for later_row in range(row, len(self.rows)):
+            self.row_of[self.rows[later_row]] = later_row
+        self.endRemoveRows()
+
+    def update_sound(self, sound):
+        row = self.row_of.get(sound)
+        if row is None:
+            return
+        # No roles, as when only the title's case changed, tells the views anything may have changed
+        roles = self._cache_key(sound)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, roles)
+
+class SoundSortProxy(QAbstractProxyModel):
+    """Sorts and filters SoundListModel rows using the model's cached keys.
+
+    While a search is active only the matching rows are shown, best match
+    first, with ties ordered by title. The order is a list of sounds built in
+    one Python sort whenever the mode or search changes; a changed row is
+    only moved if it no longer fits between its neighbours, and only re-ranked
+    against the search when its title changed.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.mode = SORT_MODES[0]
+        self.filter_text = ""
+        self.ranks = None
+        self.order = []
+        self.position = {}
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._source_rows_removing)
+        model.dataChanged.connect(self._source_data_changed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        self._source_reset()
+
+    def index(self, row, column=0, parent=QModelIndex()):
+        if parent.isValid() or not 0 <= row < len(self.order) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def mapToSource(self, index):
+        if not index.isValid() or index.row() >= len(self.order):
+            return QModelIndex()
+        model = self.sourceModel()
+        return model.index(model.row_of[self.order[index.row()]])
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        position = self.position.get(self.sourceModel().sound_at(index.row()))
+        return QModelIndex() if position is None else self.createIndex(position, 0)
+
+    def set_mode(self, mode):
+        self.mode = mode
+        if self.ranks is None:
+            self._set_order(self._sorted(self.sourceModel().rows))
+
+    def set_filter_text(self, text):
+        self.filter_text = text.strip()
+        # A query of only punctuation has nothing to match on, so it filters nothing out
+        if normalize(self.filter_text):
+            self.ranks = self.sourceModel().search_index.search(self.filter_text)
+            self._set_order(self._sorted(self.ranks))
+        else:
+            self.ranks = None
+            self._set_order(self._sorted(self.sourceModel().rows))
+
+    def _shown(self, sound):
+        return self.ranks is None or sound in self.ranks
+
+    def _sort_key(self):
+        """(key function over sounds, reverse) for the current search or mode."""
+        keys = self.sourceModel().keys
+        if self.ranks is not None:
+            ranks = self.ranks
+            return (lambda sound: (-ranks[sound], keys[sound][0])), False
+        if self.mode == "Favorites First":
+            return (lambda sound: (not keys[sound][1], keys[sound][0])), False
+        if self.mode == "Most Played":
+            return (lambda sound: keys[sound][2]), True
+        return (lambda sound: keys[sound][0]), self.mode == "Name (Z-A)"
+
+    def _sorted(self, sounds):
+        key, reverse = self._sort_key()
+        return sorted(sounds, key=key, reverse=reverse)
+
+    def _in_place(self, position):
+        """Whether the sound at position still sorts between its neighbours."""
+        key, reverse = self._sort_key()
+        order = self.order
+        value = key(order[position])
+        if position > 0:
+            before = key(order[position - 1])
+            if (before < value) if reverse else (value < before):
+                return False
+        if position + 1 < len(order):
+            after = key(order[position + 1])
+            if (value < after) if reverse else (after < value):
+                return False
+        return True
+
+    def _move(self, row):
+        """Move the sound at row to where it now sorts, leaving the rest of the order alone."""
+        key, reverse = self._sort_key()
+        sound = self.order[row]
+        others = self.order[:row] + self.order[row + 1:]
+        value = key(sound)
+        low, high = 0, len(others)
+        while low < high:
+            middle = (low + high) // 2
+            other = key(others[middle])
+            if (other < value) if reverse else (value < other):
+                high = middle
+            else:
+                low = middle + 1
+        if low == row:
+            return
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), low if low < row else low + 1)
+        self.order = others
+        others.insert(low, sound)
+        for moved_row in range(min(row, low), max(row, low) + 1):
+            self.position[others[moved_row]] = moved_row
+        self.endMoveRows()
+
+    def _set_order(self, order):
+        """Show order, keeping selections and the current row on the same sounds."""
+        self.layoutAboutToBeChanged.emit()
+        old_indexes = self.persistentIndexList()
+        sounds = [self.order[index.row()] for index in old_indexes]
+        self.order = order
+        self.position = {sound: row for row, sound in enumerate(order)}
+        new_indexes = []
+        for index, sound in zip(old_indexes, sounds):
+            row = self.position.get(sound)
+            new_indexes.append(QModelIndex() if row is None else self.createIndex(row, index.column()))
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def _source_reset(self):
+        if self.ranks is not None:
+            self.ranks = self.sourceModel().search_index.search(self.filter_text)
+            self.order = self._sorted(self.ranks)
+        else:
+            self.order = self._sorted(self.sourceModel().rows)
+        self.position = {sound: row for row, sound in enumerate(self.order)}
+        self.endResetModel()
+
+    def _source_rows_inserted(self, parent, first, last):
+        sounds = self.sourceModel().rows[first:last + 1]
+        if self.ranks is not None:
+            index = self.sourceModel().search_index
+            for sound in sounds:
+                score = index.score(sound, self.filter_text)
+                if score is not None:
+                    self.ranks[sound] = score
+        sounds = [sound for sound in sounds if self._shown(sound)]
+        if sounds:
+            # The order is already sorted, so this sort is close to linear
+            self._set_order(self._sorted(self.order + sounds))
+
+    def _source_rows_removing(self, parent, first, last):
+        for sound in self.sourceModel().rows[first:last + 1]:
+            if self.ranks is not None:
+                self.ranks.pop(sound, None)
+            row = self.position.get(sound)
+            if row is None:
+                continue
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.order[row]
+            del self.position[sound]
+            for later_row in range(row, len(self.order)):
+                self.position[self.order[later_row]] = later_row
+            self.endRemoveRows()
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        model = self.sourceModel()
+        moved = []
+        for source_row in range(top_left.row(), bottom_right.row() + 1):
+            sound = model.sound_at(source_row)
+            if self.ranks is not None and (not roles or Qt.DisplayRole in roles):
+                score = model.search_index.score(sound, self.filter_text)
+                if score is None:
+                    self.ranks.pop(sound, None)
+                else:
+                    self.ranks[sound] = score
+            row = self.position.get(sound)
+            if (row is not None) != self._shown(sound) or (row is not None and not self._in_place(row)):
+                moved.append(sound)
+            elif row is not None:
+                index = self.createIndex(row, 0)
+                self.dataChanged.emit(index, index, roles)
+        if len(moved) == 1 and moved[0] in self.position and self._shown(moved[0]):
+            self._move(self.position[moved[0]])
+        elif moved:
+            order = [sound for sound in self.order if sound not in moved]
+            self._set_order(self._sorted(order + [sound for sound in moved if self._shown(sound)]))
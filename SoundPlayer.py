@@ -1,53 +1,154 @@
 import os
 import json
+import shutil
 import pyaudio
-import wave
-import threading
-from pynput import keyboard as pynput_keyboard
-from PyQt5.QtWidgets import (QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QListWidget, QFileDialog,
+from PyQt5.QtWidgets import (QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QListView, QFileDialog,
                              QMessageBox, QDialog, QInputDialog, QLineEdit, QComboBox, QDesktopWidget,
                              QLabel)
-from PyQt5.QtCore import QFileSystemWatcher, pyqtSlot
+from PyQt5.QtCore import QFileSystemWatcher, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QIcon
-import pygame
-import mutagen
 import logging
-import audioop
-import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from HotkeyDialog import HotkeyDialog
-from SoundItem import SoundItem
-from util import CHUNK, CONFIG_FILE, SOUNDS_DIR, silence_pygame
+from SoundListModel import SoundListModel, SoundSortProxy, SORT_MODES, FilenameRole
+from PcmCache import remove_file
+from SoundBoard import SoundBoard
+from ControlServer import ControlServer
+from Prewarmer import Prewarmer
+from BatchImporter import BatchImporter
+from SoundImport import collect_sound_files
+from Loudness import analyze
+from DeviceRegistry import DeviceRegistry
+from DeviceMonitor import DeviceMonitor
+from HotkeyEngine import HotkeyEngine, key_to_string, load_keyboard
+from LibraryStore import LibraryStore
+from DirectoryScanner import DirectoryScanner
+from Telemetry import format_snapshot
+from StartupProfiler import startup
+from util import (CONFIG_FILE, SOUNDS_DIR, PREWARM_WORKERS, PREWARM_TOP_PLAYED, IMPORT_WORKERS,
+                  HOTKEY_DEBOUNCE_MS, SCAN_DEBOUNCE_MS, SEARCH_DEBOUNCE_MS, DEVICE_POLL_MS, DEVICE_STALL_MS, DEVICE_RESCAN_MS, CONTROL_ENABLED, CONTROL_ADDRESS, TELEMETRY_PANEL_MS, TELEMETRY_INTERVAL_S, TELEMETRY_FILE)
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class SoundPlayer(QWidget):
+    devices_loaded = pyqtSignal(object, object)
+
     def __init__(self):
         super().__init__()
-        self.audio = pyaudio.PyAudio()
-        self.input_stream = None
-        self.speaker_stream = None
-        self.virtual_cable_stream = None
-        self.frames = []
+        self.device_monitor = None
+        self.prewarmer = None
+        self.listener = None
+        self.control_server = None
+        self.closing = False
+        # Routes playing on a stand-in device: route name -> name of the device it wants back
+        self.fallback_routes = {}
+        self.degraded_routes = set()
         self.sounds = {}
         self.hotkeys = {}
-        self.virtual_cables = self.get_virtual_cables()
-        self.selected_virtual_cable = self.get_default_virtual_cable()
-        self.is_playing_sound = False
-        self.current_sound_data = np.array([], dtype=np.int16)
+        self.settings = {}
+        self.library = LibraryStore(CONFIG_FILE)
+        # Playback lives in the board; PortAudio and the devices are loaded once the window is up
+        self.board = SoundBoard(self.library)
+        with startup.phase('pcm cache'):
+            self.board.pcm_cache.validate()
+        self.decode_cache = self.board.decode_cache
+        self.pcm_cache = self.board.pcm_cache
+        self.virtual_cables = []
+        self.selected_virtual_cable = None
+        self.hotkey_engine = HotkeyEngine(self.trigger_sound)
+        self.analysis_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='loudness')
+        self.telemetry_ticks = 0
         
         icon_path = os.path.join(os.path.dirname(__file__), 'virt_soundboard.png')
         self.setWindowIcon(QIcon(icon_path))
         
-        self.init_ui()
-        self.load_config()
-        self.setup_keyboard_listener()
-        self.setup_file_watcher()
-        self.setup_audio_routing()
+        with startup.phase('ui'):
+            self.init_ui()
+        self.importer = BatchImporter(parent=self)
+        self.importer.progress.connect(self.on_import_progress)
+        self.importer.finished.connect(self.on_import_finished)
+        self.import_variant = None
+        with startup.phase('library'):
+            self.load_config()
+        with startup.phase('sounds scan'):
+            self.setup_file_watcher()
+        self.setup_telemetry()
         self.hotkey_dialog = None
         self.current_keys = set()
-        
-        with silence_pygame():
-            pygame.init()
+        self.devices_loaded.connect(self.on_devices_loaded)
+        QTimer.singleShot(0, self.finish_startup)
+
+    @property
+    def audio(self):
+        return self.board.audio
+
+    @property
+    def devices(self):
+        return self.board.devices
+
+    # The board picks the engine (in this process or a child) when the settings are applied
+    @property
+    def engine(self):
+        return self.board.engine
+
+    @property
+    def mixer(self):
+        return self.board.mixer
+
+    @property
+    def telemetry(self):
+        return self.board.telemetry
+
+    def finish_startup(self):
+        """Runs from the event loop once the window is up: everything the first paint doesn't need."""
+        startup.mark('window shown')
+        with startup.phase('keyboard listener'):
+            self.setup_keyboard_listener()
+        self.setup_control_server()
+        threading.Thread(target=self.load_devices, name='devices', daemon=True).start()
+
+    def setup_control_server(self):
+        if not self.settings.get('control_enabled', CONTROL_ENABLED):
+            return
+        self.control_server = ControlServer(self.board, self.settings.get('control_address', CONTROL_ADDRESS))
+        try:
+            self.control_server.start()
+        except OSError as e:
+            logging.error(f"Could not start the control server: {e}")
+            self.control_server = None
+
+    def load_devices(self):
+        """Device thread: PortAudio's initialisation and enumeration can take a noticeable while."""
+        try:
+            with startup.phase('audio devices'):
+                audio = pyaudio.PyAudio()
+                devices = DeviceRegistry(audio)
+        except Exception as e:
+            logging.error(f"Error initialising audio devices: {e}")
+            audio = devices = None
+        self.devices_loaded.emit(audio, devices)
+
+    @pyqtSlot(object, object)
+    def on_devices_loaded(self, audio, devices):
+        if self.closing:
+            if audio:
+                audio.terminate()
+            return
+        if audio is None:
+            QMessageBox.critical(self, "Audio Setup Error", "Failed to initialise the audio system.")
+            return
+        self.board.open_devices(audio, devices)
+        self.virtual_cables = self.get_virtual_cables()
+        self.selected_virtual_cable = self.get_default_virtual_cable()
+        self.fill_virtual_cable_combo()
+        with startup.phase('audio routing'):
+            self.setup_audio_routing()
+        self.setup_device_monitor()
+        # Decoding waits for the negotiated format, so nothing is decoded twice
+        self.start_prewarm()
+        self.queue_analysis([s for s, info in self.sounds.items() if 'loudness' not in info])
+        startup.report()
 
     def init_ui(self):
         self.setWindowTitle('Virtual Sound Board')
@@ -69,20 +170,20 @@ class SoundPlayer(QWidget):
             QPushButton:hover {
                 background-color: #2980b9;
             }
-            QListWidget {
+            QListView {
                 background-color: #34495e;
                 border: 1px solid #2c3e50;
                 border-radius: 4px;
                 padding: 5px;
             }
-            QListWidget::item {
+            QListView::item {
                 background-color: #34495e;
                 color: #ecf0f1;
                 padding: 5px;
                 margin: 2px 0;
                 border-radius: 2px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #3498db;
             }
             QLineEdit, QComboBox {
@@ -109,23 +210,27 @@ class SoundPlayer(QWidget):
         search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search sounds...")
-        self.search_input.textChanged.connect(self.filter_sounds)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.filter_sounds)
+        self.search_input.textChanged.connect(lambda text: self.search_timer.start())
         search_layout.addWidget(self.search_input, 3)
         
         self.sort_combo = QComboBox()
-        self.sort_combo.addItems(["Name (A-Z)", "Name (Z-A)", "Favorites First", "Most Played"])
+        self.sort_combo.addItems(SORT_MODES)
         self.sort_combo.currentIndexChanged.connect(self.sort_sound_list)
         search_layout.addWidget(self.sort_combo, 1)
         
         main_layout.addLayout(search_layout)
         
-        self.sound_list = QListWidget()
-        self.sound_list.setDragDropMode(QListWidget.InternalMove)
-        self.sound_list.itemDoubleClicked.connect(self.play_selected_sound)
-        self.sound_list.itemClicked.connect(self.update_hotkey_button_text)
-        self.sound_list.setAcceptDrops(True)
-        self.sound_list.setDragEnabled(True)
-        self.sound_list.setDropIndicatorShown(True)
+        self.sound_model = SoundListModel(self.sounds, self)
+        self.sound_proxy = SoundSortProxy(self)
+        self.sound_proxy.setSourceModel(self.sound_model)
+        self.sound_list = QListView()
+        self.sound_list.setModel(self.sound_proxy)
+        self.sound_list.setUniformItemSizes(True)
+        self.sound_list.doubleClicked.connect(self.play_selected_sound)
+        self.sound_list.clicked.connect(self.update_hotkey_button_text)
         main_layout.addWidget(self.sound_list)
         
         button_layout = QHBoxLayout()        
@@ -133,6 +238,15 @@ class SoundPlayer(QWidget):
         add_button.clicked.connect(self.add_sound_file)
         button_layout.addWidget(add_button)
         
+        import_folder_button = QPushButton(QIcon("add_icon.png"), "Import Folder")
+        import_folder_button.clicked.connect(self.import_sound_folder)
+        button_layout.addWidget(import_folder_button)
+        
+        self.cancel_import_button = QPushButton("Cancel Import")
+        self.cancel_import_button.clicked.connect(self.cancel_import)
+        self.cancel_import_button.hide()
+        button_layout.addWidget(self.cancel_import_button)
+        
         play_button = QPushButton(QIcon("play_icon.png"), "Play")
         play_button.clicked.connect(self.play_selected_sound)
         button_layout.addWidget(play_button)
@@ -152,15 +266,7 @@ class SoundPlayer(QWidget):
         input_device_layout = QHBoxLayout()
         input_device_label = QLabel("Virtual Cable (8 Input Channels):")
         self.virtual_cable_combo = QComboBox()
-        
-        for device in self.virtual_cables:
-            self.virtual_cable_combo.addItem(f"{device['name']}")
-        
-        if not self.virtual_cables:
-            self.virtual_cable_combo.addItem("No compatible virtual cables detected")
-            self.virtual_cable_combo.setEnabled(False)
-        
-        self.virtual_cable_combo.setCurrentIndex(self.get_default_virtual_cable_index())
+        self.fill_virtual_cable_combo()
         self.virtual_cable_combo.currentIndexChanged.connect(self.on_virtual_cable_changed)
         input_device_layout.addWidget(input_device_label)
         input_device_layout.addWidget(self.virtual_cable_combo)
@@ -170,73 +276,47 @@ class SoundPlayer(QWidget):
         favorite_button.clicked.connect(self.toggle_favorite)
         button_layout.addWidget(favorite_button)
         
+        self.record_button = QPushButton("Record")
+        self.record_button.setCheckable(True)
+        self.record_button.toggled.connect(self.toggle_recording)
+        button_layout.addWidget(self.record_button)
+        
         main_layout.addLayout(button_layout)
         
+        self.status_label = QLabel("")
+        main_layout.addWidget(self.status_label)
+        
+        self.telemetry_label = QLabel("")
+        self.telemetry_label.setStyleSheet("font-family: Consolas, monospace; font-size: 11px; color: #95a5a6;")
+        main_layout.addWidget(self.telemetry_label)
+        
         self.setLayout(main_layout)
         
-    def setup_virtual_cable(self):
-        def audio_callback(in_data, frame_count, time_info, status):
-            in_data_array = np.frombuffer(in_data, dtype=np.int16)
-            
-            if self.is_playing_sound and len(self.current_sound_data) > 0:
-                if len(self.current_sound_data) >= len(in_data_array):
-                    sound_chunk = self.current_sound_data[:len(in_data_array)]
-                    self.current_sound_data = self.current_sound_data[len(in_data_array):]
-                else:
-                    sound_chunk = np.pad(self.current_sound_data, (0, len(in_data_array) - len(self.current_sound_data)))
-                    self.current_sound_data = np.array([], dtype=np.int16)
-
-                mixed_audio = np.clip(in_data_array.astype(np.int32) + sound_chunk.astype(np.int32), -32768, 32767).astype(np.int16)
-            else:
-                mixed_audio = in_data_array
-                self.is_playing_sound = False
-
-            return (mixed_audio.tobytes(), pyaudio.paContinue)
-
-        input_device_index = self.selected_input_device['index']
-        output_device_index = self.get_vb_cable_output_index()
-
-        if output_device_index is None:
-            QMessageBox.warning(self, "VB-Cable Not Found", 
-                                "VB-Cable was not detected. Please install it for proper audio routing.")
-            output_device_index = self.audio.get_default_output_device_info()['index']
-
-        self.virtual_cable = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=44100,
-            input=True,
-            output=True,
-            input_device_index=input_device_index,
-            output_device_index=output_device_index,
-            stream_callback=audio_callback,
-            frames_per_buffer=CHUNK
-        )
-        self.virtual_cable.start_stream()
-
-        self.virtual_cable = self.audio.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=44100,
-            input=True,
-            output=True,
-            input_device_index=self.selected_input_device['index'],
-            stream_callback=audio_callback,
-            frames_per_buffer=CHUNK
-        )
-        self.virtual_cable.start_stream()
+    def fill_virtual_cable_combo(self):
+        combo = self.virtual_cable_combo
+        combo.blockSignals(True)
+        combo.clear()
+        for device in self.virtual_cables:
+            combo.addItem(f"{device['name']}")
         
+        if self.devices is None:
+            combo.addItem("Detecting audio devices...")
+        elif not self.virtual_cables:
+            combo.addItem("No compatible virtual cables detected")
+        combo.setEnabled(bool(self.virtual_cables))
+        
+        if self.selected_virtual_cable in self.virtual_cables:
+            combo.setCurrentIndex(self.virtual_cables.index(self.selected_virtual_cable))
+        else:
+            combo.setCurrentIndex(self.get_default_virtual_cable_index())
+        combo.blockSignals(False)
+
     def get_vb_cable_output_index(self):
-        for i in range(self.audio.get_device_count()):
-            dev_info = self.audio.get_device_info_by_index(i)
-            if "CABLE Input" in dev_info['name']:
-                return i
-        return None
+        return self.board.find_cable_output()
         
     def get_virtual_cables(self):
         virtual_cables = []
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
+        for device_info in self.devices.devices:
             if self.is_virtual_cable(device_info['name']) and device_info['maxInputChannels'] == 8:
                 virtual_cables.append(device_info)
                 logging.info(f"Detected valid virtual cable: {device_info['name']}")
@@ -265,218 +345,382 @@ class SoundPlayer(QWidget):
             return self.virtual_cables.index(default_cable)
         return 0
 
+    def get_cable_output_index(self):
+        cable = self.selected_virtual_cable
+        if cable and cable['maxOutputChannels'] > 0:
+            return cable['index']
+        return self.get_vb_cable_output_index()
+
     def on_virtual_cable_changed(self, index):
         self.selected_virtual_cable = self.virtual_cables[index]
         print(f"Selected virtual cable: {self.selected_virtual_cable['name']}")
-        self.setup_audio_routing()
+        cable_index = self.get_cable_output_index()
+        if cable_index is None:
+            return
+        try:
+            # Only the cable stream moves; the mic and speaker keep playing
+            self.engine.reopen_route('cable', cable_index)
+            self.fallback_routes.pop('cable', None)
+            self.degraded_routes.discard('cable')
+        except Exception as e:
+            logging.error(f"Error switching virtual cable: {e}")
+            QMessageBox.critical(self, "Audio Setup Error", f"Failed to switch virtual cable: {str(e)}")
 
-    def on_input_device_changed(self, index):
-        self.selected_input_device = self.input_devices[index]
-        print(f"Selected input device: {self.selected_input_device['name']}")
-        self.setup_virtual_cable()
+    def filter_sounds(self):
+        self.sound_proxy.set_filter_text(self.search_input.text())
 
-    def filter_sounds(self, text):
-        for i in range(self.sound_list.count()):
-            item = self.sound_list.item(i)
-            item.setHidden(text.lower() not in item.text().lower())
+    def selected_sound(self):
+        index = self.sound_list.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(FilenameRole)
 
     def setup_file_watcher(self):
+        os.makedirs(SOUNDS_DIR, exist_ok=True)
+        self.scanner = DirectoryScanner(SOUNDS_DIR, self.settings.get('scan_debounce_ms', SCAN_DEBOUNCE_MS), self)
+        self.scanner.changed.connect(self.on_sounds_scanned)
+        # The first scan has an empty snapshot, so it imports files added while the app was closed
+        self.scanner.scan()
         self.file_watcher = QFileSystemWatcher([SOUNDS_DIR])
         self.file_watcher.directoryChanged.connect(self.on_sounds_dir_changed)
         
     def setup_audio_routing(self):
-        if self.input_stream:
-            self.input_stream.stop_stream()
-            self.input_stream.close()
-        if hasattr(self, 'virtual_cable_stream') and self.virtual_cable_stream:
-            self.virtual_cable_stream.stop_stream()
-            self.virtual_cable_stream.close()
-        if hasattr(self, 'speaker_stream') and self.speaker_stream:
-            self.speaker_stream.stop_stream()
-            self.speaker_stream.close()
+        self.board.close_routing()
         
-        mic_device_index = self.audio.get_default_input_device_info()['index']
-        virtual_cable_output_index = self.get_vb_cable_output_index()
+        self.fallback_routes = {}
+        self.degraded_routes = set()
+        mic_device_index = self.devices.default_input
+        virtual_cable_output_index = self.get_cable_output_index()
         if virtual_cable_output_index is None:
             QMessageBox.warning(self, "VB-Cable Not Found", 
                                 "VB-Cable was not detected. Please install it for proper audio routing.")
-            virtual_cable_output_index = self.audio.get_default_output_device_info()['index']
-        default_output_device_index = self.audio.get_default_output_device_info()['index']
-        
-        def audio_callback(in_data, frame_count, time_info, status):
-            in_data_array = np.frombuffer(in_data, dtype=np.int16)
-            
-            if self.is_playing_sound and len(self.current_sound_data) > 0:
-                if len(self.current_sound_data) >= len(in_data_array):
-                    sound_chunk = self.current_sound_data[:len(in_data_array)]
-                    self.current_sound_data = self.current_sound_data[len(in_data_array):]
-                else:
-                    sound_chunk = np.pad(self.current_sound_data, (0, len(in_data_array) - len(self.current_sound_data)))
-                    self.current_sound_data = np.array([], dtype=np.int16)
-                mixed_audio = np.clip(in_data_array.astype(np.int32) + sound_chunk.astype(np.int32), -32768, 32767).astype(np.int16)
-            else:
-                mixed_audio = in_data_array
-                self.is_playing_sound = False
-            
-            try:
-                self.virtual_cable_stream.write(mixed_audio.tobytes())
-                self.speaker_stream.write(mixed_audio.tobytes())
-            except Exception as e:
-                logging.error(f"Error writing to output streams: {e}")
-            
-            return (None, pyaudio.paContinue)
+            virtual_cable_output_index = self.devices.default_output
+            self.fallback_routes['cable'] = None
+        default_output_device_index = self.devices.default_output
+        if mic_device_index is None or default_output_device_index is None:
+            logging.error("No default input or output device")
+            QMessageBox.critical(self, "Audio Setup Error", "No default input or output device was found.")
+            return
         
         try:
-            # Open the output streams
-            self.virtual_cable_stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=44100,
-                output=True,
-                output_device_index=virtual_cable_output_index,
-                frames_per_buffer=CHUNK
-            )
-            self.speaker_stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=44100,
-                output=True,
-                output_device_index=default_output_device_index,
-                frames_per_buffer=CHUNK
-            )
-            # Open the input stream
-            self.input_stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=44100,
-                input=True,
-                input_device_index=mic_device_index,
-                stream_callback=audio_callback,
-                frames_per_buffer=CHUNK
-            )
-            self.input_stream.start_stream()
+            self.board.open_routing(mic_device_index, virtual_cable_output_index, default_output_device_index)
         except Exception as e:
             logging.error(f"Error setting up audio routing: {e}")
             QMessageBox.critical(self, "Audio Setup Error", 
                                 f"Failed to set up audio routing: {str(e)}")
 
+    def setup_device_monitor(self):
+        self.device_monitor = DeviceMonitor(self.engine, self.devices.names(),
+                                            self.settings.get('device_poll_ms', DEVICE_POLL_MS),
+                                            self.settings.get('device_stall_ms', DEVICE_STALL_MS),
+                                            self.settings.get('device_rescan_ms', DEVICE_RESCAN_MS), self)
+        self.device_monitor.stream_failed.connect(self.on_stream_failed)
+        self.device_monitor.devices_changed.connect(self.on_devices_changed)
+        self.device_monitor.start()
+
+    def stream_device_index(self, name):
+        if name == 'input':
+            return self.engine.input_device_index
+        route = self.engine.route(name)
+        return route.device_index if route else None
+
+    @pyqtSlot(str)
+    def on_stream_failed(self, name):
+        """Move a failed stream to the default device, leaving every other stream untouched."""
+        if name in self.degraded_routes:
+            return
+        failed_index = self.stream_device_index(name)
+        fallback_index = self.devices.default_input if name == 'input' else self.devices.default_output
+        self.fallback_routes.setdefault(name, self.devices.name_of(failed_index))
+        try:
+            if fallback_index is None or fallback_index == failed_index:
+                raise ValueError("no other device to fall back to")
+            if name == 'input':
+                self.engine.reopen_input(fallback_index)
+            else:
+                self.engine.reopen_route(name, fallback_index)
+            logging.info(f"Audio stream '{name}' moved to {self.devices.name_of(fallback_index)}")
+            self.status_label.setText(f"Audio device for '{name}' lost; using {self.devices.name_of(fallback_index)}")
+        except Exception as e:
+            logging.error(f"Could not reopen audio stream '{name}': {e}")
+            self.degraded_routes.add(name)
+            self.status_label.setText(f"Audio device for '{name}' lost; waiting for it to return")
+
+    @pyqtSlot(list, list)
+    def on_devices_changed(self, added, removed):
+        in_use = {self.devices.name_of(self.stream_device_index(name)): name
+                  for name in ['input'] + [route.name for route in self.engine.routes]}
+        wanted = any(name == lost or (lost is None and "CABLE Input" in name)
+                     for lost in self.fallback_routes.values() for name in added)
+        if self.degraded_routes or wanted:
+            # PortAudio only sees new devices after a restart, which closes every stream
+            self.reinit_audio()
+            return
+        for device_name in removed:
+            if device_name in in_use:
+                self.on_stream_failed(in_use[device_name])
+
+    def reinit_audio(self):
+        """Restart PortAudio so it enumerates devices again, then reopen every stream."""
+        logging.info("Re-initialising audio devices")
+        self.board.restart_devices()
+        self.virtual_cables = self.get_virtual_cables()
+        selected = self.selected_virtual_cable and self.selected_virtual_cable['name']
+        self.selected_virtual_cable = next((cable for cable in self.virtual_cables if cable['name'] == selected),
+                                           self.get_default_virtual_cable())
+        self.fill_virtual_cable_combo()
+        self.setup_audio_routing()
+        self.device_monitor.reset()
+
+    def setup_telemetry(self):
+        self.telemetry_timer = QTimer(self)
+        self.telemetry_timer.timeout.connect(self.update_telemetry)
+        self.telemetry_timer.start(TELEMETRY_PANEL_MS)
+
+    def update_telemetry(self):
+        snapshot = self.telemetry.snapshot(self.mixer, self.engine.routes, self.decode_cache)
+        recording = self.board.recording_stats()
+        if recording:
+            snapshot['recording'] = recording
+        self.telemetry_label.setText(format_snapshot(snapshot))
+
+        interval_s = self.settings.get('telemetry_interval_s', TELEMETRY_INTERVAL_S)
+        self.telemetry_ticks += 1
+        if interval_s and self.telemetry_ticks * TELEMETRY_PANEL_MS >= interval_s * 1000:
+            self.telemetry_ticks = 0
+            self.write_telemetry_snapshot(snapshot)
+
+    def write_telemetry_snapshot(self, snapshot):
+        temp_file = TELEMETRY_FILE + '.tmp'
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_file, TELEMETRY_FILE)
+        except OSError as e:
+            logging.error(f"Error writing telemetry snapshot: {e}")
+
     @pyqtSlot(str)
     def on_sounds_dir_changed(self, path):
-        self.refresh_sound_list()
+        self.scanner.schedule()
+
+    @pyqtSlot(list, list, list)
+    def on_sounds_scanned(self, added, removed, modified):
+        for file_name in added:
+            if file_name not in self.sounds:
+                path = os.path.join(SOUNDS_DIR, file_name)
+                self.library.add_sound(file_name, {'path': path, 'title': file_name, 'favorite': False, 'play_count': 0})
+                self.sound_model.add_sound(file_name)
+                self.queue_analysis([file_name])
+                logging.info(f"Imported new sound: {file_name}")
+
+        had_hotkey = False
+        for file_name in removed:
+            if file_name in self.sounds:
+                self.forget_decoded(self.sounds[file_name]['path'])
+                had_hotkey |= file_name in self.hotkeys
+                self.sound_model.remove_sound(file_name)
+                self.library.remove_sound(file_name)
+        if had_hotkey:
+            self.hotkey_engine.rebuild(self.hotkeys)
+
+        modified = [file_name for file_name in modified if file_name in self.sounds]
+        for file_name in modified:
+            self.forget_decoded(self.sounds[file_name]['path'])
+        self.queue_analysis(modified)
+
+    def forget_decoded(self, path):
+        """Drop everything derived from a sound file's old contents."""
+        self.board.forget_decoded(path)
 
     def add_sound_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select Sound File", "", "Sound Files (*.wav *.mp3)")
-        if file_path:
-            file_name = os.path.basename(file_path)
-            destination = os.path.join(SOUNDS_DIR, file_name)
-            os.makedirs(SOUNDS_DIR, exist_ok=True)
-            os.replace(file_path, destination)
-            self.sounds[file_name] = {'path': destination, 'title': file_name, 'favorite': False, 'play_count': 0}
-            self.save_config()
-            self.refresh_sound_list()
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select Sound Files", "", "Sound Files (*.wav *.mp3)")
+        if file_paths:
+            self.import_sounds(file_paths)
+
+    def import_sound_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select Sound Folder")
+        if folder:
+            self.import_sounds([folder])
+
+    def import_sounds(self, paths):
+        """Prepare the sound files in paths (folders included) in the background, then add them all at once."""
+        if self.importer.running:
+            QMessageBox.information(self, 'Import Running', 'Wait for the current import to finish or cancel it.')
+            return
+        sources = []
+        names = set(self.sounds)
+        for source in collect_sound_files(paths):
+            name = os.path.basename(source)
+            if name in names:
+                logging.info(f"Skipping {source}: a sound named {name} already exists")
+                continue
+            names.add(name)
+            sources.append(source)
+        if not sources:
+            self.status_label.setText("No new sounds to import")
+            return
+
+        fmt = self.engine.format
+        self.import_variant = fmt.decode_variant
+        self.importer.max_workers = self.settings.get('import_workers', IMPORT_WORKERS)
+        self.status_label.setText(f"Importing sounds: 0/{len(sources)}")
+        self.cancel_import_button.show()
+        self.importer.start(sources, fmt, self.pcm_cache.directory)
+
+    def cancel_import(self):
+        self.status_label.setText("Cancelling import...")
+        self.importer.cancel()
+
+    @pyqtSlot(int, int)
+    def on_import_progress(self, done, total):
+        if not self.importer.cancelled:
+            self.status_label.setText(f"Importing sounds: {done}/{total}")
+
+    @pyqtSlot(list, int, bool)
+    def on_import_finished(self, results, failed, cancelled):
+        self.cancel_import_button.hide()
+        if cancelled:
+            self.status_label.setText("Import cancelled; no sounds were added")
+            return
+
+        os.makedirs(SOUNDS_DIR, exist_ok=True)
+        added = {}
+        cached = {}
+        for source, loudness, npy_file in results:
+            name = os.path.basename(source)
+            destination = os.path.join(SOUNDS_DIR, name)
+            try:
+                if name in self.sounds or os.path.exists(destination):
+                    raise OSError(f"{destination} already exists")
+                shutil.move(source, destination)
+            except OSError as e:
+                logging.error(f"Error importing {source}: {e}")
+                failed += 1
+                remove_file(npy_file)
+                continue
+            added[name] = {'path': destination, 'title': name, 'favorite': False, 'play_count': 0,
+                           'loudness': loudness}
+            cached[destination] = npy_file
+
+        self.pcm_cache.adopt(cached, self.import_variant)
+        self.library.add_sounds(added)
+        self.sound_model.add_sounds(list(added))
+        message = f"Imported {len(added)} sounds"
+        if failed:
+            message += f" ({failed} failed)"
+        self.status_label.setText(message)
+        logging.info(message)
 
     def delete_selected_sound(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            file_name = selected_item.filename
+        file_name = self.selected_sound()
+        if file_name:
+            title = self.sounds[file_name]['title']
             reply = QMessageBox.question(self, 'Delete Sound', 
-                                         f"Are you sure you want to delete '{selected_item.text()}'?",
+                                         f"Are you sure you want to delete '{title}'?",
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
                 file_path = self.sounds[file_name]['path']
                 os.remove(file_path)
-                del self.sounds[file_name]
-                if file_name in self.hotkeys:
-                    del self.hotkeys[file_name]
-                self.save_config()
-                self.refresh_sound_list()
+                self.forget_decoded(file_path)
+                had_hotkey = file_name in self.hotkeys
+                self.sound_model.remove_sound(file_name)
+                self.library.remove_sound(file_name)
+                if had_hotkey:
+                    self.hotkey_engine.rebuild(self.hotkeys)
                 QMessageBox.information(self, 'Sound Deleted', 
-                                        f'Sound "{selected_item.text()}" has been deleted.',
+                                        f'Sound "{title}" has been deleted.',
                                         QMessageBox.Ok)
 
     def play_selected_sound(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            sound_file = self.sounds[selected_item.filename]['path']
-            self.sounds[selected_item.filename]['play_count'] = self.sounds[selected_item.filename].get('play_count', 0) + 1
-            self.save_config()
-            threading.Thread(target=self.play_audio, args=(sound_file,)).start()
-
-    def play_audio(self, sound_file):
+        sound = self.selected_sound()
+        if sound:
+            self.library.increment_play_count(sound)
+            self.sound_model.update_sound(sound)
+            self.hotkey_engine.dispatch(sound)
+
+    def trigger_sound(self, sound, triggered_at=None):
+        """Runs on the dispatch worker; the mixer applies the retrigger policy."""
         try:
-            file_extension = os.path.splitext(sound_file)[1].lower()
-            
-            if file_extension == '.wav':
-                self.play_wav_with_routing(sound_file)
-            elif file_extension == '.mp3':
-                self.play_mp3_with_routing(sound_file)
-            else:
-                logging.error(f"Unsupported file format: {file_extension}")
+            self.board.trigger(sound, triggered_at=triggered_at)
         except Exception as e:
             logging.error(f"Error playing audio: {e}")
-            
-    def play_wav_with_routing(self, sound_file):
-        with wave.open(sound_file, 'rb') as wf:
-            self.current_sound_data = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
-        self.is_playing_sound = True
-
-    def play_wav(self, sound_file):
-        wf = wave.open(sound_file, 'rb')
-        self.stream = self.audio.open(format=self.audio.get_format_from_width(wf.getsampwidth()),
-                                      channels=wf.getnchannels(),
-                                      rate=wf.getframerate(),
-                                      output=True)
-        data = wf.readframes(CHUNK)
-        while data:
-            self.stream.write(data)
-            data = wf.readframes(CHUNK)
-        self.stream.stop_stream()
-        self.stream.close()
-        wf.close()
-    
-    def play_mp3_with_routing(self, sound_file):
-        try:
-            audio = mutagen.File(sound_file)
-            if audio is None:
-                raise ValueError("Could not read audio file metadata")
-            
-            with silence_pygame():
-                pygame.mixer.init(frequency=44100, channels=1)  # Force mono
-                sound = pygame.mixer.Sound(sound_file)
-                array_sound = pygame.sndarray.samples(sound)
-                if array_sound.ndim > 1:
-                    array_sound = array_sound.mean(axis=1)  # Convert stereo to mono
-                self.current_sound_data = array_sound.astype(np.int16)
-            self.is_playing_sound = True
 
+    def queue_analysis(self, sounds):
+        for sound in sounds:
+            self.analysis_pool.submit(self.analyze_sound, sound)
+
+    def analyze_sound(self, sound):
+        """Runs on the analysis worker; stores the loudness measurements in the library."""
+        info = self.sounds.get(sound)
+        if info is None:
+            return
+        try:
+            fmt = self.engine.format
+            loudness = analyze(self.board.decode_sound_file(info['path'], fmt), fmt.rate, fmt.channels)
         except Exception as e:
-            logging.error(f"Error playing MP3 with routing: {e}")
-            
-    def get_loopback_device_index(self):
-        for i in range(self.audio.get_device_count()):
-            dev_info = self.audio.get_device_info_by_index(i)
-            if "virtual audio cable" in dev_info['name'].lower():
-                return i
-        return None
-    
-    def get_default_output_device_index(self):
-        return self.audio.get_default_output_device_info()['index']
+            logging.warning(f"Loudness analysis failed for {sound}: {e}")
+            return
+        # The sound may have been removed meanwhile; the library checks under its lock
+        if self.library.update_sound(sound, loudness=loudness):
+            logging.debug(f"Analyzed {sound}: {loudness}")
+
+    def prewarm_sound(self, sound_file):
+        # Streamed sounds are never held in the decode cache
+        if not self.board.is_streamed(sound_file):
+            self.board.load_sound_data(sound_file)
+
+    def get_prewarm_paths(self):
+        """Hotkeyed sounds first, then favorites, then the most played."""
+        top_played = self.settings.get('prewarm_top_played', PREWARM_TOP_PLAYED)
+        most_played = sorted(self.sounds, key=lambda s: self.sounds[s].get('play_count', 0), reverse=True)
+        ordered = list(self.hotkeys)
+        ordered += [s for s, info in self.sounds.items() if info.get('favorite', False)]
+        ordered += most_played[:top_played]
+
+        paths = []
+        for sound in dict.fromkeys(ordered):
+            if sound not in self.sounds:
+                continue
+            path = self.sounds[sound]['path']
+            if os.path.exists(path) and not self.decode_cache.contains(path, self.engine.format.decode_variant):
+                paths.append(path)
+        return paths
+
+    def start_prewarm(self):
+        self.prewarmer = Prewarmer(self.prewarm_sound,
+                                   max_workers=self.settings.get('prewarm_workers', PREWARM_WORKERS),
+                                   parent=self)
+        self.prewarmer.progress.connect(self.on_prewarm_progress)
+        self.prewarmer.finished.connect(self.on_prewarm_finished)
+        self.prewarmer.start(self.get_prewarm_paths())
+
+    @pyqtSlot(int, int)
+    def on_prewarm_progress(self, done, total):
+        self.status_label.setText(f"Pre-loading sounds: {done}/{total}")
+
+    @pyqtSlot(int, int)
+    def on_prewarm_finished(self, loaded, failed):
+        if failed:
+            self.status_label.setText(f"Pre-loaded {loaded} sounds ({failed} failed)")
+        else:
+            self.status_label.setText(f"Pre-loaded {loaded} sounds")
 
     def assign_hotkey(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            sound_file = selected_item.filename
+        sound_file = self.selected_sound()
+        if sound_file:
             current_hotkey = self.hotkeys.get(sound_file, "")
             self.hotkey_dialog = HotkeyDialog(current_hotkey, self)
             
             self.current_keys.clear()            
-            self.hotkey_listener = pynput_keyboard.Listener(on_press=self.on_hotkey_press, on_release=self.on_hotkey_release)
+            self.hotkey_listener = load_keyboard().Listener(on_press=self.on_hotkey_press, on_release=self.on_hotkey_release)
             self.hotkey_listener.start()
             result = self.hotkey_dialog.exec_()
             self.hotkey_listener.stop()
             
             if result == QDialog.Accepted:
                 self.finish_hotkey_assignment(sound_file)
+            self.hotkey_dialog = None
+            self.current_keys.clear()
 
     def on_hotkey_press(self, key):
         if self.hotkey_dialog:
@@ -496,110 +740,56 @@ class SoundPlayer(QWidget):
                 self.current_keys.discard(key_str)
 
     def key_to_string(self, key):
-        """Convert a key press event to a string representation, including modifier keys."""
-        if isinstance(key, pynput_keyboard.KeyCode):
-            if key.vk is not None:
-                if key.vk == 17:  # Ctrl key
-                    return 'Ctrl'
-                elif key.vk == 16:  # Shift key
-                    return 'Shift'
-                elif key.vk == 18:  # Alt key
-                    return 'Alt'
-                elif 65 <= key.vk <= 90:  # A-Z keys
-                    return chr(key.vk)
-                elif 96 <= key.vk <= 105:  # Numpad keys
-                    return f'Numpad{key.vk - 96}'
-                else:
-                    return f'VK_{key.vk}'
-            elif key.char:
-                return key.char.upper()
-            return None
-        elif isinstance(key, pynput_keyboard.Key):
-            if key == pynput_keyboard.Key.ctrl or key == pynput_keyboard.Key.ctrl_l or key == pynput_keyboard.Key.ctrl_r:
-                return 'Ctrl'
-            elif key == pynput_keyboard.Key.alt or key == pynput_keyboard.Key.alt_l or key == pynput_keyboard.Key.alt_r:
-                return 'Alt'
-            elif key == pynput_keyboard.Key.shift or key == pynput_keyboard.Key.shift_l or key == pynput_keyboard.Key.shift_r:
-                return 'Shift'
-            elif key == pynput_keyboard.Key.space:
-                return 'Space'
-            elif key == pynput_keyboard.Key.enter:
-                return 'Enter'
-            elif hasattr(key, 'name'):
-                return key.name.capitalize()
-            else:
-                return str(key).replace('Key.', '').capitalize()
-        return None
+        return key_to_string(key)
 
     def finish_hotkey_assignment(self, sound_file):
         hotkey_str = '+'.join(sorted(self.hotkey_dialog.current_hotkey))
         if hotkey_str:
-            self.hotkeys[sound_file] = hotkey_str
-            self.save_config()
+            self.library.set_hotkey(sound_file, hotkey_str)
+            self.hotkey_engine.rebuild(self.hotkeys)
             QMessageBox.information(self, 'Hotkey Assigned', 
                                     f'Hotkey "{hotkey_str}" assigned to "{self.sounds[sound_file]["title"]}"',
                                     QMessageBox.Ok)
         else:
             if sound_file in self.hotkeys:
-                del self.hotkeys[sound_file]
-                self.save_config()
+                self.library.remove_hotkey(sound_file)
+                self.hotkey_engine.rebuild(self.hotkeys)
                 QMessageBox.information(self, 'Hotkey Removed', 
                                         f'Hotkey removed from "{self.sounds[sound_file]["title"]}"',
                                         QMessageBox.Ok)
         self.update_hotkey_button_text()
 
     def update_hotkey_button_text(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            sound_file = selected_item.filename
+        sound_file = self.selected_sound()
+        if sound_file:
             if sound_file in self.hotkeys:
                 self.assign_hotkey_button.setText(f'Reassign Hotkey ({self.hotkeys[sound_file]})')
             else:
                 self.assign_hotkey_button.setText('Assign Hotkey')
 
     def load_config(self):
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                config = json.load(f)
-                self.sounds = config.get('sounds', {})
-                self.hotkeys = config.get('hotkeys', {})
-            
-            for sound, value in self.sounds.items():
-                if isinstance(value, str):
-                    self.sounds[sound] = {
-                        'path': value,
-                        'title': sound,
-                        'favorite': False,
-                        'play_count': 0
-                    }
+        self.library.load()
+        self.sounds = self.library.sounds
+        self.hotkeys = self.library.hotkeys
+        self.settings = self.library.settings
+        self.apply_settings()
         self.refresh_sound_list()
 
+    def apply_settings(self):
+        self.board.apply_settings()
+        self.hotkey_engine.debounce = self.settings.get('hotkey_debounce_ms', HOTKEY_DEBOUNCE_MS) / 1000
+        self.search_timer.setInterval(self.settings.get('search_debounce_ms', SEARCH_DEBOUNCE_MS))
+
     def refresh_sound_list(self):
-        self.sound_list.clear()
-        for sound, info in self.sounds.items():
-            title = info['title']
-            favorite = info.get('favorite', False)
-            item = SoundItem(title, sound, favorite)
-            self.sound_list.addItem(item)
-        
         for sound in list(self.sounds.keys()):
             path = self.sounds[sound]['path']
             if not os.path.exists(path):
-                del self.sounds[sound]
-                if sound in self.hotkeys:
-                    del self.hotkeys[sound]
+                self.library.remove_sound(sound)
+        self.hotkey_engine.rebuild(self.hotkeys)
         
-        self.save_config()
+        self.sound_model.set_sounds(self.sounds)
         self.sort_sound_list()
 
-    def save_config(self):
-        config = {
-            'sounds': self.sounds,
-            'hotkeys': self.hotkeys
-        }
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f)
-
     def setup_keyboard_listener(self):
         def on_press(key):
             # print(key)
@@ -607,7 +797,8 @@ class SoundPlayer(QWidget):
                 return
 
             key_str = self.key_to_string(key)
-            if key_str:
+            # Auto-repeat re-sends held keys; only a newly pressed key can complete a hotkey
+            if key_str and key_str not in self.current_keys:
                 self.current_keys.add(key_str)
                 self.check_hotkeys()
 
@@ -616,20 +807,16 @@ class SoundPlayer(QWidget):
             if key_str and key_str in self.current_keys:
                 self.current_keys.discard(key_str)
 
-        self.listener = pynput_keyboard.Listener(on_press=on_press, on_release=on_release)
+        self.listener = load_keyboard().Listener(on_press=on_press, on_release=on_release)
         self.listener.start()
 
     def check_hotkeys(self):
-        for sound, hotkey in self.hotkeys.items():
-            expected_keys = set(hotkey.split('+'))
-            if expected_keys == self.current_keys:
-                threading.Thread(target=self.play_audio, args=(self.sounds[sound]['path'],)).start()
-                return
+        self.hotkey_engine.match(self.current_keys)
 
     def rename_sound(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            current_title = selected_item.text()
+        sound = self.selected_sound()
+        if sound:
+            current_title = self.sounds[sound]['title']
             dialog = QInputDialog(self)
             dialog.setWindowTitle('Rename Sound')
             dialog.setLabelText('Enter new title:')
@@ -641,50 +828,59 @@ class SoundPlayer(QWidget):
             if dialog.exec_() == QDialog.Accepted:
                 new_title = dialog.textValue()
                 if new_title and new_title != current_title:
-                    self.sounds[selected_item.filename]['title'] = new_title
-                    selected_item.setText(new_title)
-                    self.save_config()
-                    self.sort_sound_list()
+                    self.library.update_sound(sound, title=new_title)
+                    self.sound_model.update_sound(sound)
                     QMessageBox.information(self, 'Sound Renamed', 
                                             f'Sound renamed from "{current_title}" to "{new_title}"',
                                             QMessageBox.Ok)
 
     def toggle_favorite(self):
-        selected_item = self.sound_list.currentItem()
-        if selected_item:
-            selected_item.is_favorite = not selected_item.is_favorite
-            self.sounds[selected_item.filename]['favorite'] = selected_item.is_favorite
-            selected_item.update_icon()
-            self.save_config()
-            self.sort_sound_list()
-            status = "added to" if selected_item.is_favorite else "removed from"
+        sound = self.selected_sound()
+        if sound:
+            is_favorite = not self.sounds[sound].get('favorite', False)
+            self.library.update_sound(sound, favorite=is_favorite)
+            self.sound_model.update_sound(sound)
+            status = "added to" if is_favorite else "removed from"
             QMessageBox.information(self, 'Favorite Updated', 
-                                    f'"{selected_item.text()}" has been {status} favorites.',
+                                    f'"{self.sounds[sound]["title"]}" has been {status} favorites.',
                                     QMessageBox.Ok)
 
+    def toggle_recording(self, checked):
+        """Record what goes out on the cable and speakers to the recordings folder."""
+        if checked:
+            try:
+                path = self.board.start_recording()
+            except OSError as e:
+                logging.error(f"Error starting the recording: {e}")
+                QMessageBox.warning(self, "Recording Error", f"Could not start recording: {e}")
+                self.record_button.setChecked(False)
+                return
+            self.record_button.setText("Stop Recording")
+            self.status_label.setText(f"Recording to {path}")
+        else:
+            paths = self.board.stop_recording()
+            self.record_button.setText("Record")
+            if paths:
+                self.status_label.setText(f"Recording saved to {', '.join(paths)}")
+
     def sort_sound_list(self):
-        sort_option = self.sort_combo.currentText()
-        items = []
-        for i in range(self.sound_list.count()):
-            item = self.sound_list.takeItem(0)
-            items.append(item)
-        
-        if sort_option == "Name (A-Z)":
-            items.sort(key=lambda x: x.text().lower())
-        elif sort_option == "Name (Z-A)":
-            items.sort(key=lambda x: x.text().lower(), reverse=True)
-        elif sort_option == "Favorites First":
-            items.sort(key=lambda x: (not x.is_favorite, x.text().lower()))
-        elif sort_option == "Most Played":
-            items.sort(key=lambda x: self.sounds[x.filename].get('play_count', 0), reverse=True)
-        
-        for item in items:
-            self.sound_list.addItem(item)
+        self.sound_proxy.set_mode(self.sort_combo.currentText())
 
     def closeEvent(self, event):
-        self.listener.stop()
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-        self.audio.terminate()
+        self.closing = True
+        self.importer.cancel()
+        self.telemetry_timer.stop()
+        if self.device_monitor:
+            self.device_monitor.stop()
+        self.hotkey_engine.stop()
+        self.analysis_pool.shutdown(wait=False, cancel_futures=True)
+        if self.prewarmer:
+            self.prewarmer.cancel()
+        if self.listener:
+            self.listener.stop()
+        if self.control_server:
+            self.control_server.stop()
+        self.board.close()
+        # After the board, which saves the routes' adapted latencies into the library
+        self.library.close()
         event.accept()
\ No newline at end of file
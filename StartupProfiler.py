@@ -0,0 +1,54 @@
+import time
+import logging
+import threading
+import contextlib
+
+class StartupProfiler:
+    """Wall-clock time of each startup phase, measured from when this module was first imported.
+
+    Phases can run on any thread. report() logs them once, in the order they
+    started, with the thread each ran on, so it shows what the window waited
+    for and what happened in the background.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.lock = threading.Lock()
+        self.reported = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter())
+
+    def mark(self, name):
+        """A milestone with no duration, e.g. the window becoming visible."""
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def record(self, name, started, ended):
+        with self.lock:
+            self.phases.append({
+                'phase': name,
+                'start_ms': (started - self.started) * 1000,
+                'duration_ms': (ended - started) * 1000,
+                'thread': threading.current_thread().name,
+            })
+
+    def report(self):
+        """Log the phases recorded so far (only the first call logs) and return them."""
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase['start_ms'])
+            if self.reported:
+                return phases
+            self.reported = True
+        lines = [f"{p['phase']:<22} at {p['start_ms']:8.1f} ms  took {p['duration_ms']:8.1f} ms  [{p['thread']}]"
+                 for p in phases]
+        logging.info("Startup profile:\n" + "\n".join(lines))
+        return phases
+
+startup = StartupProfiler()
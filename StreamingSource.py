@@ -0,0 +1,45 @@
+import time
+import threading
+import logging
+from RingBuffer import RingBuffer
+from SoundDecoder import iter_sound_blocks
+from util import SAMPLE_RATE, STREAM_BLOCK_FRAMES, STREAM_RING_FRAMES
+
+class StreamingSource:
+    """Decodes a long sound block by block into a small read-ahead ring.
+
+    Playback can start as soon as the first block lands in the ring, and memory
+    use stays at one block plus the ring no matter how long the file is.
+    """
+    poll_interval = 0.005
+
+    def __init__(self, path, rate=SAMPLE_RATE, block_frames=STREAM_BLOCK_FRAMES, ring_frames=STREAM_RING_FRAMES,
+                 channels=1, ring=None):
+        self.path = path
+        self.rate = rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.ring = ring if ring is not None else RingBuffer(ring_frames * channels)
+        self.thread = threading.Thread(target=self._run, name=f"stream-{path}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.ring.cancel()
+
+    def _run(self):
+        try:
+            for block in iter_sound_blocks(self.path, self.rate, self.block_frames, self.channels):
+                offset = 0
+                while offset < len(block):
+                    if self.ring.cancelled:
+                        return
+                    offset += self.ring.write(block[offset:])
+                    if offset < len(block):
+                        time.sleep(self.poll_interval)
+        except Exception as e:
+            logging.error(f"Error streaming {self.path}: {e}")
+        finally:
+            self.ring.close()
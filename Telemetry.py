@@ -0,0 +1,137 @@
+import os
+import time
+import pyaudio
+from util import SAMPLE_RATE, TELEMETRY_BINS_PER_BUDGET, TELEMETRY_MAX_BUDGETS, TELEMETRY_LATENCY_HISTORY
+
+class Telemetry:
+    """Counters for the real-time audio path.
+
+    The record_* methods run on audio threads, so they only bump preallocated
+    counters and list slots: no logging, no locks, no container growth.
+    Everything expensive (percentiles, formatting) happens in snapshot(),
+    which is called from the GUI thread.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE):
+        self.rate = rate
+        # Callback time histogram, in 1/TELEMETRY_BINS_PER_BUDGET steps of the block's time budget
+        self.callback_hist = [0] * (TELEMETRY_BINS_PER_BUDGET * TELEMETRY_MAX_BUDGETS + 1)
+        self.callbacks = 0
+        self.overruns = 0
+        self.max_callback_ratio = 0.0
+        self.last_budget = 0.0
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self.active_voices = 0
+        self.peak_voices = 0
+        self.latencies = [0.0] * TELEMETRY_LATENCY_HISTORY
+        self.latency_count = 0
+        self.started = time.time()
+
+    def record_callback(self, started, frames, status, active_voices):
+        """Call at the end of the mic callback with the perf_counter() taken at its start."""
+        budget = frames / self.rate
+        ratio = (time.perf_counter() - started) / budget
+        index = int(ratio * TELEMETRY_BINS_PER_BUDGET)
+        last = len(self.callback_hist) - 1
+        self.callback_hist[index if index < last else last] += 1
+        self.callbacks += 1
+        self.last_budget = budget
+        if ratio > 1.0:
+            self.overruns += 1
+        if ratio > self.max_callback_ratio:
+            self.max_callback_ratio = ratio
+
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if status & pyaudio.paInputUnderflow:
+            self.input_underflows += 1
+
+        self.active_voices = active_voices
+        if active_voices > self.peak_voices:
+            self.peak_voices = active_voices
+
+    def record_trigger_latency(self, seconds):
+        """Time from a trigger being accepted to its voice's first block entering the mix."""
+        self.latencies[self.latency_count % len(self.latencies)] = seconds
+        self.latency_count += 1
+
+    def callback_percentile(self, q):
+        """Callback time as a fraction of its budget at quantile q, from the histogram."""
+        hist = list(self.callback_hist)
+        total = sum(hist)
+        if not total:
+            return 0.0
+        target = q * total
+        seen = 0
+        for index, count in enumerate(hist):
+            seen += count
+            if seen >= target:
+                return (index + 1) / TELEMETRY_BINS_PER_BUDGET
+        return len(hist) / TELEMETRY_BINS_PER_BUDGET
+
+    def latency_percentile(self, q):
+        count = min(self.latency_count, len(self.latencies))
+        if not count:
+            return None
+        values = sorted(self.latencies[:count])
+        return values[min(count - 1, int(q * count))]
+
+    def snapshot(self, mixer=None, routes=(), cache=None):
+        latency_p50 = self.latency_percentile(0.5)
+        latency_p99 = self.latency_percentile(0.99)
+        snapshot = {
+            'timestamp': time.time(),
+            'uptime_s': time.time() - self.started,
+            'callback': {
+                'count': self.callbacks,
+                'budget_ms': self.last_budget * 1000,
+                'p50_budget': self.callback_percentile(0.5),
+                'p99_budget': self.callback_percentile(0.99),
+                'max_budget': self.max_callback_ratio,
+                'overruns': self.overruns,
+                'histogram': list(self.callback_hist),
+                'histogram_bin_budget': 1 / TELEMETRY_BINS_PER_BUDGET,
+            },
+            'input': {
+                'overflows': self.input_overflows,
+                'underflows': self.input_underflows,
+            },
+            'voices': {
+                'active': mixer.active_count if mixer else self.active_voices,
+                'peak': self.peak_voices,
+            },
+            'limiter_reduction_db': mixer.limiter.reset_stats() if mixer else 0.0,
+            'trigger_latency_ms': {
+                'count': self.latency_count,
+                'p50': latency_p50 * 1000 if latency_p50 is not None else None,
+                'p99': latency_p99 * 1000 if latency_p99 is not None else None,
+            },
+            'outputs': {route.name: route.stats() for route in routes},
+        }
+        if cache is not None:
+            snapshot['decode_cache'] = cache.stats()
+        return snapshot
+
+def format_snapshot(snapshot):
+    """Short multi-line summary of a snapshot for the telemetry panel."""
+    callback = snapshot['callback']
+    latency = snapshot['trigger_latency_ms']
+    lines = [
+        f"Callback p50 {callback['p50_budget']:.0%} / p99 {callback['p99_budget']:.0%} "
+        f"of {callback['budget_ms']:.1f} ms, overruns {callback['overruns']}, "
+        f"input overflows {snapshot['input']['overflows']}",
+        f"Voices {snapshot['voices']['active']} (peak {snapshot['voices']['peak']}), trigger latency "
+        + (f"p50 {latency['p50']:.1f} ms / p99 {latency['p99']:.1f} ms" if latency['p50'] is not None else "n/a")
+        + f", limiter {snapshot['limiter_reduction_db']:.1f} dB",
+    ]
+    for name, route in snapshot['outputs'].items():
+        lines.append(f"{name.capitalize()}: latency {route['latency_ms']} ms, fill {route['fill']} (low {route['low_water']}), "
+                     f"underruns {route['underruns']}, device underflows {route['device_underflows']}, "
+                     f"dropped {route['dropped_frames']}")
+    recording = snapshot.get('recording')
+    if recording:
+        lines.append(f"Recording {os.path.basename(recording['path'])}: {recording['seconds']:.0f} s, "
+                     f"buffered {recording['buffered_s']:.2f} s, dropped {recording['dropped_frames']}"
+                     + (f", failed: {recording['error']}" if recording['error'] else ""))
+    return "\n".join(lines)
@@ -0,0 +1,573 @@
+"""Headless benchmarks for the mixing and playback pipeline.
+
+Drives AudioEngine through a fake PyAudio at the configured CHUNK and rate, so
+no audio devices are needed. Results are written as JSON; pass --compare with
+an earlier results file to flag regressions.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import wave
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from AudioEngine import AudioEngine
+from ControlServer import ControlServer, ControlClient
+from LibraryStore import LibraryStore
+from PcmCache import PcmCache
+from SoundBoard import SoundBoard
+from DecodeCache import DecodeCache
+from Mixer import Mixer
+from SearchIndex import SearchIndex
+from SoundListModel import SoundListModel, SoundSortProxy, SORT_MODES
+from SoundDecoder import decode_sound
+from util import CHUNK, SAMPLE_RATE, SOUNDS_DIR, CABLE_LATENCY_MS, SPEAKER_LATENCY_MS, CONTROL_RTT_TARGET_MS
+
+VOICE_COUNTS = (1, 8, 32)
+WAV_FORMATS = [
+    # (channels, sample width in bytes, rate)
+    (1, 2, 44100),
+    (2, 2, 44100),
+    (2, 2, 48000),
+    (2, 3, 48000),
+    (1, 1, 22050),
+]
+WAV_DURATIONS = (1, 10)
+WARMUP_BLOCKS = 50
+SEARCH_LIBRARY_SIZE = 10000
+CONTROL_BATCH = 16
+BENCH_QUANTIZE_MS = 20
+SEARCH_QUERIES = ('a', 'ho', 'air', 'horn', 'hron', 'sad trom', 'bruh sound effect', 'zzzz', 'Привет', 'ドラム', 'café')
+REGRESSION_THRESHOLD = 1.2
+
+class FakeStream:
+    def __init__(self, callback, frames_per_buffer, is_input, is_output):
+        self.callback = callback
+        self.frames_per_buffer = frames_per_buffer
+        self.is_input = is_input
+        self.is_output = is_output
+        self.active = False
+
+    def start_stream(self):
+        self.active = True
+
+    def stop_stream(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+
+class FakePyAudio:
+    """Stands in for pyaudio.PyAudio; the benchmark calls the stream callbacks itself."""
+
+    def __init__(self):
+        self.streams = []
+
+    def open(self, format, channels, rate, input=False, output=False, input_device_index=None,
+             output_device_index=None, stream_callback=None, frames_per_buffer=CHUNK):
+        stream = FakeStream(stream_callback, frames_per_buffer, input, output)
+        self.streams.append(stream)
+        return stream
+
+    def get_device_info_by_index(self, index):
+        return {'index': index, 'name': f"fake device {index}", 'maxInputChannels': 2, 'maxOutputChannels': 2}
+
+    def is_format_supported(self, rate, **kwargs):
+        return True
+
+    @property
+    def output_streams(self):
+        return [stream for stream in self.streams if stream.is_output]
+
+def synthetic_mic(blocks, frames=CHUNK, rate=SAMPLE_RATE):
+    """A quiet tone plus noise, pre-cut into callback-sized byte blocks."""
+    rng = np.random.default_rng(0)
+    t = np.arange(blocks * frames) / rate
+    signal = 3000 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 300, len(t))
+    data = np.clip(signal, -32768, 32767).astype(np.int16)
+    return [data[i * frames:(i + 1) * frames].tobytes() for i in range(blocks)]
+
+def synthetic_sound(samples, seed=1):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0, 2000, samples).clip(-32768, 32767).astype(np.int16)
+    data.setflags(write=False)
+    return data
+
+def summarize(values, scale=1000.0):
+    """Percentiles of a list of seconds, reported in milliseconds by default."""
+    if not values:
+        return None
+    data = np.asarray(values) * scale
+    return {
+        'mean': float(data.mean()),
+        'p50': float(np.percentile(data, 50)),
+        'p90': float(np.percentile(data, 90)),
+        'p99': float(np.percentile(data, 99)),
+        'max': float(data.max()),
+    }
+
+def make_engine():
+    audio = FakePyAudio()
+    engine = AudioEngine(audio, Mixer(max_voices=max(VOICE_COUNTS)))
+    engine.open(0, [('cable', 1, CABLE_LATENCY_MS), ('speaker', 2, SPEAKER_LATENCY_MS)])
+    return engine, audio
+
+def drive_block(engine, audio, in_data):
+    """Run one mic callback and one callback per output; returns (input_s, output_s)."""
+    started = time.perf_counter()
+    engine.process_input(in_data, CHUNK, {}, 0)
+    input_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for stream in audio.output_streams:
+        stream.callback(None, CHUNK, {}, 0)
+    return input_time, time.perf_counter() - started
+
+def bench_callbacks(blocks):
+    mic = synthetic_mic(blocks + WARMUP_BLOCKS)
+    results = {}
+    for voices in VOICE_COUNTS:
+        engine, audio = make_engine()
+        sound = synthetic_sound((blocks + WARMUP_BLOCKS + 1) * CHUNK)
+        for _ in range(voices):
+            engine.mixer.play(sound, gain=0.2)
+
+        input_times, output_times = [], []
+        for index, in_data in enumerate(mic):
+            input_time, output_time = drive_block(engine, audio, in_data)
+            if index >= WARMUP_BLOCKS:
+                input_times.append(input_time)
+                output_times.append(output_time)
+        results[str(voices)] = {
+            'budget_ms': CHUNK / SAMPLE_RATE * 1000,
+            'input_callback_ms': summarize(input_times),
+            'output_callbacks_ms': summarize(output_times),
+        }
+    return results
+
+def bench_allocations(blocks):
+    """Peak bytes allocated (and since freed) inside each callback, via tracemalloc."""
+    mic = synthetic_mic(blocks + WARMUP_BLOCKS)
+    results = {}
+    for voices in VOICE_COUNTS:
+        engine, audio = make_engine()
+        sound = synthetic_sound((blocks + WARMUP_BLOCKS + 1) * CHUNK)
+        for _ in range(voices):
+            engine.mixer.play(sound, gain=0.2)
+        for in_data in mic[:WARMUP_BLOCKS]:
+            drive_block(engine, audio, in_data)
+
+        input_bytes, output_bytes = [], []
+        tracemalloc.start()
+        start_current, _ = tracemalloc.get_traced_memory()
+        for in_data in mic[WARMUP_BLOCKS:]:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            engine.process_input(in_data, CHUNK, {}, 0)
+            _, peak = tracemalloc.get_traced_memory()
+            input_bytes.append(peak - before)
+
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            for stream in audio.output_streams:
+                stream.callback(None, CHUNK, {}, 0)
+            _, peak = tracemalloc.get_traced_memory()
+            output_bytes.append(peak - before)
+        end_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[str(voices)] = {
+            'input_callback_peak_bytes': summarize(input_bytes, scale=1),
+            'output_callbacks_peak_bytes': summarize(output_bytes, scale=1),
+            'net_growth_bytes': end_current - start_current,
+        }
+    return results
+
+def write_wav(path, channels, sample_width, rate, seconds):
+    rng = np.random.default_rng(2)
+    frames = int(rate * seconds)
+    signal = rng.uniform(-0.5, 0.5, frames * channels)
+    if sample_width == 1:
+        raw = ((signal * 127) + 128).astype(np.uint8).tobytes()
+    elif sample_width == 3:
+        ints = (signal * 8388607).astype('<i4')
+        raw = ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        raw = (signal * 32767).astype('<i2').tobytes()
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        wf.writeframes(raw)
+
+def time_decode(path, repeats):
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        decode_sound(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_decode(workdir, repeats, mp3_limit):
+    results = []
+    for channels, sample_width, rate in WAV_FORMATS:
+        for seconds in WAV_DURATIONS:
+            path = os.path.join(workdir, f"bench_{channels}ch_{sample_width * 8}bit_{rate}_{seconds}s.wav")
+            write_wav(path, channels, sample_width, rate, seconds)
+            elapsed = time_decode(path, repeats)
+            results.append({
+                'label': f"wav {channels}ch {sample_width * 8}bit {rate}Hz {seconds}s",
+                'format': 'wav',
+                'bytes': os.path.getsize(path),
+                'duration_s': seconds,
+                'decode_ms': elapsed * 1000,
+                'realtime_factor': seconds / elapsed if elapsed else None,
+            })
+
+    if os.path.isdir(SOUNDS_DIR):
+        mp3_files = sorted(f for f in os.listdir(SOUNDS_DIR) if f.lower().endswith('.mp3'))[:mp3_limit]
+        for file_name in mp3_files:
+            path = os.path.join(SOUNDS_DIR, file_name)
+            try:
+                elapsed = time_decode(path, repeats)
+            except Exception as e:
+                print(f"Skipping {file_name}: {e}", file=sys.stderr)
+                continue
+            duration = len(decode_sound(path)) / SAMPLE_RATE
+            results.append({
+                'label': f"mp3 {file_name}",
+                'format': 'mp3',
+                'bytes': os.path.getsize(path),
+                'duration_s': duration,
+                'decode_ms': elapsed * 1000,
+                'realtime_factor': duration / elapsed if elapsed else None,
+            })
+    return results
+
+def bench_trigger_latency(workdir, trials):
+    """Hotkey-to-first-sample latency with N voices sounding, on a simulated clock.
+
+    Each trial fires a trigger at a random point inside a block period. The
+    latency is the measured cache lookup and mix time, plus the wait for the
+    next mic callback and the cable route's output buffering.
+    """
+    path = os.path.join(workdir, 'bench_trigger.wav')
+    write_wav(path, 1, 2, SAMPLE_RATE, 1)
+    cache = DecodeCache()
+    cache.get(path, decode_sound)
+    budget = CHUNK / SAMPLE_RATE
+    rng = random.Random(3)
+    mic = synthetic_mic(trials + WARMUP_BLOCKS)
+
+    results = {}
+    for voices in VOICE_COUNTS:
+        engine, audio = make_engine()
+        background = synthetic_sound((trials + WARMUP_BLOCKS + 1) * CHUNK)
+        for _ in range(voices - 1):
+            engine.mixer.play(background, gain=0.2)
+        for in_data in mic[:WARMUP_BLOCKS]:
+            drive_block(engine, audio, in_data)
+        cable = engine.routes[0]
+
+        latencies, lookups, mixes = [], [], []
+        for in_data in mic[WARMUP_BLOCKS:]:
+            engine.mixer.stop('trigger')
+            started = time.perf_counter()
+            engine.mixer.play(cache.get(path, decode_sound), sound_id='trigger')
+            lookup = time.perf_counter() - started
+            wait = budget - rng.uniform(0, budget)
+            mix, _ = drive_block(engine, audio, in_data)
+            lookups.append(lookup)
+            mixes.append(mix)
+            latencies.append(lookup + wait + mix + cable.latency_frames / SAMPLE_RATE)
+        results[str(voices)] = {
+            'latency_ms': summarize(latencies),
+            'lookup_ms': summarize(lookups),
+            'mix_ms': summarize(mixes),
+            'output_buffer_ms': cable.latency_frames / SAMPLE_RATE * 1000,
+        }
+    return results
+
+def synthetic_titles(sounds, seed=5):
+    """Titles of one to four words for a library of the given size."""
+    rng = random.Random(seed)
+    vocabulary = ['air', 'horn', 'sad', 'trombone', 'bruh', 'sound', 'effect', 'laugh', 'drum', 'roll',
+                  'clap', 'boing', 'wow', 'alarm', 'siren', 'applause', 'crickets', 'vine', 'boom', 'fail',
+                  'привет', 'ドラム', 'café']
+    vocabulary += [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+                   for _ in range(2000)]
+    return [' '.join(rng.sample(vocabulary, rng.randint(1, 4))) for _ in range(sounds)]
+
+def bench_search(sounds=SEARCH_LIBRARY_SIZE):
+    """Index build time and per-query search time over a synthetic library."""
+    titles = synthetic_titles(sounds)
+    index = SearchIndex()
+    started = time.perf_counter()
+    for i, title in enumerate(titles):
+        index.add(f"{i}.mp3", title, title.replace(' ', '_'))
+    build = time.perf_counter() - started
+
+    timings, matches = [], {}
+    for query in SEARCH_QUERIES:
+        for _ in range(20):
+            started = time.perf_counter()
+            results = index.search(query)
+            timings.append(time.perf_counter() - started)
+        matches[query] = len(results)
+    return {'sounds': sounds, 'build_ms': build * 1000, 'query_ms': summarize(timings), 'matches': matches}
+
+def bench_sound_list(sounds=SEARCH_LIBRARY_SIZE):
+    """What the sound list's sort and filter proxy costs the UI thread over a synthetic library.
+
+    Each query is typed a character at a time and then cleared, as in the
+    search box; views are left out, so this is the proxy's own work.
+    """
+    rng = random.Random(9)
+    library = {f"{i}.mp3": {'title': title, 'favorite': rng.random() < 0.1, 'play_count': rng.randint(0, 50)}
+               for i, title in enumerate(synthetic_titles(sounds))}
+    model = SoundListModel({})
+    proxy = SoundSortProxy()
+    proxy.setSourceModel(model)
+    started = time.perf_counter()
+    model.set_sounds(library)
+    load = time.perf_counter() - started
+
+    keystrokes, clears = [], []
+    for query in SEARCH_QUERIES:
+        for length in range(1, len(query) + 1):
+            started = time.perf_counter()
+            proxy.set_filter_text(query[:length])
+            keystrokes.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        proxy.set_filter_text('')
+        clears.append(time.perf_counter() - started)
+
+    modes = []
+    for mode in SORT_MODES * 3:
+        started = time.perf_counter()
+        proxy.set_mode(mode)
+        modes.append(time.perf_counter() - started)
+
+    # A play moves the sound within Most Played; anywhere else it stays put
+    plays = []
+    for sound in rng.sample(list(library), 100):
+        library[sound]['play_count'] += 1
+        started = time.perf_counter()
+        model.update_sound(sound)
+        plays.append(time.perf_counter() - started)
+    return {
+        'sounds': sounds,
+        'load_ms': load * 1000,
+        'keystroke_ms': summarize(keystrokes),
+        'clear_ms': summarize(clears),
+        'sort_mode_ms': summarize(modes),
+        'play_count_ms': summarize(plays),
+    }
+
+def bench_control(workdir, round_trips):
+    """Round-trip time of control server commands over a loopback TCP connection.
+
+    The board has no devices open, so this is the socket, JSON and command
+    handling cost a macro pad or script sees, with the sound already cached.
+    """
+    path = os.path.join(workdir, 'bench_control.wav')
+    write_wav(path, 1, 2, SAMPLE_RATE, 1)
+    library = LibraryStore(os.path.join(workdir, 'bench_library.json'))
+    library.add_sound('bench', {'path': path, 'title': 'Bench'})
+    board = SoundBoard(library)
+    board.pcm_cache = PcmCache(os.path.join(workdir, 'bench_pcm'))
+    board.load_sound_data(path)
+    server = ControlServer(board, '127.0.0.1:0')
+    server.start()
+    client = ControlClient(server.address)
+    batch = [{'cmd': 'trigger', 'sound': 'bench'}] * CONTROL_BATCH
+
+    def time_requests(command):
+        for _ in range(WARMUP_BLOCKS):
+            client.request(command)
+        timings = []
+        for _ in range(round_trips):
+            started = time.perf_counter()
+            client.request(command)
+            timings.append(time.perf_counter() - started)
+            # Nothing is mixing, so drop the queued voices
+            board.mixer.commands.clear()
+        return summarize(timings)
+
+    try:
+        results = {
+            'ping_ms': time_requests({'cmd': 'ping'}),
+            'trigger_ms': time_requests({'cmd': 'trigger', 'sound': 'bench'}),
+            'batch_size': CONTROL_BATCH,
+            'batch_trigger_ms': time_requests(batch),
+            'target_ms': CONTROL_RTT_TARGET_MS,
+        }
+    finally:
+        client.close()
+        server.stop()
+        library.close()
+    results['within_target'] = results['trigger_ms']['p99'] <= CONTROL_RTT_TARGET_MS
+    return results
+
+def bench_quantized_trigger(workdir, trials):
+    """Trigger latency telemetry for starts held for the quantize_ms grid.
+
+    Quantized triggers go through the mixer's schedule rather than play(), so
+    this checks every one of them still records a latency sample.
+    """
+    path = os.path.join(workdir, 'bench_quantized.wav')
+    write_wav(path, 1, 2, SAMPLE_RATE, 1)
+    library = LibraryStore(os.path.join(workdir, 'bench_quantized.json'))
+    library.add_sound('bench', {'path': path, 'title': 'Bench'})
+    library.set_setting('quantize_ms', BENCH_QUANTIZE_MS)
+    board = SoundBoard(library)
+    board.pcm_cache = PcmCache(os.path.join(workdir, 'bench_pcm'))
+    board.load_sound_data(path)
+    audio = FakePyAudio()
+    board.engine = AudioEngine(audio, board.mixer, board.telemetry)
+    board.engine.open(0, [('cable', 1, CABLE_LATENCY_MS), ('speaker', 2, SPEAKER_LATENCY_MS)])
+    # Enough blocks for the grid wait plus the block the start lands in
+    blocks = -(-BENCH_QUANTIZE_MS * SAMPLE_RATE // (1000 * CHUNK)) + 2
+    mic = synthetic_mic(blocks + WARMUP_BLOCKS)
+    try:
+        for in_data in mic[:WARMUP_BLOCKS]:
+            drive_block(board.engine, audio, in_data)
+        for _ in range(trials):
+            board.trigger('bench', triggered_at=time.perf_counter())
+            for in_data in mic[WARMUP_BLOCKS:]:
+                drive_block(board.engine, audio, in_data)
+            board.mixer.stop('bench')
+    finally:
+        library.close()
+    latency = board.telemetry.snapshot()['trigger_latency_ms']
+    return {
+        'quantize_ms': BENCH_QUANTIZE_MS,
+        'triggers': trials,
+        'latency_samples': latency['count'],
+        'latency_ms': {'p50': latency['p50'], 'p99': latency['p99']},
+        'recorded': latency['count'] == trials,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def regression_metrics(results):
+    """Flatten the headline numbers into {name: value} for comparisons."""
+    metrics = {}
+    for voices, entry in results['callbacks'].items():
+        metrics[f"callback p99 ms ({voices} voices)"] = entry['input_callback_ms']['p99']
+    for voices, entry in results['allocations'].items():
+        metrics[f"callback peak bytes p50 ({voices} voices)"] = entry['input_callback_peak_bytes']['p50']
+    for voices, entry in results['trigger_latency'].items():
+        metrics[f"trigger latency p50 ms ({voices} voices)"] = entry['latency_ms']['p50']
+    for entry in results['decode']:
+        metrics[f"decode ms {entry['label']}"] = entry['decode_ms']
+    if 'search' in results:
+        metrics["search query p99 ms"] = results['search']['query_ms']['p99']
+    if 'sound_list' in results:
+        metrics["sound list keystroke p99 ms"] = results['sound_list']['keystroke_ms']['p99']
+        metrics["sound list clear p99 ms"] = results['sound_list']['clear_ms']['p99']
+    if 'control' in results:
+        metrics["control trigger p99 ms"] = results['control']['trigger_ms']['p99']
+        metrics["control batch trigger p99 ms"] = results['control']['batch_trigger_ms']['p99']
+    return metrics
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    current = regression_metrics(results)
+    previous = regression_metrics(baseline)
+    regressions = []
+    for name, value in current.items():
+        old = previous.get(name)
+        if old and value > old * threshold:
+            regressions.append({'metric': name, 'baseline': old, 'current': value, 'ratio': value / old})
+    return regressions
+
+def print_summary(results):
+    print(f"Block: {CHUNK} frames @ {SAMPLE_RATE} Hz ({CHUNK / SAMPLE_RATE * 1000:.1f} ms budget)")
+    for voices, entry in results['callbacks'].items():
+        timing = entry['input_callback_ms']
+        allocations = results['allocations'][voices]['input_callback_peak_bytes']
+        latency = results['trigger_latency'][voices]['latency_ms']
+        print(f"  {voices:>2} voices: callback p50 {timing['p50']:.3f} ms, p99 {timing['p99']:.3f} ms, "
+              f"peak alloc p50 {allocations['p50']:.0f} B, trigger latency p50 {latency['p50']:.1f} ms")
+    for entry in results['decode']:
+        print(f"  decode {entry['label']}: {entry['decode_ms']:.1f} ms")
+    search = results['search']
+    print(f"  search over {search['sounds']} sounds: p50 {search['query_ms']['p50']:.3f} ms, "
+          f"p99 {search['query_ms']['p99']:.3f} ms (index built in {search['build_ms']:.0f} ms)")
+    sound_list = results['sound_list']
+    print(f"  sound list of {sound_list['sounds']}: keystroke p99 {sound_list['keystroke_ms']['p99']:.2f} ms, "
+          f"clear p99 {sound_list['clear_ms']['p99']:.2f} ms, sort p99 {sound_list['sort_mode_ms']['p99']:.2f} ms, "
+          f"play count p99 {sound_list['play_count_ms']['p99']:.2f} ms (loaded in {sound_list['load_ms']:.0f} ms)")
+    control = results['control']
+    print(f"  control round trip: ping p50 {control['ping_ms']['p50']:.3f} ms, trigger p99 "
+          f"{control['trigger_ms']['p99']:.3f} ms (target {control['target_ms']:.1f} ms"
+          f"{'' if control['within_target'] else ', MISSED'}), batch of {control['batch_size']} p99 "
+          f"{control['batch_trigger_ms']['p99']:.3f} ms")
+    quantized = results['quantized_trigger']
+    print(f"  quantized trigger ({quantized['quantize_ms']} ms grid): {quantized['latency_samples']} of "
+          f"{quantized['triggers']} latency samples recorded{'' if quantized['recorded'] else ', MISSING'}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sound board's mixing and playback pipeline.")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--compare', help="earlier results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="ratio over the baseline that counts as a regression")
+    parser.add_argument('--blocks', type=int, default=2000, help="callbacks to time per voice count")
+    parser.add_argument('--repeats', type=int, default=3, help="decode repetitions per file (best is kept)")
+    parser.add_argument('--mp3-limit', type=int, default=5, help="MP3 files from the sounds folder to decode")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {
+            'meta': {
+                'timestamp': time.time(),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'chunk': CHUNK,
+                'rate': SAMPLE_RATE,
+                'blocks': args.blocks,
+            },
+            'callbacks': bench_callbacks(args.blocks),
+            'allocations': bench_allocations(min(args.blocks, 500)),
+            'decode': bench_decode(workdir, args.repeats, args.mp3_limit),
+            'trigger_latency': bench_trigger_latency(workdir, min(args.blocks, 500)),
+            'search': bench_search(),
+            'sound_list': bench_sound_list(),
+            'control': bench_control(workdir, min(args.blocks, 1000)),
+            'quantized_trigger': bench_quantized_trigger(workdir, min(args.blocks, 100)),
+        }
+
+    exit_code = 0 if results['quantized_trigger']['recorded'] else 1
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        results['regressions'] = compare(results, baseline, args.threshold)
+        for regression in results['regressions']:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']:.3f} -> "
+                  f"{regression['current']:.3f} ({regression['ratio']:.2f}x)")
+        if results['regressions']:
+            exit_code = 1
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
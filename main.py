@@ -1,13 +1,23 @@
 import os
 import sys
-from PyQt5.QtWidgets import QApplication
-from SoundPlayer import SoundPlayer
-from PyQt5.QtGui import QColor, QPalette, QIcon
-from PyQt5.QtCore import Qt
+import multiprocessing
+from StartupProfiler import startup
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    # main.py --headless [address]: no Qt at all; the engine runs behind the control server
+    if sys.argv[1:2] == ['--headless']:
+        from Headless import run
+        sys.exit(run(sys.argv[2] if len(sys.argv) > 2 else None))
+    # Imported here so helper processes, which re-import this module, don't load the app
+    with startup.phase('imports'):
+        from PyQt5.QtWidgets import QApplication
+        from SoundPlayer import SoundPlayer
+        from PyQt5.QtGui import QColor, QPalette, QIcon
+        from PyQt5.QtCore import Qt
+
     app = QApplication(sys.argv)
     
     dark_palette = QPalette()
@@ -29,6 +39,7 @@ if __name__ == '__main__':
     icon_path = os.path.join(os.path.dirname(__file__), 'virt_soundboard.png')
     app.setWindowIcon(QIcon(icon_path))
     
-    player = SoundPlayer()
-    player.show()
+    with startup.phase('window'):
+        player = SoundPlayer()
+        player.show()
     sys.exit(app.exec_())
\ No newline at end of file
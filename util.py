@@ -1,3 +1,4 @@
+import os
 import contextlib
 
 @contextlib.contextmanager
@@ -6,5 +7,68 @@ def silence_pygame():
         yield
         
 CHUNK = 1024
+SAMPLE_RATE = 44100
+ENGINE_CHANNELS = 1
+ENGINE_SAMPLE_FORMAT = "int16"
+ENGINE_FALLBACK_RATES = (48000, 44100)
 SOUNDS_DIR = "sounds"
-CONFIG_FILE = "config.json"
\ No newline at end of file
+SOUND_EXTENSIONS = (".wav", ".mp3")
+CONFIG_FILE = "config.json"
+DECODE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PREWARM_WORKERS = 2
+PREWARM_TOP_PLAYED = 10
+IMPORT_WORKERS = os.cpu_count() or 1
+PCM_CACHE_DIR = "pcm_cache"
+PCM_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+STREAM_MIN_SECONDS = 20
+STREAM_MIN_BYTES = 4 * 1024 * 1024
+STREAM_BLOCK_FRAMES = 8192
+STREAM_RING_FRAMES = 32768
+CABLE_LATENCY_MS = 20
+SPEAKER_LATENCY_MS = 50
+ADAPTIVE_LATENCY = True
+LATENCY_MIN_MS = 10
+LATENCY_MAX_MS = 200
+LATENCY_STEP_UP_MS = 20
+LATENCY_STEP_DOWN_MS = 5
+LATENCY_CHECK_S = 1.0
+LATENCY_QUIET_S = 30.0
+DEVICE_POLL_MS = 500
+DEVICE_STALL_MS = 1500
+DEVICE_RESCAN_MS = 5000
+CONTROL_ENABLED = False
+CONTROL_ADDRESS = "127.0.0.1:47800"
+CONTROL_RTT_TARGET_MS = 1.0
+ENGINE_PROCESS = False
+ENGINE_STATUS_MS = 100
+ENGINE_REPLY_TIMEOUT_S = 1.0
+ENGINE_OPEN_TIMEOUT_S = 15.0
+RECORDINGS_DIR = "recordings"
+RECORD_FORMAT = "wav"
+RECORD_RING_S = 4.0
+RECORD_FLUSH_S = 0.5
+RECORD_ROTATE_S = 1800
+TELEMETRY_BINS_PER_BUDGET = 20
+TELEMETRY_MAX_BUDGETS = 4
+TELEMETRY_LATENCY_HISTORY = 256
+TELEMETRY_PANEL_MS = 500
+TELEMETRY_INTERVAL_S = 5
+TELEMETRY_FILE = "telemetry.json"
+MAX_VOICES = 16
+VOICE_STEAL_POLICY = "oldest"
+RETRIGGER_POLICY = "restart"
+QUANTIZE_MS = 0
+SCHEDULE_MAX_S = 24 * 60 * 60
+HOTKEY_DEBOUNCE_MS = 150
+LOUDNESS_TARGET_LUFS = -16.0
+LOUDNESS_PEAK_CEILING_DB = -1.0
+LOUDNESS_MAX_GAIN_DB = 12.0
+LIMITER_CEILING_DB = -0.3
+LIMITER_KNEE_DB = 6.0
+LIMITER_RELEASE_MS = 80
+LIBRARY_VERSION = 2
+LIBRARY_FLUSH_DELAY_S = 1.0
+LIBRARY_MAX_FLUSH_DELAY_S = 5.0
+SCAN_DEBOUNCE_MS = 300
+SEARCH_DEBOUNCE_MS = 120
+SEARCH_MIN_SCORE = 0.5